@@ -15,8 +15,9 @@ except ImportError:
 
 # Configure the Streamlit Web Application
 import streamlit as st
-from frontend.state import init_state
 from frontend.auth import require_login_ui, inject_global_css, logout
+from server.stores.lazy import start_warm_up
+import config
 
 if __name__ == "__main__":
 
@@ -29,14 +30,7 @@ if __name__ == "__main__":
     )
 
     inject_global_css()
-<<<<<<< HEAD
     st.logo("frontend/images/MindSpark_Logo.png")
-=======
-    st.logo("frontend/images/MindSpark_logo.png")
->>>>>>> 0230af5bf3f1839a79ea642bd33ff50795920dd7
-
-    if not hasattr(st.session_state, "initialized"):
-        init_state()
 
     # Auth gate
     if "user" not in st.session_state:
@@ -48,6 +42,12 @@ if __name__ == "__main__":
         placeholder_nav.run()
         require_login_ui()
     else:
+        # 登录后再初始化模型和索引，登录页无需加载
+        from frontend.state import init_state
+
+        if not hasattr(st.session_state, "initialized"):
+            init_state()
+
         with st.sidebar:
             st.markdown(f"**User:** {st.session_state['user']['email']}")
             if st.button("Log out"):
@@ -74,3 +74,12 @@ if __name__ == "__main__":
 
         pg = st.navigation(pages, position="sidebar")
         pg.run()
+
+    # 页面渲染后在后台预热存储，首次查询无需等待
+    start_warm_up()
+
+    # 在本地端口提供Prometheus指标，见server/metrics.py
+    if config.METRICS_ENABLED:
+        from server.metrics import start_metrics_server
+
+        start_metrics_server()
@@ -0,0 +1,75 @@
+# Compare BM25 index size, query cost and retrieval quality with and without ChineseAnalyzer
+# Usage: python -m benchmarks.bench_bm25_analyzer [--repeat 1000]
+#
+# The raw analyzer keeps every jieba token, as the BM25 path did before stopword,
+# punctuation, width and case handling were added.
+import argparse
+import json
+import os
+import time
+
+from llama_index.core.schema import QueryBundle, TextNode
+from server.retriever import SimpleBM25Retriever
+from server.tokenizer import BM25_ANALYZER, ChineseAnalyzer, init_jieba
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "bm25_qa_zh.json")
+
+RAW_ANALYZER = ChineseAnalyzer(
+    stopwords=frozenset(),
+    lowercase=False,
+    normalize_width=False,
+    strip_punctuation=False,
+)
+
+
+def evaluate(name, analyzer, nodes, queries, top_k, repeat):
+    start = time.perf_counter()
+    retriever = SimpleBM25Retriever(nodes, similarity_top_k=top_k, analyzer=analyzer)
+    build_time = time.perf_counter() - start
+
+    hits_at_1 = hits_at_k = 0
+    reciprocal_ranks = 0.0
+    for item in queries:
+        results = retriever.retrieve(QueryBundle(item["query"]))
+        ids = [result.node.node_id for result in results]
+        expected = nodes[item["relevant"]].node_id
+        if ids[:1] == [expected]:
+            hits_at_1 += 1
+        if expected in ids:
+            hits_at_k += 1
+            reciprocal_ranks += 1 / (ids.index(expected) + 1)
+
+    bundles = [QueryBundle(item["query"]) for item in queries]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for bundle in bundles:
+            retriever.retrieve(bundle)
+    query_time = (time.perf_counter() - start) / (repeat * len(bundles))
+
+    n = len(queries)
+    print(
+        f"{name:>8}: vocab {len(retriever.bm25.vocab_dict):5d}  "
+        f"postings {retriever.bm25.scores['data'].size:6d}  "
+        f"build {build_time * 1000:7.1f} ms  query {query_time * 1e6:7.1f} us  "
+        f"recall@1 {hits_at_1 / n:.2f}  recall@{top_k} {hits_at_k / n:.2f}  "
+        f"MRR {reciprocal_ranks / n:.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the BM25 analyzer")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(FIXTURE, encoding="utf-8") as f:
+        fixture = json.load(f)
+    nodes = [TextNode(text=text) for text in fixture["documents"]]
+    init_jieba()
+
+    evaluate("raw", RAW_ANALYZER, nodes, fixture["queries"], args.top_k, args.repeat)
+    evaluate("analyzed", BM25_ANALYZER, nodes, fixture["queries"], args.top_k, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Benchmark ChineseTextSplitter.split_text on a synthetic Chinese corpus
+# Usage: python -m benchmarks.bench_chinese_text_splitter [--size-mb 10] [--legacy]
+#
+# --legacy also runs the previous implementation (regexes compiled per call, list.index
+# based replacement) and checks that both produce the same segmentation.
+import argparse
+import random
+import re
+import time
+from typing import List
+
+from server.splitters.chinese_text_splitter import ChineseTextSplitter
+
+SENTENCES = [
+    "前 10 个月，一般贸易进出口 19.5 万亿元，增长 25.1%，比整体进出口增速高出 2.9 个百分点。",
+    "全球疫情起伏反复，经济复苏分化加剧，大宗商品价格上涨、能源紧缺、运力紧张及发达经济体政策调整外溢等风险交织叠加！",
+    "世界银行今年 10 月发布《大宗商品市场展望》指出，能源价格在 2021 年大涨逾 80%，并且仍将在 2022 年小幅上涨？",
+    "他说：“产业链供应链面临挑战。”",
+    "美欧等加快出台制造业回迁计划；加速产业链供应链本土布局……跨国公司调整产业链供应链",
+    "服务 进出口总额 37834.3 亿元  增长 11.6%  其中服务出口 17820.9 亿元  增长 27.3%  进口 20013.4 亿元  增长 0.5%  进口增速实现了疫情以来的首次转正",
+    "This is an English sentence. It has several parts, separated by commas, and ends here.",
+]
+
+
+def make_corpus(size_mb: float, seed: int = 42) -> str:
+    # Sentences repeat on purpose, the old implementation mishandled duplicates
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    parts: List[str] = []
+    size = 0
+    while size < target:
+        paragraph = "".join(rng.choice(SENTENCES) for _ in range(rng.randint(3, 30)))
+        parts.append(paragraph + "\n\n")
+        size += len(paragraph.encode("utf-8")) + 2
+    return "".join(parts)
+
+
+def legacy_split_text(text: str, sentence_size: int) -> List[str]:
+    text = re.sub(r'([;；.!?。！？\?])([^”’])', r"\1\n\2", text)
+    text = re.sub(r'(\.{6})([^"’”」』])', r"\1\n\2", text)
+    text = re.sub(r'(\…{2})([^"’”」』])', r"\1\n\2", text)
+    text = re.sub(r'([;；!?。！？\?]["’”」』]{0,2})([^;；!?，。！？\?])', r"\1\n\2", text)
+    text = text.rstrip()
+    ls = [i for i in text.split("\n") if i]
+    for ele in ls:
+        if len(ele) > sentence_size:
+            ele1 = re.sub(r'([,，.]["’”」』]{0,2})([^,，.])', r"\1\n\2", ele)
+            ele1_ls = ele1.split("\n")
+            for ele_ele1 in ele1_ls:
+                if len(ele_ele1) > sentence_size:
+                    ele_ele2 = re.sub(r'([\n]{1,}| {2,}["’”」』]{0,2})([^\s])', r"\1\n\2", ele_ele1)
+                    ele2_ls = ele_ele2.split("\n")
+                    for ele_ele2 in ele2_ls:
+                        if len(ele_ele2) > sentence_size:
+                            ele_ele3 = re.sub('( ["’”」』]{0,2})([^ ])', r"\1\n\2", ele_ele2)
+                            ele2_id = ele2_ls.index(ele_ele2)
+                            ele2_ls = ele2_ls[:ele2_id] + [i for i in ele_ele3.split("\n") if i] + ele2_ls[ele2_id + 1:]
+                    ele_id = ele1_ls.index(ele_ele1)
+                    ele1_ls = ele1_ls[:ele_id] + [i for i in ele2_ls if i] + ele1_ls[ele_id + 1:]
+            id = ls.index(ele)
+            ls = ls[:id] + [i for i in ele1_ls if i] + ls[id + 1:]
+    return ls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ChineseTextSplitter")
+    parser.add_argument("--size-mb", type=float, default=10)
+    parser.add_argument("--sentence-size", type=int, default=40)
+    parser.add_argument("--legacy", action="store_true", help="also time the old implementation")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.size_mb)
+    print(f"Corpus: {len(corpus.encode('utf-8')) / 1024 / 1024:.1f} MB, {len(corpus)} chars")
+
+    splitter = ChineseTextSplitter(sentence_size=args.sentence_size)
+    start = time.perf_counter()
+    chunks = splitter.split_text(corpus)
+    elapsed = time.perf_counter() - start
+    print(f"split_text: {elapsed:.2f}s, {len(chunks)} chunks, {len(corpus) / elapsed / 1e6:.2f} M chars/s")
+
+    if args.legacy:
+        start = time.perf_counter()
+        legacy_chunks = legacy_split_text(corpus, args.sentence_size)
+        legacy_elapsed = time.perf_counter() - start
+        print(f"legacy split_text: {legacy_elapsed:.2f}s, {len(legacy_chunks)} chunks, speed-up {legacy_elapsed / elapsed:.1f}x")
+        # The legacy code is only correct without repeated sentences, compare on those
+        sample = "".join(SENTENCES)
+        same = splitter.split_text(sample) == legacy_split_text(sample, args.sentence_size)
+        print(f"Same segmentation on unique sentences: {same}")
+
+
+if __name__ == "__main__":
+    main()
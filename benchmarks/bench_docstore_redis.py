@@ -0,0 +1,71 @@
+# Compare Redis round trips and time of RedisDocumentStore and PipelinedRedisDocumentStore
+# Usage: python -m benchmarks.bench_docstore_redis [--docs 200] [--batch-size 1000]
+#
+# Needs a Redis server at REDIS_URI. The writes follow an ingestion: an upsert
+# hash check per document, the documents with their hashes, then one add_documents call per
+# node as VectorStoreIndex does with store_nodes_override. Both stores use their own
+# namespace, which is deleted afterwards.
+import argparse
+import time
+
+from llama_index.core import Document
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.storage.docstore.redis import RedisDocumentStore
+from llama_index.storage.kvstore.redis import RedisKVStore
+
+import config
+from server.stores.doc_store import PipelinedRedisDocumentStore, RoundTripCounter, batch_writes
+
+TEXT = "全球疫情起伏反复，经济复苏分化加剧，大宗商品价格上涨、能源紧缺、运力紧张。" * 40
+
+
+def ingest(docstore, documents, nodes):
+    if hasattr(docstore, "get_document_hashes"):
+        docstore.get_document_hashes([doc.doc_id for doc in documents])
+    else:
+        for doc in documents:
+            docstore.get_document_hash(doc.doc_id)
+    docstore.set_document_hashes({doc.doc_id: doc.hash for doc in documents})
+    docstore.add_documents(documents)
+    with batch_writes(docstore):
+        for node in nodes:
+            docstore.add_documents([node], allow_update=True)
+
+
+def run(name, docstore, counter, documents, nodes):
+    start = time.perf_counter()
+    ingest(docstore, documents, nodes)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<30} {counter.round_trips:>8} round trips  {elapsed:8.3f}s")
+    for collection in (
+        docstore._node_collection,
+        docstore._ref_doc_collection,
+        docstore._metadata_collection,
+    ):
+        counter.delete(collection)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=config.DOCSTORE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    documents = [Document(text=f"文档 {i}。" + TEXT, id_=f"bench-{i}") for i in range(args.docs)]
+    nodes = SentenceSplitter(chunk_size=256, chunk_overlap=0).get_nodes_from_documents(documents)
+    print(f"{len(documents)} documents, {len(nodes)} nodes")
+
+    kvstore = RedisKVStore(redis_uri=config.REDIS_URI)
+    counter = RoundTripCounter(kvstore._redis_client)
+    kvstore._redis_client = counter
+    run("RedisDocumentStore", RedisDocumentStore(kvstore, namespace="bench_legacy"), counter, documents, nodes)
+
+    kvstore = RedisKVStore(redis_uri=config.REDIS_URI)
+    docstore = PipelinedRedisDocumentStore(
+        kvstore, namespace="bench_pipelined", batch_size=args.batch_size
+    )
+    run("PipelinedRedisDocumentStore", docstore, docstore._redis_client, documents, nodes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Micro-benchmark of fuse_results against QueryFusionRetriever's fusion on large candidate pools
+# Usage: python -m benchmarks.bench_fusion [--candidates 100] [--top-k 50] [--rounds 200]
+# Also checks that a node found only by BM25, as its top hit, is kept by every fusion mode.
+import argparse
+import copy
+import random
+import time
+
+from llama_index.core.retrievers import QueryFusionRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from server.retriever import FUSION_MODES, fuse_results
+
+WEIGHTS = [0.6, 0.4]
+
+
+def make_results(candidates: int, seed: int = 42):
+    rng = random.Random(seed)
+    pool = [TextNode(text=f"node {i}", id_=str(i)) for i in range(candidates * 2)]
+    return [
+        [NodeWithScore(node=node, score=rng.random() * scale) for node in rng.sample(pool, candidates)]
+        for scale in (1.0, 20.0)  # cosine similarity and BM25 ranges
+    ]
+
+
+def legacy_fuse(results, mode, top_k):
+    # QueryFusionRetriever's fusion without retrievers, the state it reads is set directly
+    retriever = QueryFusionRetriever.__new__(QueryFusionRetriever)
+    object.__setattr__(retriever, "_retriever_weights", WEIGHTS)
+    object.__setattr__(retriever, "num_queries", 1)
+    if mode == FUSION_MODES.SIMPLE:
+        return retriever._simple_fusion(results)[:top_k]
+    if mode == FUSION_MODES.RECIPROCAL_RANK:
+        return retriever._reciprocal_rerank_fusion(results)[:top_k]
+    dist_based = mode == FUSION_MODES.DIST_BASED_SCORE
+    return retriever._relative_score_fusion(results, dist_based=dist_based)[:top_k]
+
+
+def check_bm25_only_hit(top_k: int):
+    """Fuse top_k vector hits with a BM25 top hit the vector search missed, it must be kept."""
+    vector = [
+        NodeWithScore(node=TextNode(text=f"vector {i}", id_=f"v{i}"), score=0.9 - 0.05 * i)
+        for i in range(top_k)
+    ]
+    bm25_hit = TextNode(text="bm25 only", id_="bm25")
+    bm25 = [NodeWithScore(node=bm25_hit, score=12.0)] + [
+        NodeWithScore(node=n.node, score=8.0 - i) for i, n in enumerate(vector[1:4])
+    ]
+    failed = [
+        mode.value
+        for mode in FUSION_MODES
+        if bm25_hit.node_id
+        not in [n.node.node_id for n in fuse_results([vector, bm25], WEIGHTS, mode, top_k)]
+    ]
+    if failed:
+        raise AssertionError(f"BM25-only top hit dropped by fusion: {', '.join(failed)}")
+    print(f"BM25-only top hit kept in the top {top_k} by every fusion mode")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hybrid retrieval score fusion")
+    parser.add_argument("--candidates", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    check_bm25_only_hit(min(args.top_k, 10))
+    results = make_results(args.candidates)
+    for mode in FUSION_MODES:
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            fused = fuse_results(results, WEIGHTS, mode, args.top_k)
+        elapsed = (time.perf_counter() - start) / args.rounds
+        line = f"{mode.value:>18}: {elapsed * 1e3:.3f} ms"
+        # It rescales the scores in place, so every round gets its own copy, made untimed
+        copies = [
+            {("query", i): copy.deepcopy(nodes) for i, nodes in enumerate(results)}
+            for _ in range(args.rounds)
+        ]
+        start = time.perf_counter()
+        for legacy_results in copies:
+            legacy = legacy_fuse(legacy_results, mode, args.top_k)
+        legacy_elapsed = (time.perf_counter() - start) / args.rounds
+        same = [round(n.score, 9) for n in fused] == [round(n.score, 9) for n in legacy]
+        line += f", QueryFusionRetriever {legacy_elapsed * 1e3:.3f} ms, same scores: {same}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# Benchmark AdvancedIngestionPipeline throughput for each text splitter, with and without titles
+# Usage: python -m benchmarks.bench_ingestion [--docs 5] [--embed-model hash] [--splitters sentence,spacy]
+#
+# The fixture corpus is written to a temporary directory from a fixed seed: --docs files each
+# of PDF, DOCX, TXT and HTML with chapter titles and Chinese paragraphs, or --fixtures reads
+# your own files. Files are read with SimpleDirectoryReader as IndexManager.load_files does,
+# so HTML is ingested as text. The pipeline writes to in-memory stores and a fresh ingestion
+# cache, never to the application's.
+#
+# Each splitter type of server/text_splitter.py runs with and without ChineseTitleExtractor,
+# in its own process so that the peak RSS is its own. Reported: documents and nodes per
+# second over reading and ingestion, the share of ingestion time spent in the splitter and
+# the embedding model, and the peak RSS including the model. --embed-model hash (default)
+# uses the deterministic HashEmbedding of bench_retrieval, or give a model of
+# EMBEDDING_MODEL_PATH, loaded from localmodels/ when present, like the application does.
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from typing import List, Tuple
+from xml.sax.saxutils import escape
+
+import config
+from benchmarks.bench_chinese_text_splitter import SENTENCES
+
+SPLITTER_TYPES = ["sentence", "spacy", "chinese", "chinese_recursive"]
+TITLES = ["总体情况", "货物贸易", "服务贸易", "主要市场", "产业链供应链", "风险与展望", "政策建议"]
+NUMERALS = "一二三四五六七八九十"
+
+
+def make_document(rng: random.Random, size_kb: int) -> List[Tuple[str, List[str]]]:
+    """Sections of (title, paragraphs), about size_kb of UTF-8 text."""
+    sections = []
+    size = 0
+    while size < size_kb * 1024:
+        number = len(sections)
+        title = f"{NUMERALS[number % 10]}、{rng.choice(TITLES)}"
+        paragraphs = [
+            "".join(rng.choice(SENTENCES) for _ in range(rng.randint(2, 8)))
+            for _ in range(rng.randint(2, 6))
+        ]
+        sections.append((title, paragraphs))
+        size += sum(len(p.encode("utf-8")) for p in paragraphs)
+    return sections
+
+
+def write_txt(path, sections):
+    with open(path, "w", encoding="utf-8") as f:
+        for title, paragraphs in sections:
+            f.write(title + "\n\n" + "\n\n".join(paragraphs) + "\n\n")
+
+
+def write_html(path, sections):
+    body = "".join(
+        f"<h2>{escape(title)}</h2>" + "".join(f"<p>{escape(p)}</p>" for p in paragraphs)
+        for title, paragraphs in sections
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'<!DOCTYPE html><html lang="zh"><head><meta charset="utf-8"></head><body>{body}</body></html>')
+
+
+def write_docx(path, sections):
+    # The three parts docx2txt needs, paragraphs without styles
+    paragraphs = [text for title, texts in sections for text in [title, *texts]]
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+        + "".join(f"<w:p><w:r><w:t>{escape(p)}</w:t></w:r></w:p>" for p in paragraphs)
+        + "</w:body></w:document>"
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr(
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            "</Types>",
+        )
+        docx.writestr(
+            "_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+            "</Relationships>",
+        )
+        docx.writestr("word/document.xml", document)
+
+
+def write_pdf(path, sections, line_chars=40, page_lines=50):
+    # Text in the Identity-H encoding of a non-embedded CJK font, with a ToUnicode map so
+    # that readers extract it; it is not meant to be displayed
+    lines = []
+    for title, paragraphs in sections:
+        lines.append(title)
+        for paragraph in paragraphs:
+            lines += [paragraph[i : i + line_chars] for i in range(0, len(paragraph), line_chars)]
+    pages = [lines[i : i + page_lines] for i in range(0, len(lines), page_lines)]
+
+    # One range per run of consecutive codes, a range may not cross a high byte
+    ranges = []
+    for code in sorted({ord(c) for line in lines for c in line}):
+        if ranges and code == ranges[-1][1] + 1 and code >> 8 == ranges[-1][0] >> 8:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    to_unicode = (
+        "/CIDInit /ProcSet findresource begin 12 dict begin begincmap "
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def "
+        "/CMapName /Adobe-Identity-UCS def /CMapType 2 def "
+        "1 begincodespacerange <0000> <FFFF> endcodespacerange\n"
+    )
+    for i in range(0, len(ranges), 100):
+        chunk = ranges[i : i + 100]
+        to_unicode += f"{len(chunk)} beginbfrange\n"
+        to_unicode += "".join(f"<{low:04X}> <{high:04X}> <{low:04X}>\n" for low, high in chunk)
+        to_unicode += "endbfrange\n"
+    to_unicode += "endcmap CMapName currentdict /CMap defineresource pop end end"
+
+    def stream(data: str) -> str:
+        return f"<< /Length {len(data.encode('latin-1'))} >>\nstream\n{data}\nendstream"
+
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "",  # pages, below
+        "<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light /Encoding /Identity-H "
+        "/DescendantFonts [4 0 R] /ToUnicode 5 0 R >>",
+        "<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light "
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+        "/FontDescriptor 6 0 R >>",
+        stream(to_unicode),
+        "<< /Type /FontDescriptor /FontName /STSong-Light /Flags 4 /FontBBox [0 -200 1000 900] "
+        "/ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 880 /StemV 93 >>",
+    ]
+    page_ids = []
+    for page in pages:
+        content = "BT /F1 11 Tf 14 TL 40 800 Td " + " ".join(
+            f"<{line.encode('utf-16-be').hex().upper()}> Tj T*" for line in page
+        ) + " ET"
+        objects.append(stream(content))
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(pages)} >>"
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    data += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    ).encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+WRITERS = {".pdf": write_pdf, ".docx": write_docx, ".txt": write_txt, ".html": write_html}
+
+
+def write_fixtures(directory: str, docs: int, size_kb: int, seed: int = 42) -> List[str]:
+    rng = random.Random(seed)
+    paths = []
+    for i in range(docs):
+        for extension, write in WRITERS.items():
+            path = os.path.join(directory, f"doc{i:03d}{extension}")
+            write(path, make_document(rng, size_kb))
+            paths.append(path)
+    return paths
+
+
+def create_embed_model(name: str):
+    if name == "hash":
+        from benchmarks.bench_retrieval import HashEmbedding
+
+        return HashEmbedding(dim=512)
+    from server.models.embedding import create_embedding_model
+
+    return create_embedding_model(name)
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def run(files: List[str], splitter_type: str, title_enhance: bool, args) -> dict:
+    """One configuration, in the process started by main."""
+    from llama_index.core import SimpleDirectoryReader, StorageContext
+    from llama_index.core.ingestion import IngestionCache
+    from llama_index.core.schema import TransformComponent
+    from server.ingestion import AdvancedIngestionPipeline
+    from server.text_splitter import create_text_splitter
+    from server.tokenizer import init_jieba
+
+    class TimedTransform(TransformComponent):
+        transform: TransformComponent
+        seconds: float = 0.0
+
+        def to_dict(self, **kwargs):
+            # Cached under the same key as the wrapped step
+            return self.transform.to_dict(**kwargs)
+
+        def __call__(self, nodes, **kwargs):
+            start = time.perf_counter()
+            nodes = self.transform(nodes, **kwargs)
+            self.seconds += time.perf_counter() - start
+            return nodes
+
+    # Loaded before timing, as in the running application
+    embed_model = create_embed_model(args.embed_model)
+    text_splitter = create_text_splitter(args.chunk_size, args.chunk_overlap, splitter_type)
+    init_jieba()
+
+    start = time.perf_counter()
+    documents = SimpleDirectoryReader(input_files=files).load_data()
+    read_seconds = time.perf_counter() - start
+
+    pipeline = AdvancedIngestionPipeline(
+        text_splitter=text_splitter,
+        embed_model=embed_model,
+        title_enhance=title_enhance,
+        storage_context=StorageContext.from_defaults(),
+        cache=IngestionCache(),
+    )
+    pipeline.transformations = [TimedTransform(transform=t) for t in pipeline.transformations]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        nodes = pipeline.run(documents=documents)
+    ingest_seconds = time.perf_counter() - start
+
+    splitter_seconds, embed_seconds = (t.seconds for t in pipeline.transformations[:2])
+    return {
+        "documents": len(documents),
+        "nodes": len(nodes),
+        "read_seconds": read_seconds,
+        "ingest_seconds": ingest_seconds,
+        "splitter_share": splitter_seconds / ingest_seconds,
+        "embed_share": embed_seconds / ingest_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion throughput")
+    parser.add_argument("--docs", type=int, default=5, help="files of each type")
+    parser.add_argument("--size-kb", type=int, default=50, help="text per file")
+    parser.add_argument("--fixtures", help="ingest the files of this directory instead")
+    parser.add_argument("--splitters", default=",".join(SPLITTER_TYPES))
+    parser.add_argument(
+        "--embed-model", default="hash", choices=["hash", *config.EMBEDDING_MODEL_PATH]
+    )
+    parser.add_argument("--chunk-size", type=int, default=config.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=config.DEFAULT_CHUNK_OVERLAP)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--run", help=argparse.SUPPRESS)  # splitter:title, in the child process
+    args = parser.parse_args()
+
+    if args.run:
+        splitter_type, title = args.run.split(":")
+        files = sorted(
+            os.path.join(args.fixtures, name) for name in os.listdir(args.fixtures)
+        )
+        print(json.dumps(run(files, splitter_type, title == "title", args)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.fixtures is None:
+            write_fixtures(directory, args.docs, args.size_kb, args.seed)
+            args.fixtures = directory
+        files = os.listdir(args.fixtures)
+        size_mb = sum(os.path.getsize(os.path.join(args.fixtures, f)) for f in files) / 2**20
+        print(f"{len(files)} files, {size_mb:.1f} MB, embedding model {args.embed_model}")
+
+        for splitter_type in args.splitters.split(","):
+            for title in ("title", "no-title"):
+                name = f"{splitter_type} {title}"
+                command = [sys.executable, "-m", "benchmarks.bench_ingestion", *sys.argv[1:]]
+                command += ["--fixtures", args.fixtures, "--run", f"{splitter_type}:{title}"]
+                process = subprocess.run(command, capture_output=True, text=True)
+                if process.returncode != 0:
+                    error = process.stderr.strip().splitlines()[-1:] or ["no output"]
+                    print(f"{name:<28} failed: {error[0]}")
+                    continue
+                result = json.loads(process.stdout.strip().splitlines()[-1])
+                seconds = result["read_seconds"] + result["ingest_seconds"]
+                print(
+                    f"{name:<28} {result['documents'] / seconds:8.1f} docs/s  "
+                    f"{result['nodes'] / seconds:8.1f} nodes/s  ({result['nodes']} nodes)  "
+                    f"read {result['read_seconds']:6.2f} s  ingest {result['ingest_seconds']:6.2f} s  "
+                    f"splitter {result['splitter_share']:4.0%}  embedding {result['embed_share']:4.0%}  "
+                    f"peak rss {result['peak_rss_mb']:7.1f} MB"
+                )
+
+
+if __name__ == "__main__":
+    main()
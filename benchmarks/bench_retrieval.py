@@ -0,0 +1,323 @@
+# Benchmark retrieval on a synthetic or loaded corpus: BM25, vector stores, hybrid and fusion
+# Usage: python -m benchmarks.bench_retrieval [--chunks 10000] [--lang zh] [--backends simple,chroma]
+#
+# Runs offline: the corpus is generated from a fixed seed (or loaded with --corpus, a .jsonl
+# file with a "text" per line or a .txt file with one chunk per line), and HashEmbedding
+# stands in for the embedding model. It hashes character bigrams into a fixed-size vector,
+# so texts sharing words are close and the same corpus always gets the same vectors, and
+# results are comparable across commits. Each query is a span of one chunk, hit@k is the
+# share of queries whose chunk is retrieved.
+#
+# Reports build time and the RSS it added, p50/p95/p99 query latency and the peak RSS of:
+# SimpleBM25Retriever, VectorIndexRetriever for each backend of --backends (simple, chroma,
+# es, lancedb, see server/stores/vector_store.py; unavailable ones are skipped),
+# SimpleHybridRetriever and SimpleFusionRetriever for each FUSION_MODES value. The hybrid
+# and fusion retrievers use the first backend. Chroma, ES and LanceDB write to a
+# "mindspark_bench" collection, index or table which is cleared before each run.
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import time
+from typing import List
+
+import numpy as np
+from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.retrievers import VectorIndexRetriever
+from llama_index.core.schema import QueryBundle, TextNode
+from llama_index.core.storage.kvstore import SimpleKVStore
+
+from server.retriever import (
+    FUSION_MODES,
+    SimpleBM25Retriever,
+    SimpleFusionRetriever,
+    SimpleHybridRetriever,
+)
+from server.stores.tag_store import TagStore
+from server.stores.vector_store import create_vector_store
+from server.tokenizer import BM25TokenExtractor, init_jieba
+
+BENCH_NAME = "mindspark_bench"
+
+ZH_CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面"
+    "而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把"
+    "性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质"
+    "气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活"
+    "设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则"
+    "任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美"
+)
+EN_SYLLABLES = [
+    "ka", "lo", "mi", "ter", "an", "so", "ri", "ven", "du", "pel", "tra", "on", "is",
+    "gra", "mor", "li", "sen", "ta", "bel", "co", "ne", "vor", "quin", "ha", "zu",
+]
+
+
+def make_vocabulary(lang: str, size: int, rng: np.random.Generator) -> List[str]:
+    words = set()
+    while len(words) < size:
+        if lang == "zh":
+            words.add("".join(rng.choice(list(ZH_CHARS), size=rng.integers(1, 4))))
+        else:
+            words.add("".join(rng.choice(EN_SYLLABLES, size=rng.integers(1, 5))))
+    return sorted(words)
+
+
+def make_corpus(chunks: int, lang: str = "zh", seed: int = 42, vocab_size: int = 20000) -> List[str]:
+    """Chunks of 40 to 120 words drawn from a Zipf distribution, like word counts of real text."""
+    rng = np.random.default_rng(seed)
+    vocabulary = {
+        lang: np.array(make_vocabulary(lang, vocab_size, rng), dtype=object)
+        for lang in (("zh", "en") if lang == "mixed" else (lang,))
+    }
+    cdf = np.cumsum(1.0 / np.arange(1, vocab_size + 1))
+    cdf /= cdf[-1]
+    texts = []
+    for i in range(chunks):
+        chunk_lang = lang if lang != "mixed" else ("zh", "en")[i % 5 == 0]
+        ranks = np.searchsorted(cdf, rng.random(rng.integers(40, 121)))
+        words = vocabulary[chunk_lang][np.minimum(ranks, vocab_size - 1)]
+        # Sentences of 14 words, Chinese ones without spaces
+        separator = "" if chunk_lang == "zh" else " "
+        sentences = [
+            separator.join(words[start : start + 14]) + ("。" if chunk_lang == "zh" else ".")
+            for start in range(0, len(words), 14)
+        ]
+        texts.append(separator.join(sentences))
+    return texts
+
+
+def load_corpus(path: str, limit: int = None) -> List[str]:
+    texts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if limit is not None and len(texts) >= limit:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            texts.append(json.loads(line)["text"] if path.endswith(".jsonl") else line)
+    return texts
+
+
+def make_queries(texts: List[str], count: int, seed: int = 42):
+    """(query, index of its chunk), a span of 6 words or 16 characters of a random chunk."""
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+    for i in rng.integers(0, len(texts), size=count):
+        text = texts[i]
+        words = text.split()
+        if len(words) > 6:
+            start = rng.integers(0, len(words) - 6)
+            query = " ".join(words[start : start + 6])
+        else:
+            start = rng.integers(0, max(len(text) - 16, 1))
+            query = text[start : start + 16]
+        queries.append((query, int(i)))
+    return queries
+
+
+class HashEmbedding(BaseEmbedding):
+    """Deterministic offline embedding: hashed character bigram counts, L2 normalized."""
+
+    dim: int = 256
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def embed(self, text: str) -> List[float]:
+        codes = np.frombuffer("".join(text.split()).encode("utf-32-le"), dtype=np.uint32)
+        if len(codes) < 2:
+            codes = np.append(codes, [0, 0]).astype(np.uint32)
+        buckets = (codes[:-1].astype(np.uint64) * 1000003 ^ codes[1:]) % self.dim
+        vector = np.bincount(buckets.astype(np.intp), minlength=self.dim).astype(float)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self.embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self.embed(text)
+
+
+def rss_mb() -> float:
+    """Current resident memory, from /proc on Linux, else the peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+@contextlib.contextmanager
+def quiet():
+    # The retrievers print each node and show progress bars, which would be timed too
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            yield
+
+
+def build(name, create):
+    rss = rss_mb()
+    with quiet():
+        start = time.perf_counter()
+        result = create()
+        elapsed = time.perf_counter() - start
+    print(f"{name:<28} build {elapsed:9.3f} s  rss +{rss_mb() - rss:8.1f} MB")
+    return result
+
+
+def run_queries(name, retrieve, queries, top_k, warmup=3):
+    for query, _ in queries[:warmup]:
+        with quiet():
+            retrieve(QueryBundle(query))
+    latencies = []
+    hits = 0
+    for query, relevant in queries:
+        with quiet():
+            start = time.perf_counter()
+            results = retrieve(QueryBundle(query))
+            latencies.append(time.perf_counter() - start)
+        if relevant in {result.node.metadata["chunk"] for result in results[:top_k]}:
+            hits += 1
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+    print(
+        f"{name:<28} query p50 {p50:8.2f} ms  p95 {p95:8.2f} ms  p99 {p99:8.2f} ms  "
+        f"hit@{top_k} {hits / len(queries):.2f}  peak rss {peak_rss_mb():8.1f} MB"
+    )
+
+
+def reset_backend(backend):
+    """Remove the benchmark's data of an earlier run, LanceDB overwrites its table itself."""
+    if backend == "chroma":
+        import chromadb
+
+        try:
+            chromadb.PersistentClient(path=".chroma").delete_collection(BENCH_NAME)
+        except ValueError:  # no such collection
+            pass
+    elif backend == "es":
+        from elasticsearch import Elasticsearch
+
+        # Same server as create_vector_store
+        Elasticsearch("http://localhost:9200").indices.delete(
+            index=BENCH_NAME, ignore_unavailable=True
+        )
+
+
+def build_index(backend, nodes, embed_model):
+    reset_backend(backend)
+    vector_store = create_vector_store(type=backend, name=BENCH_NAME)
+    storage_context = StorageContext.from_defaults(vector_store=vector_store)
+    # Nodes keep a copy in the docstore as in IndexManager.init_index, BM25 is built from it
+    return VectorStoreIndex(
+        nodes,
+        storage_context=storage_context,
+        embed_model=embed_model,
+        store_nodes_override=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval latency and memory")
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--lang", choices=["zh", "en", "mixed"], default="zh")
+    parser.add_argument("--corpus", help="load chunks from a .jsonl or .txt file instead")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=256, help="HashEmbedding dimensions")
+    parser.add_argument("--backends", default="simple", help="comma separated vector stores")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.corpus:
+        texts = load_corpus(args.corpus, args.chunks)
+    else:
+        texts = make_corpus(args.chunks, args.lang, args.seed)
+    queries = make_queries(texts, args.queries, args.seed)
+    print(
+        f"{len(texts)} chunks, {sum(map(len, texts)) / 2**20:.1f}M characters, "
+        f"{len(queries)} queries, made in {time.perf_counter() - start:.1f} s"
+    )
+
+    # Fixed ids, so that vector stores and hits compare across runs
+    nodes = [
+        TextNode(text=text, id_=f"chunk-{i}", metadata={"chunk": i})
+        for i, text in enumerate(texts)
+    ]
+    for node in nodes:
+        node.excluded_embed_metadata_keys.append("chunk")
+    init_jieba()
+    build("BM25 tokens (ingestion)", lambda: BM25TokenExtractor()(nodes))
+    embed_model = HashEmbedding(dim=args.dim, embed_batch_size=1000)
+    embeddings = build(
+        "HashEmbedding",
+        lambda: embed_model.get_text_embedding_batch([node.get_content() for node in nodes]),
+    )
+    for node, embedding in zip(nodes, embeddings):
+        node.embedding = embedding  # VectorStoreIndex only embeds nodes without one
+
+    # An empty tag store of its own, the benchmark never touches the application's stores
+    tag_store = TagStore(SimpleKVStore())
+    bm25 = build(
+        "SimpleBM25Retriever",
+        lambda: SimpleBM25Retriever(nodes, similarity_top_k=args.top_k, tag_store=tag_store),
+    )
+    run_queries("SimpleBM25Retriever", bm25.retrieve, queries, args.top_k)
+    del bm25
+
+    hybrid_index = None
+    for backend in args.backends.split(","):
+        name = f"vector[{backend}]"
+        try:
+            index = build(name, lambda: build_index(backend, nodes, embed_model))
+        except Exception as e:  # optional dependency or server missing
+            print(f"{name:<28} skipped: {type(e).__name__}: {e}")
+            continue
+        retriever = VectorIndexRetriever(index=index, similarity_top_k=args.top_k)
+        run_queries(name, retriever.retrieve, queries, args.top_k)
+        if hybrid_index is None:
+            hybrid_index = index
+    if hybrid_index is None:
+        return
+
+    hybrid = build(
+        "SimpleHybridRetriever",
+        lambda: SimpleHybridRetriever(hybrid_index, top_k=args.top_k, tag_store=tag_store),
+    )
+    run_queries("SimpleHybridRetriever", hybrid.retrieve, queries, args.top_k)
+    del hybrid
+
+    # The query engine calls aretrieve, both retrievers run in worker threads
+    loop = asyncio.new_event_loop()
+    for mode in FUSION_MODES:
+        name = f"fusion[{mode.value}]"
+        fusion = build(
+            name,
+            lambda: SimpleFusionRetriever(
+                hybrid_index, top_k=args.top_k, mode=mode, tag_store=tag_store
+            ),
+        )
+        run_queries(
+            name,
+            lambda bundle: loop.run_until_complete(fusion.aretrieve(bundle)),
+            queries,
+            args.top_k,
+        )
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Import cost of the app's entry modules, from python -X importtime
+# Usage: python -m benchmarks.bench_startup_imports [--modules app frontend.state] [--top 15] [--repeat 3]
+#
+# Each module is imported in a fresh interpreter from the repository root. Reported per
+# module: the wall time over an empty interpreter, the cumulative import time, the
+# packages costing the most, and which heavy packages (langchain, chromadb, torch, spaCy,
+# ...) were loaded. `app` is what a Streamlit process imports before the login page.
+# https://docs.python.org/3/using/cmdline.html#cmdoption-X
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    "app",
+    "frontend.auth",
+    "frontend.state",
+    "server.index",
+    "server.engine",
+    "server.retriever",
+]
+
+HEAVY_PACKAGES = (
+    "llama_index",
+    "langchain",
+    "langchain_openai",
+    "chromadb",
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "spacy",
+    "jieba",
+    "pandas",
+    "bm25s",
+    "ollama",
+    "redis",
+)
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def run_import(module: str):
+    """Import a module in a new interpreter, returns wall time, importtime lines and errors."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    entries = []
+    errors = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent)))
+        elif line and not line.startswith("import time:"):
+            errors.append(line)
+    return elapsed, entries, errors if result.returncode else []
+
+
+def summarize(module: str, repeat: int, baseline: float, top: int):
+    runs = [run_import(module) for _ in range(repeat)]
+    elapsed = min(run[0] for run in runs)
+    _, entries, errors = runs[-1]
+    if errors:
+        print(f"\n{module}: import failed\n  " + "\n  ".join(errors[-3:]))
+        return
+
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in entries:
+        by_package[name.split(".")[0]] += self_us
+    cumulative = sum(self_us for _, self_us, _, _ in entries)
+    loaded = {name.split(".")[0] for name, _, _, _ in entries}
+
+    print(f"\n{module}")
+    print(f"  wall time over empty interpreter: {elapsed - baseline:.3f}s (best of {repeat})")
+    print(f"  import time: {cumulative / 1e6:.3f}s in {len(entries)} modules")
+    print("  heaviest packages:")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        print(f"    {package:<28} {self_us / 1e6:8.3f}s")
+    heavy = [package for package in HEAVY_PACKAGES if package in loaded]
+    print(f"  heavy packages loaded: {', '.join(heavy) or 'none'}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    baseline = min(run_import("sys")[0] for _ in range(args.repeat))
+    print(f"Empty interpreter: {baseline:.3f}s")
+    for module in args.modules:
+        summarize(module, args.repeat, baseline, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -41,6 +41,23 @@ DEFAULT_RESPONSE_MODE = "simple_summarize"
 # 从环境变量加载隐私配置
 OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434")
 
+# Provider status checks run in the background, see server/models/provider_status.py
+PROVIDER_STATUS_TTL = 60  # seconds a check result is reused
+PROVIDER_STATUS_WORKERS = 4  # threads running the checks
+OLLAMA_CHECK_TIMEOUT = 2  # seconds to wait for Ollama to list its models
+LLM_API_CHECK_TIMEOUT = 5  # seconds to wait for the test call validating an API key
+
+# LLM clients shared by all sessions, see server/models/llm_registry.py
+LLM_REGISTRY_SIZE = 32  # LLMs kept, one per provider, model, base URL and settings
+LLM_REQUEST_TIMEOUT = 600  # seconds, generation by local models can be slow
+LLM_HTTP_MAX_CONNECTIONS = 100  # connections per HTTP client
+LLM_HTTP_MAX_KEEPALIVE = 20  # idle connections kept open for reuse
+LLM_HTTP_KEEPALIVE_EXPIRY = 60  # seconds an idle connection is kept
+LLM_CONCURRENCY_LIMITS = {"Ollama": 4}  # answers streamed at once per service provider
+LLM_DEFAULT_CONCURRENCY = 16  # for the providers not listed above
+LLM_RATE_LIMITS = {}  # requests per minute per service provider, e.g. {"DeepSeek": 60}
+QUERY_TRACE_LOG = True  # print the stage latencies of each query as a JSON line, see server/query_trace.py
+
 # Models' API configuration
 ZHIPU_API_KEY = os.getenv("ZHIPU_API_KEY", "")
 MOONSHOT_API_KEY = os.getenv("MOONSHOT_API_KEY", "")
@@ -102,13 +119,34 @@ DEFAULT_CHUNK_SIZE = 2048
 DEFAULT_CHUNK_OVERLAP = 512
 ZH_TITLE_ENHANCE = False  # Chinese title enhance
 
+# spaCy sentence splitter used in production, "sentencizer" for the rule-based one
+SPACY_PIPELINE = "zh_core_web_sm"
+SPACY_N_PROCESS = 1  # worker processes for nlp.pipe
+SPACY_BATCH_SIZE = 64  # documents per nlp.pipe batch
+
+# BM25 tokenization (jieba)
+JIEBA_USER_DICTS = []  # paths of jieba user dictionaries for domain terms, one "word freq tag" per line
+JIEBA_WORKERS = 4  # processes used to tokenize large corpora
+BM25_USE_STOPWORDS = True  # drop common function words like 的/了/是
+BM25_STOPWORDS_FILES = []  # extra stopword lists, one word per line
+BM25_LOWERCASE = True
+BM25_NORMALIZE_WIDTH = True  # full-width letters, digits and punctuation to half-width
+BM25_STRIP_PUNCTUATION = True
+
 # Storage configuration
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-REDIS_URI = os.getenv("REDIS_URI", "redis://localhost:6379")
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_URI = os.getenv("REDIS_URI", f"redis://{REDIS_HOST}:{REDIS_PORT}")  # used by all Redis stores
+REDIS_POOL_SIZE = 50  # connections shared by all Redis stores and sessions
+REDIS_POOL_TIMEOUT = 10  # seconds to wait for a free connection when all are in use
+REDIS_SOCKET_KEEPALIVE = True
+REDIS_HEALTH_CHECK_INTERVAL = 30  # seconds a connection may idle before it is checked on reuse
 ES_URI = os.getenv("ES_URI", "http://localhost:9200")
+CHROMA_HOST = os.getenv("CHROMA_HOST", "")  # Chroma server, empty for the embedded database in .chroma
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+DOCSTORE_BATCH_SIZE = 1000  # keys per Redis pipeline batch or vector store delete call
 
 # Default vector database type, including "es" and "chroma"
 DEFAULT_VS_TYPE = "es"
@@ -159,3 +197,21 @@ DEV_MODE = MindSpark_ENV == "development"  # development or production
 
 # For creating IndexManager
 DEFAULT_INDEX_NAME = "knowledge_base"
+
+# Batch queries (server/batch_query.py)
+BATCH_QUERY_CONCURRENCY = 8  # questions retrieved and answered at once
+BATCH_EMBED_BATCH_SIZE = 64  # questions embedded together
+
+# HTTP API (server/api.py), run next to the Streamlit app
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8080"))
+API_WORKERS = int(os.getenv("API_WORKERS", "2"))  # more than one needs the Redis stores and a Chroma server (CHROMA_HOST)
+API_LLM = os.getenv("API_LLM", "configured")  # "configured" for the LLM selected in the UI, or "mock"
+API_MOCK_LLM_TOKENS = 64  # length of the mock LLM's answers
+API_ENGINE_CACHE_SIZE = 8  # query engines kept per worker, by settings and filters
+API_ENGINE_CACHE_TTL = 60  # seconds, how late documents changed by other workers are seen
+
+# Prometheus metrics (server/metrics.py), served by the Streamlit app and at /metrics of the API
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # local only, scrape through a sidecar or the API
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
@@ -8,9 +8,10 @@ import os
 from datetime import datetime
 import uuid
 from frontend.state import init_keys
-from server.stores.chat_store import CHAT_MEMORY
+from server.stores.chat_store import get_chat_memory
 from llama_index.core.llms import ChatMessage, MessageRole
-from server.engine import create_query_engine
+from server.engine import create_query_engine, stream_query
+from server.filters import get_filter_options
 from server.stores.config_store import CONFIG_STORE
 from config import STORAGE_DIR
 
@@ -18,6 +19,9 @@ from config import STORAGE_DIR
 os.makedirs(STORAGE_DIR, exist_ok=True)
 CHAT_SESSIONS_FILE = os.path.join(STORAGE_DIR, "chat_sessions.json")
 
+# 对话记忆在首次使用时创建
+chat_memory = get_chat_memory()
+
 # 添加会话持久化函数
 
 
@@ -102,7 +106,7 @@ def get_chat_sessions():
 def save_current_chat_session():
     """保存当前聊天会话"""
     # 获取当前聊天消息
-    messages = CHAT_MEMORY.get()
+    messages = chat_memory.get()
     if messages and len(messages) > 1:  # 至少有一条用户消息和一条助手消息
         # 生成唯一的会话ID
         session_id = str(uuid.uuid4())
@@ -141,8 +145,8 @@ def save_current_chat_session():
         save_chat_sessions_to_file()
 
         # 清空当前聊天记录，为新会话做准备
-        CHAT_MEMORY.reset()
-        CHAT_MEMORY.put(
+        chat_memory.reset()
+        chat_memory.put(
             ChatMessage(
                 role=MessageRole.ASSISTANT,
                 content="Feel free to ask about anything in the knowledge base",
@@ -156,10 +160,10 @@ def load_chat_session(session_id):
     if session_id in chat_sessions:
         session = chat_sessions[session_id]
         # 清空当前聊天记录
-        CHAT_MEMORY.reset()
+        chat_memory.reset()
         # 加载会话消息
         for message in session["messages"]:
-            CHAT_MEMORY.put(message)
+            chat_memory.put(message)
         return True
     return False
 
@@ -202,7 +206,13 @@ def perform_query(prompt):
     if (not prompt) or prompt.strip() == "":
         print("Query text is required")
     try:
-        query_response = st.session_state.query_engine.query(prompt)
+        # 在共享的事件循环上异步检索和生成，按服务商限制并发
+        current_llm_info = CONFIG_STORE.get(key="current_llm_info") or {}
+        query_response = stream_query(
+            st.session_state.query_engine,
+            prompt,
+            provider=current_llm_info.get("service_provider"),
+        )
         return query_response
     except Exception as e:
         # print(f"An error occurred while processing the query: {e}")
@@ -440,7 +450,7 @@ def chatbox():
                 st.info("No chat history available.")
 
     # 添加新会话按钮
-    if len(CHAT_MEMORY.get()) > 1:  # 仅当有对话历史时显示
+    if len(chat_memory.get()) > 1:  # 仅当有对话历史时显示
         col_left, col_right = st.columns([0.9, 0.1])
         with col_right:
             if st.button("New Chat", key="new_chat"):
@@ -450,16 +460,16 @@ def chatbox():
                 st.rerun()
 
     # Load Q&A history
-    messages = CHAT_MEMORY.get()
+    messages = chat_memory.get()
     if len(messages) == 0:
         # Initialize Q&A record
-        CHAT_MEMORY.put(
+        chat_memory.put(
             ChatMessage(
                 role=MessageRole.ASSISTANT,
                 content="Feel free to ask about anything in the knowledge base",
             )
         )
-        messages = CHAT_MEMORY.get()
+        messages = chat_memory.get()
 
     # Show Q&A records
     for message in messages:
@@ -471,7 +481,7 @@ def chatbox():
     ):  # Prompt the user to input the question then add it to the message history
         with st.chat_message(MessageRole.USER):
             st.write(prompt)
-            CHAT_MEMORY.put(ChatMessage(role=MessageRole.USER, content=prompt))
+            chat_memory.put(ChatMessage(role=MessageRole.USER, content=prompt))
         with st.chat_message(MessageRole.ASSISTANT):
             with st.spinner("Thinking..."):
                 start_time = time.time()
@@ -482,7 +492,21 @@ def chatbox():
                     st.write("Couldn't come up with an answer.")
                 else:
                     response_text = st.write_stream(response.response_gen)
+                    # 各阶段耗时在回答输出完毕后才完整
+                    trace = (response.metadata or {}).get("trace")
+                    if trace is not None and trace.total is not None:
+                        query_time = round(trace.total, 2)
                     st.write(f"Took {query_time} second(s)")
+                    if trace is not None:
+                        with st.expander("Latency breakdown", expanded=False):
+                            st.table(
+                                pd.DataFrame(
+                                    [
+                                        {"Stage": stage, "ms": f"{seconds * 1000:.1f}"}
+                                        for stage, seconds in trace.as_dict()["stages"].items()
+                                    ]
+                                )
+                            )
                     details_title = f"Found {len(response.source_nodes)} document(s)"
                     with st.expander(
                         details_title,
@@ -522,11 +546,26 @@ def chatbox():
                         df = pd.DataFrame(source_nodes)
                         st.table(df)
                     # store the answer in the chat history
-                    CHAT_MEMORY.put(
+                    chat_memory.put(
                         ChatMessage(role=MessageRole.ASSISTANT, content=response_text)
                     )
 
 
+# Restrict retrieval to some tags, file types or web pages
+def select_filters(index_manager):
+    # 从文档目录和标签索引读取可选值，不读取整个doc_store
+    options = get_filter_options(index_manager.catalog_store, index_manager.tag_store)
+    with st.expander("Filters"):
+        filters = {
+            "tags": st.multiselect("Tags", options["tags"], key="filter_tags"),
+            "file_type": st.multiselect(
+                "Document type", options["file_type"], key="filter_file_type"
+            ),
+            "url": st.multiselect("Web page", options["url"], key="filter_url"),
+        }
+    return filters
+
+
 def main():
     st.header("Query")
     if st.session_state.llm is not None:
@@ -554,6 +593,7 @@ def main():
         if st.session_state.index_manager is not None:
             if st.session_state.index_manager.check_index_exists():
                 st.session_state.index_manager.load_index()
+                filters = select_filters(st.session_state.index_manager)
                 st.session_state.query_engine = create_query_engine(
                     index=st.session_state.index_manager.index,
                     use_reranker=current_llm_settings["use_reranker"],
@@ -561,6 +601,8 @@ def main():
                     top_k=current_llm_settings["top_k"],
                     top_n=current_llm_settings["top_n"],
                     reranker=current_llm_settings["reranker_model"],
+                    filters=filters,
+                    llm=st.session_state.llm,
                 )
                 print("Index loaded and query engine created")
                 chatbox()
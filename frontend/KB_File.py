@@ -2,6 +2,7 @@ import time
 import pandas as pd
 import streamlit as st
 from server.utils.file import save_uploaded_file, get_save_dir
+from server.text_splitter import DEFAULT_SPLITTER_TYPE
 import uuid
 
 
@@ -99,6 +100,11 @@ def handle_file():
             st.session_state.chunk_size,
             st.session_state.chunk_overlap,
         )
+        token_aware = st.checkbox(
+            "Count length in embedding model tokens",
+            value=False,
+            help="Chunks are measured with the embedding model's tokenizer and capped at its window (512 tokens for bge models), so no text is truncated when embedding.",
+        )
 
     # 初始化uploaded_files，确保向后兼容
     if "uploaded_files" not in st.session_state:
@@ -122,7 +128,11 @@ def handle_file():
 
             # 调用后端load_files方法，传入包含标签信息的文件列表
             st.session_state.index_manager.load_files(
-                st.session_state.uploaded_files_with_tags, chunk_size, chunk_overlap
+                st.session_state.uploaded_files_with_tags,
+                chunk_size,
+                chunk_overlap,
+                splitter_type="token" if token_aware else DEFAULT_SPLITTER_TYPE,
+                embedding_model=st.session_state["current_llm_settings"]["embedding_model"],
             )
             st.toast("✔️ Knowledge base index generation complete", icon="🎉")
             st.session_state.uploaded_files_with_tags = []
@@ -4,87 +4,45 @@ from math import ceil
 import pandas as pd
 import streamlit as st
 import os
+from server.stores.catalog_store import get_catalog_store
 
+# The catalog is opened on first use, not when the app starts
+catalog_store = get_catalog_store()
 
-def get_unique_files_info(ref_doc_info):
-    docs = []
-    seen_paths = set()
+# Rows per page of the document table
+PAGE_SIZE = 12
 
-    for ref_doc_id, ref_doc in ref_doc_info.items():
-
-        metadata = ref_doc.metadata
-        file_path = metadata.get("file_path", None)
-
-        if file_path is None:
-            title = metadata.get("title", None)
-            url = metadata.get("url_source", None)
-            docs.append(
-                {
-                    "id": ref_doc_id,
-                    "name": title,
-                    "type": "url",
-                    "path": url,
-                    "date": metadata["creation_date"],
-                    "tags": metadata.get("tags", []),
-                }
-            )
-
-        if file_path and file_path not in seen_paths:
-            base_name, extension = os.path.splitext(metadata["file_name"])
-            # Remove the leading dot from the extension
-            extension = extension.lstrip(".")
-
-            file_info = {
-                "id": ref_doc_id,
-                "name": base_name,
-                "type": extension,
-                "path": file_path,
-                #'file_size': metadata['file_size'],
-                "date": metadata["creation_date"],
-                "tags": metadata.get("tags", []),
-            }
-            docs.append(file_info)
-            seen_paths.add(file_path)
-
-    return docs
+SORT_OPTIONS = {
+    "date": "Creation Date",
+    "name": "Name",
+    "type": "Type",
+    "node_count": "Chunks",
+    "size": "Size",
+}
 
 
 def handle_knowledgebase():
     st.header("Manage Knowledge Base")
     st.caption("Manage documents and web urls in your knowledge base.")
 
-    from server.stores.strage_context import STORAGE_CONTEXT
-
-    doc_store = STORAGE_CONTEXT.docstore
-
+    # 文档目录只按页查询，不再每次加载所有引用文档信息
     try:
-        # 直接尝试获取所有引用文档信息，不依赖doc_store.docs属性
-        # 这对RedisDocumentStore等生产环境中的存储更兼容
-        ref_doc_info = doc_store.get_all_ref_doc_info()
-
-        # 检查是否有文档
-        if not ref_doc_info:
-            st.write("Knowledge base is empty")
-            return  # 提前返回，避免后续处理
-
-        # 处理文档列表
-        unique_files = get_unique_files_info(ref_doc_info)
-        st.write("You have total", len(unique_files), "documents.")
-        df = pd.DataFrame(unique_files)
+        total_docs = catalog_store.count()
     except Exception as e:
         print(f"Error getting document info: {e}")
         st.error("Failed to load document information. Please try again.")
         st.write("Knowledge base is empty")
         return  # 提前返回，避免后续处理
 
+    # 检查是否有文档
+    if total_docs == 0:
+        st.write("Knowledge base is empty")
+        return  # 提前返回，避免后续处理
+
+    st.write("You have total", total_docs, "documents.")
+
     # 获取所有唯一标签用于搜索
-    all_tags = set()
-    for _, row in df.iterrows():
-        tags = row["tags"]
-        if isinstance(tags, list):
-            all_tags.update(tags)
-        elif isinstance(tags, str) and tags:
-            all_tags.update([tag.strip() for tag in tags.split(",") if tag.strip()])
+    all_tags = set(catalog_store.list_tags())
 
     # 添加高级搜索功能
     st.subheader("Search")
@@ -99,7 +57,7 @@ def handle_knowledgebase():
             st.session_state.next_condition_id = 1
 
         # 获取所有唯一的文档类型
-        all_types = set(df["type"].unique())
+        all_types = set(catalog_store.list_types())
 
         # 定义可搜索字段
         search_fields = {"tags": "标签", "type": "文档类型", "name": "文档名称"}
@@ -202,7 +160,6 @@ def handle_knowledgebase():
             st.rerun()
 
     # 根据搜索条件过滤文档
-    filtered_docs = []
     has_active_conditions = False
 
     # 检查是否有有效的搜索条件
@@ -211,100 +168,66 @@ def handle_knowledgebase():
             has_active_conditions = True
             break
 
-    if has_active_conditions:
-        # 遍历所有文档
-        for _, row in df.iterrows():
-            # 文档是否匹配所有条件
-            doc_matches = True
-
-            # 跟踪是否已经处理了至少一个非空条件
-            has_processed_condition = False
-
-            # 遍历所有搜索条件
-            for i, condition in enumerate(st.session_state.search_conditions):
-                # 跳过空值条件
-                if condition["value"] == "":
-                    continue
-
-                # 根据字段类型检查条件是否匹配
-                match = False
-
-                if condition["field"] == "type":
-                    match = row["type"] == condition["value"]
-                elif condition["field"] == "tags":
-                    doc_tags = row["tags"]
-                    if isinstance(doc_tags, list):
-                        tags_list = doc_tags
-                    elif isinstance(doc_tags, str):
-                        tags_list = [
-                            tag.strip() for tag in doc_tags.split(",") if tag.strip()
-                        ]
-                    else:
-                        tags_list = []
-                    match = condition["value"] in tags_list
-                elif condition["field"] == "name":
-                    match = condition["value"].lower() in str(row["name"]).lower()
-
-                # 应用逻辑运算符
-                if not has_processed_condition:
-                    # 第一个非空条件直接设置结果
-                    doc_matches = match
-                    has_processed_condition = True
-                else:
-                    # 后续条件应用逻辑运算符
-                    # 对于非第一行的条件，使用其指定的逻辑运算符
-                    if condition["logic"] == "AND":
-                        doc_matches = doc_matches and match
-                    elif condition["logic"] == "OR":
-                        doc_matches = doc_matches or match
-                    elif condition["logic"] == "NOT":
-                        doc_matches = doc_matches and not match
-
-            # 如果文档匹配所有条件，添加到结果列表
-            if doc_matches:
-                filtered_docs.append(row)
-
-        df = pd.DataFrame(filtered_docs)
-        st.write(f"Found {len(df)} documents matching search criteria.")
-
-    # 确保tags列存在并转换为字符串格式以便显示
-    if "tags" not in df.columns:
-        df["tags"] = ""
-    else:
-        df["tags"] = df["tags"].apply(
-            lambda x: (
-                ", ".join(x) if isinstance(x, list) and x else (str(x) if x else "")
-            )
-        )
+    # 排序方式
+    sort_col, order_col = st.columns([3, 1])
+    sort_by = sort_col.selectbox(
+        "Sort by",
+        options=list(SORT_OPTIONS.keys()),
+        format_func=lambda x: SORT_OPTIONS[x],
+        key="catalog_sort_by",
+    )
+    descending = order_col.toggle("Descending", value=True, key="catalog_descending")
 
     # Pagination settings
 
-    page_size = 12
-    total_pages = ceil(len(df) / page_size)
-
     if "curr_page" not in st.session_state.keys():
         st.session_state.curr_page = 1
 
-    curr_page = min(st.session_state["curr_page"], total_pages)
+    # 搜索、排序和分页都在文档目录中完成，只取当前页的文档
+    conditions = st.session_state.search_conditions if has_active_conditions else []
+    curr_page = max(st.session_state["curr_page"], 1)
+    rows, total = catalog_store.query(
+        conditions=conditions,
+        sort_by=sort_by,
+        descending=descending,
+        offset=(curr_page - 1) * PAGE_SIZE,
+        limit=PAGE_SIZE,
+    )
+    total_pages = ceil(total / PAGE_SIZE)
+    if has_active_conditions:
+        st.write(f"Found {total} documents matching search criteria.")
+
+    # 搜索条件变化后页数可能变少
+    if total_pages and curr_page > total_pages:
+        curr_page = total_pages
+        st.session_state["curr_page"] = curr_page
+        rows, total = catalog_store.query(
+            conditions=conditions,
+            sort_by=sort_by,
+            descending=descending,
+            offset=(curr_page - 1) * PAGE_SIZE,
+            limit=PAGE_SIZE,
+        )
 
     # Displaying pagination buttons
     if total_pages > 1:
         prev, next, _, col3 = st.columns([1, 1, 6, 2])
 
         if next.button("Next"):
-            curr_page = min(curr_page + 1, total_pages)
-            st.session_state["curr_page"] = curr_page
+            st.session_state["curr_page"] = min(curr_page + 1, total_pages)
+            st.rerun()
 
         if prev.button("Prev"):
-            curr_page = max(curr_page - 1, 1)
-            st.session_state["curr_page"] = curr_page
+            st.session_state["curr_page"] = max(curr_page - 1, 1)
+            st.rerun()
 
         with col3:
             st.write("Page: ", curr_page, "/", total_pages)
 
-    start_index = (curr_page - 1) * page_size
-    end_index = curr_page * page_size
-    df_paginated = df.iloc[start_index:end_index]
+    df_paginated = pd.DataFrame(
+        rows,
+        columns=["key", "name", "type", "path", "date", "tags", "node_count", "size"],
+    )
 
     # 创建一个DataFrame副本，用于显示
     df_display = df_paginated.copy()
@@ -318,18 +241,11 @@ def handle_knowledgebase():
     # 使用data_editor实现双击编辑标签功能
     if not df_display.empty:
         # 选择要显示的列
-        display_columns = ["name", "type", "date", "tags"]
+        display_columns = ["name", "type", "date", "node_count", "tags"]
         display_df = df_display[display_columns].copy()
 
-        # 确保标签列显示为字符串
-        display_df["tags"] = display_df["tags"].apply(
-            lambda x: (
-                ", ".join(x) if isinstance(x, list) and x else (str(x) if x else "")
-            )
-        )
-
         # 存储原始文档ID与显示行的映射
-        doc_id_map = {idx: doc["id"] for idx, doc in df_display.iterrows()}
+        doc_id_map = {idx: doc["key"] for idx, doc in df_display.iterrows()}
 
         # 创建可编辑的数据表格
         edited_df = st.data_editor(
@@ -341,6 +257,9 @@ def handle_knowledgebase():
                 "date": st.column_config.TextColumn(
                     "Creation Date", width=150, disabled=True
                 ),
+                "node_count": st.column_config.NumberColumn(
+                    "Chunks", width=80, disabled=True
+                ),
                 "tags": st.column_config.TextColumn("Tags", width=250),
             },
             hide_index=True,
@@ -353,11 +272,6 @@ def handle_knowledgebase():
             # 获取编辑的单元格信息
             edited_cells = st.session_state.doc_editor.get("edited_cells", {})
             if edited_cells:
-                # 获取文档ID到原始索引的映射
-                id_to_original_idx = {
-                    doc["id"]: idx for idx, doc in df_display.iterrows()
-                }
-
                 # 遍历所有编辑的单元格
                 for row_idx, col_dict in edited_cells.items():
                     if "tags" in col_dict:
@@ -368,76 +282,63 @@ def handle_knowledgebase():
                         # 获取更新后的标签
                         new_tags = edited_df.iloc[original_idx]["tags"]
 
-                        # 处理标签格式
-                        tags_list = [
-                            tag.strip() for tag in new_tags.split(",") if tag.strip()
-                        ]
-                        tags_str = ", ".join(tags_list)
-
                         try:
-                            # 获取原始文档引用信息
-                            ref_doc = ref_doc_info[doc_id]
-
-                            # 更新文档元数据中的标签
-                            if hasattr(ref_doc, "metadata") and isinstance(
-                                ref_doc.metadata, dict
-                            ):
-                                ref_doc.metadata["tags"] = tags_str
-
-                                # 更新文档存储
-                                doc_store.set_ref_doc_info({doc_id: ref_doc})
+                            # 更新标签索引和文档目录
+                            tags_list = st.session_state.index_manager.set_tags(
+                                doc_id, new_tags
+                            )
+                            tags_str = ", ".join(tags_list)
 
-                                # 持久化存储上下文
-                                STORAGE_CONTEXT.persist()
-
-                                st.toast(f"✔️ 标签已更新: {tags_str}", icon="🎉")
+                            st.toast(f"✔️ 标签已更新: {tags_str}", icon="🎉")
                         except Exception as e:
                             print(f"Error updating tags for document {doc_id}: {e}")
                             st.error(f"更新标签失败，请重试。")
 
         # 保留删除功能所需的doc_options创建
         doc_options = {
-            f"{doc['name']} ({doc['type']})": doc["id"]
+            f"{doc['name']} ({doc['type']})": doc["key"]
             for _, doc in df_display.iterrows()
         }
     else:
         doc_options = {}
 
     # 显示删除按钮区域
+    st.markdown("### Delete Documents")
 
-    # 添加会话状态变量来存储当前选中的文档ID
-    if "selected_doc_id" not in st.session_state:
-        st.session_state.selected_doc_id = None
-
-    # 显示删除按钮区域
-    st.markdown("### Delete Document")
-
-    # 使用之前创建的doc_options变量，不需要重新创建
-
-    if doc_options:
-        selected_doc_name = st.selectbox(
-            "Select a document to delete:",
-            options=list(doc_options.keys()),
-            help="Select a document to delete",
+    # 可以多选当前页的文档，或者删除所有符合搜索条件的文档
+    selected_doc_names = st.multiselect(
+        "Select documents to delete:",
+        options=list(doc_options.keys()),
+        help="Select one or more documents on this page to delete",
+    )
+    delete_all_matching = False
+    if has_active_conditions:
+        delete_all_matching = st.checkbox(
+            f"Delete all {total} documents matching the search criteria",
+            key="delete_all_matching",
         )
 
-        if selected_doc_name:
-            selected_doc_id = doc_options[selected_doc_name]
-
-            # 删除确认对话框
-            if st.button(
-                "🗑️ Delete Selected Document", type="primary", key="delete_selected"
-            ):
-                with st.spinner(text="Deleting document and related index..."):
-                    st.session_state.index_manager.delete_ref_doc(selected_doc_id)
-                    st.toast(
-                        f'✔️ Deleted document: {selected_doc_name.split(" (")[0]}',
-                        icon="🎉",
-                    )
-                    time.sleep(2)
-                    st.rerun()
-    else:
-        st.info("No documents to delete on this page.")
+    if st.button(
+        "🗑️ Delete Selected Documents",
+        type="primary",
+        key="delete_selected",
+        disabled=not (selected_doc_names or delete_all_matching),
+    ):
+        if delete_all_matching:
+            keys = catalog_store.list_keys(conditions)
+        else:
+            keys = [doc_options[name] for name in selected_doc_names]
+        with st.spinner(text=f"Deleting {len(keys)} documents and related index..."):
+            # 一个文件可能读取为多个文档（如PDF的每一页）
+            st.session_state.index_manager.delete_ref_docs(
+                catalog_store.get_ref_doc_ids(keys)
+            )
+            st.toast(f"✔️ Deleted {len(keys)} documents", icon="🎉")
+            time.sleep(2)
+            st.rerun()
+
+    if not doc_options:
+        st.info("No documents on this page.")
 
     # 标签编辑功能已通过data_editor实现
     # 以下是旧的编辑功能代码，已被内联编辑功能取代
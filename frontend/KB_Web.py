@@ -6,6 +6,7 @@ import pandas as pd
 # 导入所需的网页读取器
 from server.readers.beautiful_soup_web import BeautifulSoupWebReader
 from server.readers.jina_web import JinaWebReader
+from server.text_splitter import DEFAULT_SPLITTER_TYPE
 
 
 def handle_website():
@@ -84,6 +85,12 @@ def handle_website():
             st.session_state.chunk_overlap,
             key="web_chunk_overlap",
         )
+        token_aware = st.checkbox(
+            "Count length in embedding model tokens",
+            value=False,
+            key="web_token_aware",
+            help="Chunks are measured with the embedding model's tokenizer and capped at its window (512 tokens for bge models), so no text is truncated when embedding.",
+        )
 
         # Add web reader selection
         reader_type = st.selectbox(
@@ -174,6 +181,7 @@ def handle_website():
         with st.spinner(
             text="Loading documents and building the index, may take a minute or two"
         ):
+            splitter_type = "token" if token_aware else DEFAULT_SPLITTER_TYPE
             # 使用所选的读取器类型，并传递带自定义名称的网站列表
             if reader_type == "Jina AI Reader":
                 st.session_state.index_manager.load_websites(
@@ -181,6 +189,8 @@ def handle_website():
                     chunk_size,
                     chunk_overlap,
                     reader_type="jina",
+                    splitter_type=splitter_type,
+                    embedding_model=st.session_state["current_llm_settings"]["embedding_model"],
                 )
             else:
                 st.session_state.index_manager.load_websites(
@@ -188,6 +198,8 @@ def handle_website():
                     chunk_size,
                     chunk_overlap,
                     reader_type="beautifulsoup",
+                    splitter_type=splitter_type,
+                    embedding_model=st.session_state["current_llm_settings"]["embedding_model"],
                 )
             st.toast("✔️ Knowledge base index generation complete", icon="🎉")
             st.session_state.websites = []
@@ -1,7 +1,7 @@
 import streamlit as st
 from config import EMBEDDING_MODEL_PATH
 from server.stores.config_store import CONFIG_STORE
-from server.stores.strage_context import STORAGE_CONTEXT
+from server.stores.strage_context import get_storage_context
 from server.models.embedding import create_embedding_model
 
 st.header("Embedding Model")
@@ -21,7 +21,7 @@ def change_embedding_model():
     create_embedding_model(st.session_state["current_llm_settings"]["embedding_model"])
 
 
-doc_store = STORAGE_CONTEXT.docstore
+doc_store = get_storage_context().docstore
 if len(doc_store.docs) > 0:
     disabled = True
 else:
@@ -1,8 +1,8 @@
 import streamlit as st
-from config import LLM_API_LIST
+from config import LLM_API_LIST, OLLAMA_CHECK_TIMEOUT
 import server.models.ollama as ollama
 from server.stores.config_store import CONFIG_STORE
-from server.models.llm_api import check_openai_llm
+from server.models.llm_api import get_api_key_status
 from frontend.state import (
     init_llm_sp,
     init_ollama_endpoint,
@@ -158,11 +158,14 @@ def change_llm_api_key():
     )
     print("Checking API key...")
     print(st.session_state.llm_api_key)
-    is_valid = check_openai_llm(
+    status = get_api_key_status(
         st.session_state.llm_api_model,
         st.session_state.llm_api_endpoint,
         st.session_state.llm_api_key,
+        wait=None,
+        force=True,
     )
+    is_valid = status.alive
     st.session_state[name + "_valid"] = is_valid
     CONFIG_STORE.put(
         key=name + "_valid",
@@ -183,11 +186,14 @@ def reload_llm_api_key():
     if name in st.session_state and st.session_state[name] is not None:
         # 使用已有的API key重新验证
         print("Reloading API key...")
-        is_valid = check_openai_llm(
+        status = get_api_key_status(
             st.session_state[option + "_model_selected"],
             st.session_state[option + "_api_base"],
             st.session_state[name],
+            wait=None,
+            force=True,
         )
+        is_valid = status.alive
         st.session_state[name + "_valid"] = is_valid
         CONFIG_STORE.put(
             key=name + "_valid",
@@ -231,21 +237,30 @@ def llm_configuration_page():
                 value=st.session_state.ollama_api_url,
                 on_change=change_ollama_endpoint,
             )
-            if ollama.is_alive():
-                ollama.get_model_list()
-                st.write("🟢 Ollama is running")
+            # 状态在后台检查并缓存，页面最多等待一次检查超时
+            ollama.get_model_list(wait=OLLAMA_CHECK_TIMEOUT, force=False)
+            status = ollama.get_status()
+            if status is not None and status.alive:
+                st.write(f"🟢 Ollama is running (checked {status.age():.0f}s ago)")
+                # 切换到Ollama时模型列表可能还在检查中，列表到达后保存默认选择的模型
+                current_llm_info = CONFIG_STORE.get(key="current_llm_info")
+                if current_llm_info is None or current_llm_info["service_provider"] != "Ollama":
+                    save_current_llm_info()
+                models = st.session_state.ollama_models
+                selected = st.session_state.ollama_model_selected
                 st.selectbox(
                     "Local LLM",
-                    st.session_state.ollama_models,
-                    index=st.session_state.ollama_models.index(
-                        st.session_state.ollama_model_selected
-                    ),
+                    models,
+                    index=models.index(selected) if selected in models else 0,
                     help="Select locally deployed LLM from Ollama",
                     on_change=change_ollama_model,
                     key="ollama_model_name",  # session_state key
                 )
+            elif status is None:
+                st.write("🟡 Checking Ollama...")
             else:
-                st.write("🔴 Ollama is not running")
+                st.write(f"🔴 Ollama is not running (checked {status.age():.0f}s ago)")
+                st.caption(status.error)
 
             st.button(
                 "Refresh models",
@@ -42,3 +42,19 @@ with embedding_settings:
     st.caption(
         "If you want to deploy MindSpark on a server and handle large volume of data, please contact the author of MindSpark (wzdavid@gmail.com)"
     )
+
+if MindSpark_ENV == "production":
+    from server.stores.redis_pool import get_pool_stats
+
+    pool_stats = get_pool_stats()
+    if pool_stats:
+        st.subheader("Redis connection pool")
+        st.caption("One connection pool, and one for async calls, are shared by the doc, index, chat and tag stores and the ingestion cache.")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("In use", f"{pool_stats['in_use']} / {pool_stats['max_connections']}")
+        col2.metric("Peak in use", pool_stats["peak_in_use"])
+        col3.metric("Open connections", pool_stats["created"])
+        col4.metric(
+            "Avg. wait (ms)",
+            f"{pool_stats['wait_seconds'] * 1000 / max(pool_stats['checkouts'], 1):.2f}",
+        )
@@ -2,10 +2,8 @@
 import streamlit as st
 import config as config
 from server.models import ollama
-from server.models.llm_api import create_openai_llm, check_openai_llm
-from server.models.ollama import create_ollama_llm
+from server.models.llm_api import create_openai_llm, get_api_key_status
 from server.models.embedding import create_embedding_model
-from server.index import IndexManager
 from server.stores.config_store import CONFIG_STORE
 
 
@@ -23,6 +21,8 @@ def init_keys():
 
     # Initialize index
     if "index_manager" not in st.session_state.keys():
+        from server.index import IndexManager
+
         st.session_state.index_manager = IndexManager(config.DEFAULT_INDEX_NAME)
 
     # Initialize model selection
@@ -30,10 +30,8 @@ def init_keys():
         st.session_state.ollama_api_url = config.OLLAMA_API_URL
 
     if "ollama_models" not in st.session_state.keys():
-        ollama.get_model_list()
-        # Ensure ollama_models is always initialized, even if empty
-        if "ollama_models" not in st.session_state.keys():
-            st.session_state.ollama_models = []
+        # 只读取缓存的模型列表，Ollama 在后台检查，不阻塞会话启动
+        ollama.get_model_list(wait=0, force=False)
 
     if "ollama_model_selected" not in st.session_state.keys():
         if (
@@ -41,7 +39,6 @@ def init_keys():
             and len(st.session_state.ollama_models) > 0
         ):
             st.session_state.ollama_model_selected = st.session_state.ollama_models[0]
-            create_ollama_llm(st.session_state.ollama_model_selected)
         else:
             st.session_state.ollama_model_selected = None
     if "llm_api_list" not in st.session_state.keys():
@@ -50,13 +47,6 @@ def init_keys():
         ]
     if "llm_api_selected" not in st.session_state.keys():
         st.session_state.llm_api_selected = st.session_state.llm_api_list[0]
-        if st.session_state.ollama_model_selected is None:
-            api_object = find_api_by_model(st.session_state.llm_api_selected)
-            create_openai_llm(
-                st.session_state.llm_api_selected,
-                api_object["api_base"],
-                api_object["api_key"],
-            )
 
     # Initialize query engine
     if "query_engine" not in st.session_state.keys():
@@ -166,19 +156,23 @@ def init_api_key(sp):
             else:
                 st.session_state[api_key] = config.LLM_API_LIST[sp]["api_key"]
 
+        # None means the key is still being checked in the background
         valid_key = api_key + "_valid"
-        if valid_key not in st.session_state.keys():
+        if st.session_state.get(valid_key) is None:
             valid_result = CONFIG_STORE.get(key=valid_key)
-            if valid_result is None and st.session_state[api_key] is not None:
-                is_valid = check_openai_llm(
+            if valid_result is not None:
+                st.session_state[valid_key] = valid_result[valid_key]
+            elif st.session_state[api_key]:
+                status = get_api_key_status(
                     st.session_state[sp + "_model_selected"],
                     config.LLM_API_LIST[sp]["api_base"],
                     st.session_state[api_key],
                 )
-                CONFIG_STORE.put(key=valid_key, val={valid_key: is_valid})
-                st.session_state[valid_key] = is_valid
+                if status is not None:
+                    CONFIG_STORE.put(key=valid_key, val={valid_key: status.alive})
+                st.session_state[valid_key] = None if status is None else status.alive
             else:
-                st.session_state[valid_key] = valid_result[valid_key]
+                st.session_state[valid_key] = False
 
 
 # Initialize LLM settings, like temperature, system prompt, etc.
@@ -222,14 +216,15 @@ def init_state():
         st.session_state.initialized = True
 
 
-# 为create_llm_instance添加缓存装饰器
-@st.cache_resource(show_spinner=False)
+# LLM实例由注册表在会话间共享（server/models/llm_registry.py），每个会话保存自己的实例
 def create_llm_instance():
     current_llm_info = CONFIG_STORE.get(key="current_llm_info")
     if current_llm_info is not None:
         print("Current LLM info: ", current_llm_info)
         if current_llm_info["service_provider"] == "Ollama":
-            if ollama.is_alive():
+            # 仅在确认 Ollama 不可用时跳过，检查尚未完成时不等待
+            status = ollama.get_status()
+            if status is None or status.alive:
                 model_name = current_llm_info["model"]
                 llm = ollama.create_ollama_llm(
                     model=model_name,
@@ -0,0 +1,31 @@
+# Gunicorn settings for the HTTP API: gunicorn server.api:app
+# https://docs.gunicorn.org/en/stable/settings.html
+# https://www.uvicorn.org/deployment/#gunicorn
+# The embedding model is loaded in the master before the workers are forked, so they share
+# its memory instead of loading one copy each. Stores connect in each worker after the fork.
+import config as mindspark_config  # "config" is a gunicorn setting
+
+bind = f"{mindspark_config.API_HOST}:{mindspark_config.API_PORT}"
+workers = mindspark_config.API_WORKERS
+if workers > 1 and not mindspark_config.DEV_MODE and not mindspark_config.CHROMA_HOST:
+    # The embedded Chroma database in .chroma supports a single process only
+    print("CHROMA_HOST is not set, running one API worker on the embedded Chroma database")
+    workers = 1
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = mindspark_config.LLM_REQUEST_TIMEOUT  # answers of local models can take minutes
+
+
+def on_starting(server):
+    from server.api import load_models
+
+    load_models()
+
+
+def child_exit(server, worker):
+    # With PROMETHEUS_MULTIPROC_DIR set, drop the live gauges of the worker, see server/metrics.py
+    import os
+
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,337 @@
+# HTTP API next to the Streamlit UI, for programmatic use and load tests
+# https://fastapi.tiangolo.com/advanced/events/#lifespan
+# https://html.spec.whatwg.org/multipage/server-sent-events.html
+# Endpoints: POST /query (answer streamed as server-sent events unless stream is false),
+# POST /ingest (file upload), POST /ingest/urls, GET /documents, DELETE /documents/{key}
+# GET /health and GET /metrics (Prometheus, see server/metrics.py). They use the same IndexManager, query engine and stores as the UI.
+#
+# Run with several workers: gunicorn server.api:app (settings in gunicorn.conf.py, the
+# embedding model is loaded once before the workers are forked), or for development:
+# uvicorn server.api:app --reload
+# Set API_LLM=mock to answer with LlamaIndex's MockLLM instead of the configured LLM, e.g. to
+# load test retrieval and streaming without an LLM provider. Tests can pass any LLM to
+# create_app(llm=...).
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+
+import config
+from server.models.llm_registry import create_configured_llm, get_llm_settings
+
+
+def load_models():
+    """Load the embedding model, in the gunicorn master so that workers share it."""
+    from server.models.embedding import create_embedding_model
+
+    create_embedding_model(get_llm_settings()["embedding_model"])
+
+
+class QueryRequest(BaseModel):
+    query: str
+    stream: bool = True
+    top_k: Optional[int] = None
+    response_mode: Optional[str] = None
+    use_reranker: Optional[bool] = None
+    top_n: Optional[int] = None
+    filters: Optional[Dict[str, List[str]]] = None  # tags, file_type, url, see server/filters.py
+
+
+class WebsiteRequest(BaseModel):
+    url: str
+    name: Optional[str] = None
+    tags: List[str] = []
+
+
+class IngestUrlsRequest(BaseModel):
+    websites: List[WebsiteRequest]
+    chunk_size: int = config.DEFAULT_CHUNK_SIZE
+    chunk_overlap: int = config.DEFAULT_CHUNK_OVERLAP
+    reader_type: str = "beautifulsoup"
+
+
+def sse_event(data, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class QueryEngineCache:
+    """Query engines by settings and filters.
+
+    Building one indexes the whole corpus for BM25, so engines are reused until documents
+    are added or deleted in this worker, or for API_ENGINE_CACHE_TTL seconds, the time other
+    workers or the UI may take to be seen. get() runs in the thread pool: requests missing
+    the same key wait for one build instead of each building the engine.
+    """
+
+    def __init__(self, size=config.API_ENGINE_CACHE_SIZE, ttl=config.API_ENGINE_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._engines = OrderedDict()
+        self._building = {}  # key -> Future of the engine being built
+        self._generation = 0  # advanced by clear(), engines built before are not kept
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        with self._lock:
+            entry = self._engines.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._engines.move_to_end(key)
+                return entry[0]
+            future = self._building.get(key)
+            owner = future is None
+            if owner:
+                future = self._building[key] = Future()
+                generation = self._generation
+        if not owner:
+            return future.result()
+
+        try:
+            engine = build()
+        except BaseException as e:
+            with self._lock:
+                self._building.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            if self._building.get(key) is future:
+                del self._building[key]
+            if generation == self._generation:
+                self._engines[key] = (engine, time.monotonic())
+                self._engines.move_to_end(key)
+                while len(self._engines) > self.size:
+                    self._engines.popitem(last=False)
+        future.set_result(engine)
+        return engine
+
+    def clear(self):
+        with self._lock:
+            self._engines.clear()
+            # Builds in progress may have read the documents before the change
+            self._building.clear()
+            self._generation += 1
+
+
+def create_app(llm=None, provider: str = None, index_manager=None, preload: bool = True) -> FastAPI:
+    """The API app. llm replaces the configured LLM, preload=False skips loading models and stores."""
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if preload:
+            from server.stores.lazy import warm_up
+
+            await run_in_threadpool(load_models)
+            # Stores connect after the fork, each worker has its own connections
+            await run_in_threadpool(warm_up)
+        yield
+
+    app = FastAPI(title="MindSpark API", lifespan=lifespan)
+    if index_manager is None:
+        from server.index import IndexManager
+
+        index_manager = IndexManager(config.DEFAULT_INDEX_NAME)
+    engines = QueryEngineCache()
+    write_lock = asyncio.Lock()  # IndexManager writes one ingestion or deletion at a time
+
+    if llm is None and config.API_LLM == "mock":
+        from llama_index.core.llms import MockLLM
+
+        llm, provider = MockLLM(max_tokens=config.API_MOCK_LLM_TOKENS), "mock"
+
+    def get_llm():
+        if llm is not None:
+            return provider, llm
+        return create_configured_llm()
+
+    def load_index():
+        if index_manager.index is None and index_manager.check_index_exists():
+            index_manager.load_index()
+        return index_manager.index
+
+    def get_query_engine(request: QueryRequest, llm):
+        from server.engine import create_query_engine
+
+        settings = get_llm_settings()
+        options = {
+            "top_k": request.top_k or settings["top_k"],
+            "response_mode": request.response_mode or settings["response_mode"],
+            "use_reranker": settings["use_reranker"] if request.use_reranker is None else request.use_reranker,
+            "top_n": request.top_n or settings["top_n"],
+            "reranker": settings["reranker_model"],
+        }
+        filters = {k: tuple(sorted(v)) for k, v in (request.filters or {}).items() if v}
+        key = (id(llm), *options.values(), tuple(sorted(filters.items())))
+        return engines.get(
+            key,
+            lambda: create_query_engine(
+                index=index_manager.index,
+                filters={k: list(v) for k, v in filters.items()},
+                llm=llm,
+                **options,
+            ),
+        )
+
+    @app.get("/health")
+    async def health():
+        from server.stores.lazy import get_warm_up_hooks
+
+        llm_provider, llm_instance = await run_in_threadpool(get_llm)
+        stores_ready = all(
+            getattr(hook, "is_ready", lambda: True)() for hook in get_warm_up_hooks()
+        )
+        return {
+            "status": "ok",
+            "pid": os.getpid(),
+            "index_loaded": index_manager.index is not None,
+            "stores_ready": stores_ready,
+            "llm": llm_provider if llm_instance is not None else None,
+        }
+
+    @app.get("/metrics")
+    async def metrics():
+        if not config.METRICS_ENABLED:
+            raise HTTPException(status_code=404, detail="Metrics are disabled")
+        from server.metrics import generate_metrics
+
+        data, content_type = generate_metrics()
+        return Response(content=data, media_type=content_type)
+
+    @app.post("/query")
+    async def query(request: QueryRequest):
+        from server.engine import aquery, format_source
+
+        if not request.query.strip():
+            raise HTTPException(status_code=400, detail="Query text is required")
+        llm_provider, llm_instance = await run_in_threadpool(get_llm)
+        if llm_instance is None:
+            raise HTTPException(status_code=503, detail="No LLM is configured")
+        if await run_in_threadpool(load_index) is None:
+            raise HTTPException(status_code=503, detail="The knowledge base is empty")
+
+        start = time.perf_counter()
+        query_engine = await run_in_threadpool(get_query_engine, request, llm_instance)
+        response = await aquery(query_engine, request.query, provider=llm_provider)
+        sources = [format_source(node) for node in response.source_nodes]
+
+        if not request.stream:
+            answer = "".join([token async for token in response.response_gen])
+            return {
+                "response": answer,
+                "sources": sources,
+                "elapsed": time.perf_counter() - start,
+                "stages": response.trace.as_dict()["stages"],
+            }
+
+        async def events():
+            yield sse_event(sources, event="sources")
+            try:
+                async for token in response.response_gen:
+                    yield sse_event({"token": token})
+            except Exception as e:
+                print(f"An error occurred while streaming the answer: {type(e).__name__}: {e}")
+                yield sse_event({"error": f"{type(e).__name__}: {e}"}, event="error")
+                return
+            yield sse_event(
+                {
+                    "elapsed": time.perf_counter() - start,
+                    "stages": response.trace.as_dict()["stages"],
+                },
+                event="done",
+            )
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/ingest")
+    async def ingest_files(
+        files: List[UploadFile] = File(...),
+        tags: str = Form(""),  # comma separated, applied to all files
+        chunk_size: int = Form(config.DEFAULT_CHUNK_SIZE),
+        chunk_overlap: int = Form(config.DEFAULT_CHUNK_OVERLAP),
+    ):
+        from server.utils.file import get_save_dir, sanitize_filename
+
+        save_dir = get_save_dir()
+        os.makedirs(save_dir, exist_ok=True)
+        tag_list = [tag.strip() for tag in tags.split(",") if tag.strip()]
+        uploaded_files = []
+        for file in files:
+            name = sanitize_filename(file.filename)
+            content = await file.read()
+            with open(os.path.join(save_dir, name), "wb") as f:
+                f.write(content)
+            uploaded_files.append({"name": name, "tags": tag_list})
+
+        async with write_lock:
+            nodes = await run_in_threadpool(
+                index_manager.load_files, uploaded_files, chunk_size, chunk_overlap
+            )
+            engines.clear()
+        return {"files": [f["name"] for f in uploaded_files], "nodes": len(nodes)}
+
+    @app.post("/ingest/urls")
+    async def ingest_urls(request: IngestUrlsRequest):
+        websites = [website.model_dump() for website in request.websites]
+        async with write_lock:
+            nodes = await run_in_threadpool(
+                index_manager.load_websites,
+                websites,
+                request.chunk_size,
+                request.chunk_overlap,
+                request.reader_type,
+            )
+            engines.clear()
+        return {"urls": [website["url"] for website in websites], "nodes": len(nodes)}
+
+    @app.get("/documents")
+    async def list_documents(
+        sort_by: str = "date",
+        descending: bool = True,
+        offset: int = 0,
+        limit: int = 50,
+        tag: Optional[str] = None,
+        type: Optional[str] = None,
+        name: Optional[str] = None,
+    ):
+        # Same search conditions as the knowledge base page, see CatalogStore.query
+        conditions = [
+            {"logic": "AND", "field": field, "value": value}
+            for field, value in (("tags", tag), ("type", type), ("name", name))
+            if value
+        ]
+        try:
+            rows, total = await run_in_threadpool(
+                index_manager.catalog_store.query,
+                conditions=conditions,
+                sort_by=sort_by,
+                descending=descending,
+                offset=offset,
+                limit=limit,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"documents": rows, "total": total}
+
+    @app.delete("/documents/{key:path}")
+    async def delete_document(key: str):
+        ref_doc_ids = await run_in_threadpool(index_manager.catalog_store.get_ref_doc_ids, [key])
+        if not ref_doc_ids:
+            raise HTTPException(status_code=404, detail=f"Document {key} not found")
+        async with write_lock:
+            deleted = await run_in_threadpool(index_manager.delete_ref_docs, ref_doc_ids)
+            engines.clear()
+        return {"key": key, "deleted": len(deleted)}
+
+    return app
+
+
+app = create_app()
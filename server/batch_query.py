@@ -0,0 +1,260 @@
+# Batch queries from a JSONL file, for offline evaluation and bulk Q&A
+# https://docs.llamaindex.ai/en/stable/module_guides/evaluating/
+# Usage: python -m server.batch_query questions.jsonl answers.jsonl [--concurrency 8] [--retrieval-only]
+#
+# Each input line is {"id": ..., "query": "..."}. "question" is accepted for "query", the id
+# defaults to the line number, and "filters" restricts retrieval like on the Query page.
+# Queries are embedded in batches of BATCH_EMBED_BATCH_SIZE, BATCH_QUERY_CONCURRENCY questions
+# are retrieved and answered at once, and LLM calls keep to the provider limits of
+# server/engine.py. Each output line holds the answer, the sources with their scores and the
+# latency of each stage in seconds, or the error. Results are appended as they complete, so
+# an interrupted run continues where it stopped when started again with the same output file.
+# Questions which failed are retried, for an id the last line counts.
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import config
+from server.engine import astream_answer, create_query_engine, format_source
+
+
+def read_questions(path):
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            query = item.get("query") or item.get("question")
+            if not query:
+                raise ValueError(f"{path}:{line_number}: no query")
+            questions.append(
+                {
+                    "id": str(item.get("id", line_number)),
+                    "query": query,
+                    "filters": item.get("filters"),
+                }
+            )
+    return questions
+
+
+def read_done_ids(path):
+    """Ids answered in an earlier run. A last line cut off by an interruption is removed."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    done = set()
+    for line in data[:end].splitlines():
+        record = json.loads(line)
+        if record.get("error") is None:
+            done.add(record["id"])
+        else:
+            done.discard(record["id"])
+    return done
+
+
+def embed_queries(embed_model, queries):
+    # HuggingFaceEmbedding encodes a list in batches with its query prompt, other models
+    # are called once per query
+    if hasattr(embed_model, "_embed"):
+        return embed_model._embed(queries, prompt_name="query")
+    return [embed_model.get_query_embedding(query) for query in queries]
+
+
+async def answer_question(query_engine, question, embedding, latency, provider, retrieval_only):
+    from llama_index.core.schema import QueryBundle
+
+    record = {"id": question["id"], "query": question["query"], "latency": latency}
+    start = time.perf_counter()
+    try:
+        query_bundle = QueryBundle(question["query"], embedding=embedding)
+        stage = time.perf_counter()
+        nodes = await query_engine.retriever.aretrieve(query_bundle)
+        latency["retrieve"] = time.perf_counter() - stage
+
+        stage = time.perf_counter()
+        nodes = await asyncio.to_thread(
+            query_engine._apply_node_postprocessors, nodes, query_bundle=query_bundle
+        )
+        latency["rerank"] = time.perf_counter() - stage
+        record["sources"] = [format_source(node) for node in nodes]
+
+        if not retrieval_only:
+            # Includes the wait for a free slot of the provider
+            stage = time.perf_counter()
+            tokens = []
+            async for token in astream_answer(query_engine, query_bundle, nodes, provider):
+                if not tokens:
+                    latency["first_token"] = time.perf_counter() - stage
+                tokens.append(token)
+            latency["llm"] = time.perf_counter() - stage
+            record["answer"] = "".join(tokens)
+        record["error"] = None
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    latency["total"] = latency["embed"] + time.perf_counter() - start
+    return record
+
+
+async def run_batch(
+    index,
+    input_path,
+    output_path,
+    llm=None,
+    provider=None,
+    embed_model=None,
+    concurrency=config.BATCH_QUERY_CONCURRENCY,
+    embed_batch_size=config.BATCH_EMBED_BATCH_SIZE,
+    retrieval_only=False,
+    **engine_options,
+):
+    """Answer the questions of input_path not yet in output_path, returns a summary.
+
+    engine_options are passed to create_query_engine, e.g. top_k or response_mode.
+    """
+    from llama_index.core import Settings
+    from llama_index.core.llms import MockLLM
+
+    embed_model = embed_model or Settings.embed_model
+    questions = read_questions(input_path)
+    done_ids = read_done_ids(output_path)
+    pending = [q for q in questions if q["id"] not in done_ids]
+    print(f"{len(questions)} questions, {len(questions) - len(pending)} already answered")
+
+    # One query engine per set of filters, each indexes the corpus for BM25
+    engines = {}
+
+    async def get_engine(filters):
+        key = json.dumps(filters, sort_keys=True)
+        if key not in engines:
+            engines[key] = await asyncio.to_thread(
+                create_query_engine,
+                index,
+                filters=filters,
+                llm=llm or MockLLM(),  # not called when only retrieving
+                **engine_options,
+            )
+        return engines[key]
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(question, embedding, latency):
+        async with semaphore:
+            query_engine = await get_engine(question["filters"])
+            return await answer_question(
+                query_engine, question, embedding, latency, provider, retrieval_only
+            )
+
+    start = time.perf_counter()
+    answered = failed = 0
+    tasks = set()
+    with open(output_path, "a", encoding="utf-8") as output:
+
+        def write_finished(finished):
+            nonlocal answered, failed
+            for task in finished:
+                record = task.result()
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                if record["error"] is None:
+                    answered += 1
+                else:
+                    failed += 1
+                    print(f"Question {record['id']} failed: {record['error']}")
+            output.flush()
+            print(
+                f"{answered + failed}/{len(pending)} done, {failed} failed, "
+                f"{(answered + failed) / (time.perf_counter() - start):.1f} questions/s"
+            )
+
+        for i in range(0, len(pending), embed_batch_size):
+            batch = pending[i : i + embed_batch_size]
+            stage = time.perf_counter()
+            embeddings = await asyncio.to_thread(
+                embed_queries, embed_model, [q["query"] for q in batch]
+            )
+            # The batch's embedding time is shared by its questions
+            embed_seconds = (time.perf_counter() - stage) / len(batch)
+            for question, embedding in zip(batch, embeddings):
+                latency = {"embed": embed_seconds}
+                tasks.add(asyncio.create_task(run_one(question, list(embedding), latency)))
+            # Embed the next batch while this one is answered, but not further ahead
+            while len(tasks) > max(concurrency, embed_batch_size):
+                finished, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                write_finished(finished)
+        while tasks:
+            finished, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            write_finished(finished)
+
+    return {
+        "questions": len(questions),
+        "skipped": len(questions) - len(pending),
+        "answered": answered,
+        "failed": failed,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer the questions of a JSONL file")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--concurrency", type=int, default=config.BATCH_QUERY_CONCURRENCY)
+    parser.add_argument("--embed-batch-size", type=int, default=config.BATCH_EMBED_BATCH_SIZE)
+    parser.add_argument("--top-k", type=int)
+    parser.add_argument("--response-mode")
+    parser.add_argument("--retrieval-only", action="store_true", help="only write the sources")
+    parser.add_argument("--mock-llm", action="store_true", help="answer with LlamaIndex's MockLLM")
+    args = parser.parse_args()
+
+    from llama_index.core.llms import MockLLM
+    from server.index import IndexManager
+    from server.models.embedding import create_embedding_model
+    from server.models.llm_registry import create_configured_llm, get_llm_settings
+
+    settings = get_llm_settings()
+    create_embedding_model(settings["embedding_model"])
+    index_manager = IndexManager(config.DEFAULT_INDEX_NAME)
+    if not index_manager.check_index_exists():
+        print("The knowledge base is empty")
+        return 1
+    index_manager.load_index()
+
+    provider, llm = None, None
+    if args.mock_llm:
+        provider, llm = "mock", MockLLM(max_tokens=config.API_MOCK_LLM_TOKENS)
+    elif not args.retrieval_only:
+        provider, llm = create_configured_llm()
+        if llm is None:
+            print("No LLM is configured, select one on the LLM page or use --mock-llm")
+            return 1
+
+    summary = asyncio.run(
+        run_batch(
+            index_manager.index,
+            args.input,
+            args.output,
+            llm=llm,
+            provider=provider,
+            concurrency=args.concurrency,
+            embed_batch_size=args.embed_batch_size,
+            retrieval_only=args.retrieval_only,
+            top_k=args.top_k or settings["top_k"],
+            response_mode=args.response_mode or settings["response_mode"],
+            use_reranker=settings["use_reranker"],
+            top_n=settings["top_n"],
+            reranker=settings["reranker_model"],
+        )
+    )
+    print(summary)
+    return 0 if summary["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,6 @@
 # Create and manage query/chat engine
 import config as config
-from server.models.reranker import create_reranker_model
 from server.prompt import text_qa_template, refine_template
-from server.retriever import SimpleFusionRetriever
-from llama_index.core.query_engine import RetrieverQueryEngine
 
 
 # Create a query engine
@@ -14,17 +11,30 @@ def create_query_engine(
     use_reranker=config.USE_RERANKER,
     top_n=config.RERANKER_MODEL_TOP_N,
     reranker=config.DEFAULT_RERANKER_MODEL,
+    filters=None,
+    llm=None,
 ):
+    # BM25 and the reranker are loaded with the first query engine, not when the page opens
+    from llama_index.core.query_engine import RetrieverQueryEngine
+    from server.models.reranker import create_reranker_model
+    from server.retriever import SimpleFusionRetriever
+    from server.stores.tag_store import get_tag_store
+
     # Customized query engine with hybrid search and reranker
     node_postprocessors = (
         [create_reranker_model(model_name=reranker, top_n=top_n)]
         if use_reranker
         else []
     )
-    retriever = SimpleFusionRetriever(vector_index=index, top_k=top_k)
+    # filters restrict retrieval by tags, file type or URL, see server/filters.py
+    retriever = SimpleFusionRetriever(
+        vector_index=index, top_k=top_k, filters=filters, llm=llm, tag_store=get_tag_store()
+    )
 
+    # llm is the session's LLM from server/models/llm_registry.py, not the global Settings.llm
     query_engine = RetrieverQueryEngine.from_args(
         retriever=retriever,
+        llm=llm,
         text_qa_template=text_qa_template,
         refine_template=refine_template,
         node_postprocessors=node_postprocessors,
@@ -34,3 +44,237 @@ def create_query_engine(
     )
 
     return query_engine
+
+
+# Async query path
+# https://docs.llamaindex.ai/en/stable/module_guides/deploying/query_engine/streaming/
+# https://docs.python.org/3/library/asyncio-sync.html#semaphore
+# The vector and BM25 retrievers run concurrently and the reranker runs in a worker thread,
+# the answer is streamed from the LLM's async client. A single event loop can then serve many
+# questions at once, while each LLM provider only gets LLM_CONCURRENCY_LIMITS streams at a
+# time, the other questions wait for a free slot after retrieval. Providers with a quota are
+# also held to LLM_RATE_LIMITS requests per minute.
+# Each query records the latency of its stages in a QueryTrace, see server/query_trace.py,
+# which is added to the Prometheus metrics when it is finished, see server/metrics.py.
+import asyncio
+import threading
+import time
+import weakref
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, List
+
+from llama_index.core.instrumentation import get_dispatcher
+
+dispatcher = get_dispatcher(__name__)
+
+
+@dataclass
+class AsyncQueryResponse:
+    source_nodes: List[Any]  # NodeWithScore, after reranking
+    response_gen: AsyncGenerator[str, None]
+    trace: Any = None  # QueryTrace, complete once the answer has been streamed
+
+
+class RateLimiter:
+    """Spaces requests at least 60 / requests_per_minute seconds apart."""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_limiters_lock = threading.Lock()
+_limiters = weakref.WeakKeyDictionary()  # event loop -> {(kind, provider): limiter}
+
+
+def _get_limiter(kind, provider, create):
+    loop = asyncio.get_running_loop()
+    with _limiters_lock:
+        limiters = _limiters.setdefault(loop, {})
+        if (kind, provider) not in limiters:
+            limiters[(kind, provider)] = create()
+        return limiters[(kind, provider)]
+
+
+def get_llm_limiter(provider: str = None) -> asyncio.Semaphore:
+    """Semaphore bounding the concurrent LLM streams of a provider on the running loop."""
+    limit = config.LLM_CONCURRENCY_LIMITS.get(provider, config.LLM_DEFAULT_CONCURRENCY)
+    return _get_limiter("concurrency", provider, lambda: asyncio.Semaphore(limit))
+
+
+def get_llm_rate_limiter(provider: str = None):
+    """RateLimiter of a provider on the running loop, None if it has no rate limit."""
+    requests_per_minute = config.LLM_RATE_LIMITS.get(provider)
+    if not requests_per_minute:
+        return None
+    return _get_limiter("rate", provider, lambda: RateLimiter(requests_per_minute))
+
+
+@dispatcher.span
+def rerank_nodes(query_engine, nodes, query_bundle):
+    """The query engine's node postprocessors, traced as the rerank stage."""
+    return query_engine._apply_node_postprocessors(nodes, query_bundle=query_bundle)
+
+
+async def aquery(query_engine, query_str: str, provider: str = None) -> AsyncQueryResponse:
+    """Retrieve and rerank, returns the nodes and an async generator of the answer's tokens."""
+    from llama_index.core.schema import QueryBundle
+    from server.query_trace import QueryTrace, register_handlers, use_trace
+
+    register_handlers()
+    trace = QueryTrace(provider)
+    query_bundle = QueryBundle(query_str)
+    try:
+        with use_trace(trace):
+            nodes = await query_engine.retriever.aretrieve(query_bundle)
+            # Rerankers are synchronous models
+            nodes = await asyncio.to_thread(rerank_nodes, query_engine, nodes, query_bundle)
+    except Exception as e:
+        finish_trace(trace, error=f"{type(e).__name__}: {e}")
+        raise
+    return AsyncQueryResponse(
+        source_nodes=nodes,
+        response_gen=astream_answer(query_engine, query_bundle, nodes, provider, trace),
+        trace=trace,
+    )
+
+
+async def astream_answer(query_engine, query_bundle, nodes, provider: str = None, trace=None):
+    """Tokens of the answer synthesized from the nodes, within the provider's limits.
+
+    With a QueryTrace, the LLM stages are added to it and it is finished at the end.
+    """
+    from llama_index.core.base.response.schema import AsyncStreamingResponse
+    from server.query_trace import use_trace
+
+    error = None
+    token_count = 0
+    try:
+        stage = time.perf_counter()
+        async with get_llm_limiter(provider):
+            rate_limiter = get_llm_rate_limiter(provider)
+            if rate_limiter is not None:
+                await rate_limiter.wait()
+            synthesis_started = time.perf_counter()
+            if trace is not None:
+                trace.add("llm_wait", synthesis_started - stage)
+            # The current trace does not follow the generator across its yields, it is
+            # only set while the LLM request is made
+            with use_trace(trace):
+                response = await query_engine.asynthesize(query_bundle, nodes)
+            llm_started = (trace and trace.llm_started) or time.perf_counter()
+            if trace is not None:
+                trace.add("prompt_build", llm_started - synthesis_started)
+
+            first_token = None
+            if isinstance(response, AsyncStreamingResponse):
+                async with aclosing(response.async_response_gen()) as tokens:
+                    async for token in tokens:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                            if trace is not None:
+                                trace.add("first_token", first_token - llm_started)
+                        token_count += 1
+                        yield token
+            else:
+                first_token = time.perf_counter()
+                if trace is not None:
+                    trace.add("first_token", first_token - llm_started)
+                token_count += 1
+                yield str(response)
+            if trace is not None and first_token is not None:
+                trace.add("generation", time.perf_counter() - first_token)
+    except GeneratorExit:
+        error = "closed"  # the reader stopped early
+        raise
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if trace is not None:
+            finish_trace(trace, error=error, tokens=token_count)
+
+
+def finish_trace(trace, error: str = None, tokens: int = 0):
+    """Finish the QueryTrace and add it to the metrics, once."""
+    if trace.total is not None:
+        return
+    trace.finish(error=error)
+    if config.METRICS_ENABLED:
+        from server.metrics import record_query
+
+        record_query(trace, tokens)
+
+
+def format_source(node_with_score) -> dict:
+    """A retrieved node as a JSON-serializable dict, for the API and batch results."""
+    metadata = node_with_score.node.metadata or {}
+    return {
+        "node_id": node_with_score.node.node_id,
+        "score": node_with_score.score,
+        "file_name": metadata.get("file_name"),
+        "page_label": metadata.get("page_label"),
+        "url": metadata.get("url") or metadata.get("source"),
+        "text": node_with_score.node.get_content(),
+    }
+
+
+async def astream_query(query_engine, query_str: str, provider: str = None):
+    """Tokens of the answer, for callers which do not need the source nodes."""
+    response = await aquery(query_engine, query_str, provider)
+    async for token in response.response_gen:
+        yield token
+
+
+# Streamlit runs each session's script in its own thread without an event loop. Their queries
+# run on one shared loop, so the provider limits apply to all sessions of the process.
+_query_loop = None
+_query_loop_lock = threading.Lock()
+
+
+def get_query_loop() -> asyncio.AbstractEventLoop:
+    global _query_loop
+    with _query_loop_lock:
+        if _query_loop is None:
+            _query_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_query_loop.run_forever, name="query-loop", daemon=True
+            ).start()
+        return _query_loop
+
+
+def stream_query(query_engine, query_str: str, provider: str = None):
+    """aquery() for synchronous callers, the answer is a regular generator."""
+    from llama_index.core.base.response.schema import StreamingResponse
+
+    loop = get_query_loop()
+    response = asyncio.run_coroutine_threadsafe(
+        aquery(query_engine, query_str, provider), loop
+    ).result()
+    return StreamingResponse(
+        response_gen=_iterate_on_loop(response.response_gen, loop),
+        source_nodes=response.source_nodes,
+        metadata={"trace": response.trace},
+    )
+
+
+def _iterate_on_loop(agen, loop):
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        # Frees the provider slot when the reader stops early
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
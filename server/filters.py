@@ -0,0 +1,124 @@
+# Query-time metadata filters
+# Restrict retrieval to documents with given tags, file types or source URLs, e.g.
+#   {"tags": ["财经"], "file_type": ["pdf", "url"]}
+# Values of one field are alternatives (OR), different fields must all match (AND).
+# The filters are resolved once, tags through the tag store and the other fields through an
+# inverted index of the chunk metadata, and pushed
+# into both legs of the hybrid retriever: a weight mask for BM25, and a pre-filter for the
+# vector search (node ids for SimpleVectorStore, `where` for Chroma, a terms filter for ES),
+# so a filtered query scores fewer candidates instead of filtering the results afterwards.
+# https://docs.llamaindex.ai/en/stable/examples/vector_stores/chroma_metadata_filter/
+# https://docs.llamaindex.ai/en/stable/examples/vector_stores/ElasticsearchIndexDemo/
+
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.types import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
+from server.stores.tag_store import get_tag_store
+
+FILTER_FIELDS = ("tags", "file_type", "url")
+
+
+def get_filter_values(metadata) -> Dict[str, List[str]]:
+    """Filterable metadata values of a document or node, by field. Tags are in the tag store."""
+    url = metadata.get("url_source")
+    if url:
+        file_type = "url"
+    else:
+        # Same type as shown in the knowledge base, the extension without the dot
+        file_type = os.path.splitext(metadata.get("file_name", ""))[1].lstrip(".").lower()
+    return {
+        "file_type": [file_type] if file_type else [],
+        "url": [url] if url else [],
+    }
+
+
+def get_filter_options(catalog_store, tag_store=None) -> Dict[str, List[str]]:
+    """All values that can be filtered on, from the document catalog and the tag store.
+
+    Both answer from their own indexes, without reading the docstore.
+    """
+    return {
+        "tags": (tag_store or get_tag_store()).all_tags(),
+        "file_type": sorted({t.lower() for t in catalog_store.list_types() if t}),
+        "url": catalog_store.list_urls(),
+    }
+
+
+class MetadataIndex:
+    """Inverted index from filter values to the positions of nodes in a corpus."""
+
+    def __init__(self, nodes: Sequence[BaseNode], tag_store=None):
+        self.size = len(nodes)
+        self.tag_store = tag_store  # needed for tag filters only
+        self.node_ids = np.array([node.node_id for node in nodes], dtype=object)
+        self.ref_doc_ids = np.array([node.ref_doc_id for node in nodes], dtype=object)
+        postings = {field: defaultdict(list) for field in FILTER_FIELDS}
+        for i, node in enumerate(nodes):
+            # Tags resolve to ref_doc_ids in the tag store, then to positions from here
+            postings["tags"][node.ref_doc_id].append(i)
+            for field, values in get_filter_values(node.metadata).items():
+                for value in values:
+                    postings[field][value].append(i)
+        self.postings = {
+            field: {
+                value: np.array(positions, dtype=np.intp)
+                for value, positions in values.items()
+            }
+            for field, values in postings.items()
+        }
+
+    def mask(self, filters) -> Optional[np.ndarray]:
+        """Boolean mask of the nodes matching the filters, None if nothing is filtered."""
+        mask = None
+        for field, values in (filters or {}).items():
+            if not values:
+                continue
+            if field not in self.postings:
+                raise ValueError(f"Invalid filter field: {field}")
+            field_mask = np.zeros(self.size, dtype=bool)
+            if field == "tags":
+                if self.tag_store is None:
+                    raise ValueError("Filtering by tags needs a tag store")
+                values = self.tag_store.docs_with_any(values)
+            for value in values:
+                positions = self.postings[field].get(value)
+                if positions is not None:
+                    field_mask[positions] = True
+            mask = field_mask if mask is None else mask & field_mask
+        return mask
+
+
+def vector_filter_kwargs(vector_store, metadata_index: MetadataIndex, mask) -> dict:
+    """VectorIndexRetriever keyword arguments that restrict the search to the masked nodes."""
+    if mask is None:
+        return {}
+    if isinstance(vector_store, SimpleVectorStore):
+        # Only the embeddings of these nodes are compared with the query
+        return {"node_ids": metadata_index.node_ids[mask].tolist()}
+
+    ref_doc_ids = sorted({doc_id for doc_id in metadata_index.ref_doc_ids[mask] if doc_id})
+    if type(vector_store).__name__ == "ElasticsearchStore":
+        # The legacy filter conversion only supports equality, so pass a raw ES filter
+        return {
+            "vector_store_kwargs": {
+                "es_filter": [{"terms": {"metadata.ref_doc_id": ref_doc_ids}}]
+            }
+        }
+    # Translated into a `where` clause on the stored ref_doc_id by Chroma
+    return {
+        "filters": MetadataFilters(
+            filters=[
+                MetadataFilter(
+                    key="ref_doc_id", value=ref_doc_ids, operator=FilterOperator.IN
+                )
+            ]
+        )
+    }
@@ -1,21 +1,44 @@
 # Index management - create, load and insert
 import os
-from llama_index.core import Settings, StorageContext, VectorStoreIndex
+import time
+from llama_index.core import StorageContext, VectorStoreIndex
 from llama_index.core import load_index_from_storage, load_indices_from_storage
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
 from server.utils.file import get_save_dir
-from server.stores.strage_context import STORAGE_CONTEXT
+from server.stores.strage_context import get_storage_context
+from server.stores.tag_store import get_tag_store, normalize_tags
+from server.stores.catalog_store import get_catalog_store
+from server.stores.doc_store import (
+    get_ref_doc_infos,
+    delete_ref_docs,
+    batch_writes,
+    get_round_trips,
+)
+from server.stores.vector_store import delete_vector_nodes
 from server.ingestion import AdvancedIngestionPipeline
-from config import DEV_MODE
+from server.text_splitter import get_text_splitter, DEFAULT_SPLITTER_TYPE
+from config import DEV_MODE, METRICS_ENABLED, DEFAULT_EMBEDDING_MODEL
 
 
 class IndexManager:
     def __init__(self, index_name):
         self.index_name: str = index_name
-        self.storage_context: StorageContext = STORAGE_CONTEXT
         self.index_id: str = None
         self.index: VectorStoreIndex = None
 
+    # Stores are built on first use, not when a session creates its IndexManager
+    @property
+    def storage_context(self) -> StorageContext:
+        return get_storage_context()
+
+    @property
+    def tag_store(self):
+        return get_tag_store()
+
+    @property
+    def catalog_store(self):
+        return get_catalog_store()
+
     def check_index_exists(self):
         indices = load_indices_from_storage(self.storage_context)
         print(f"Loaded {len(indices)} indices")
@@ -27,12 +50,19 @@ class IndexManager:
             return False
 
     def init_index(self, nodes):
-        self.index = VectorStoreIndex(
-            nodes, storage_context=self.storage_context, store_nodes_override=True
-        )  # note: no nodes in doc store if using vector database, set store_nodes_override=True to add nodes to doc store
+        docstore = self.storage_context.docstore
+        round_trips = get_round_trips(docstore)
+        start = time.perf_counter()
+        # 节点逐个写入doc_store，在批量写入块中合并为少量的Redis pipeline
+        with batch_writes(docstore):
+            self.index = VectorStoreIndex(
+                nodes, storage_context=self.storage_context, store_nodes_override=True
+            )  # note: no nodes in doc store if using vector database, set store_nodes_override=True to add nodes to doc store
+        self._record_write("init_index", nodes, start, docstore, round_trips)
         self.index_id = self.index.index_id
         # 无论开发模式还是生产模式，都持久化存储上下文，确保文档正确保存
         self.storage_context.persist()
+        self.tag_store.persist()
         print(f"Created index {self.index.index_id}")
         return self.index
 
@@ -69,24 +99,67 @@ class IndexManager:
 
     def insert_nodes(self, nodes):
         if self.index is not None:
-            self.index.insert_nodes(nodes=nodes)
+            docstore = self.storage_context.docstore
+            round_trips = get_round_trips(docstore)
+            start = time.perf_counter()
+            with batch_writes(docstore):
+                self.index.insert_nodes(nodes=nodes)
+            self._record_write("insert_nodes", nodes, start, docstore, round_trips)
             # 无论开发模式还是生产模式，都持久化存储上下文，确保文档正确保存
             self.storage_context.persist()
+            self.tag_store.persist()
             print(f"Inserted {len(nodes)} nodes into index {self.index.index_id}")
         else:
             self.init_index(nodes=nodes)
         return self.index
 
+    # Print the docstore round trips of a write, and add them to the metrics (server/metrics.py)
+    def _record_write(self, operation, nodes, start, docstore, round_trips):
+        seconds = time.perf_counter() - start
+        if round_trips is not None:
+            round_trips = get_round_trips(docstore) - round_trips
+            print(f"Docstore round trips: {round_trips}")
+        if METRICS_ENABLED:
+            from server.metrics import record_index_write
+
+            record_index_write(operation, len(nodes), seconds, round_trips)
+
+    # Sync the tag store and the document catalog with ingested documents
+    def record_documents(self, documents, nodes, doc_tags=None):
+        doc_tags = {
+            ref_doc_id: self.tag_store.set_tags(ref_doc_id, tags)
+            for ref_doc_id, tags in (doc_tags or {}).items()
+        }
+        self.catalog_store.add_documents(documents, nodes, tags=doc_tags)
+
+    # Set the tags of a catalog row, i.e. of all documents read from one file or URL
+    def set_tags(self, key, tags):
+        tags = normalize_tags(tags)
+        for ref_doc_id in self.catalog_store.get_ref_doc_ids([key]):
+            self.tag_store.set_tags(ref_doc_id, tags)
+        self.tag_store.persist()
+        self.catalog_store.set_tags(key, tags)
+        return tags
+
     # Build index based on documents under 'data' folder
-    def load_dir(self, input_dir, chunk_size, chunk_overlap):
-        Settings.chunk_size = chunk_size
-        Settings.chunk_overlap = chunk_overlap
+    def load_dir(
+        self,
+        input_dir,
+        chunk_size,
+        chunk_overlap,
+        splitter_type=DEFAULT_SPLITTER_TYPE,
+        embedding_model=DEFAULT_EMBEDDING_MODEL,
+    ):
+        text_splitter = get_text_splitter(
+            chunk_size, chunk_overlap, splitter_type, embedding_model
+        )
         documents = SimpleDirectoryReader(
             input_dir=input_dir, recursive=True
         ).load_data()
         if len(documents) > 0:
-            pipeline = AdvancedIngestionPipeline()
+            pipeline = AdvancedIngestionPipeline(text_splitter=text_splitter)
             nodes = pipeline.run(documents=documents)
+            self.record_documents(documents, nodes)
             index = self.insert_nodes(nodes)
             return nodes
         else:
@@ -94,9 +167,17 @@ class IndexManager:
             return []
 
     # get file's directory and create index
-    def load_files(self, uploaded_files, chunk_size, chunk_overlap):
-        Settings.chunk_size = chunk_size
-        Settings.chunk_overlap = chunk_overlap
+    def load_files(
+        self,
+        uploaded_files,
+        chunk_size,
+        chunk_overlap,
+        splitter_type=DEFAULT_SPLITTER_TYPE,
+        embedding_model=DEFAULT_EMBEDDING_MODEL,
+    ):
+        text_splitter = get_text_splitter(
+            chunk_size, chunk_overlap, splitter_type, embedding_model
+        )
         save_dir = get_save_dir()
 
         # 创建文件路径和标签的映射
@@ -114,21 +195,16 @@ class IndexManager:
         print(files)
         documents = SimpleDirectoryReader(input_files=files).load_data()
 
-        # 将标签应用到对应的文档元数据
-        for doc in documents:
-            file_name = doc.metadata.get("file_name")
-            if file_name in file_tags:
-                tags = file_tags[file_name]
-                # 将tags列表转换为逗号分隔的字符串，因为Chroma要求metadata值必须是简单类型
-                tags_str = ", ".join(tags) if tags else ""
-                if hasattr(doc, "extra_info") and isinstance(doc.extra_info, dict):
-                    doc.extra_info["tags"] = tags_str
-                elif hasattr(doc, "metadata") and isinstance(doc.metadata, dict):
-                    doc.metadata["tags"] = tags_str
-
         if len(documents) > 0:
-            pipeline = AdvancedIngestionPipeline()
+            pipeline = AdvancedIngestionPipeline(text_splitter=text_splitter)
             nodes = pipeline.run(documents=documents)
+            # 标签保存在标签索引中，而不是逗号分隔的元数据字符串
+            doc_tags = {
+                doc.doc_id: file_tags[doc.metadata.get("file_name")]
+                for doc in documents
+                if doc.metadata.get("file_name") in file_tags
+            }
+            self.record_documents(documents, nodes, doc_tags)
             index = self.insert_nodes(nodes)
             return nodes
         else:
@@ -138,10 +214,17 @@ class IndexManager:
     # Get URL and create index
     # https://docs.llamaindex.ai/en/stable/examples/data_connectors/WebPageDemo/
     def load_websites(
-        self, websites, chunk_size, chunk_overlap, reader_type="beautifulsoup"
+        self,
+        websites,
+        chunk_size,
+        chunk_overlap,
+        reader_type="beautifulsoup",
+        splitter_type=DEFAULT_SPLITTER_TYPE,
+        embedding_model=DEFAULT_EMBEDDING_MODEL,
     ):
-        Settings.chunk_size = chunk_size
-        Settings.chunk_overlap = chunk_overlap
+        text_splitter = get_text_splitter(
+            chunk_size, chunk_overlap, splitter_type, embedding_model
+        )
 
         # 提取URL列表，保留自定义名称和标签的映射关系
         url_list = []
@@ -181,7 +264,7 @@ class IndexManager:
 
             documents = BeautifulSoupWebReader().load_data(url_list)
 
-        # 将自定义名称和标签应用到对应的文档元数据
+        # 将自定义名称应用到对应的文档元数据
         for doc in documents:
             url = doc.id_
 
@@ -195,20 +278,14 @@ class IndexManager:
                     doc.metadata["title"] = custom_names[url]
                     doc.metadata["custom_name"] = custom_names[url]  # 另外存储一份
 
-            # 更新标签
-            if url in url_tags:
-                tags = url_tags[url]
-                # 将标签列表转换为逗号分隔的字符串，以兼容Chroma向量存储
-                # Chroma要求metadata值必须是简单类型（str, int, float, None）
-                tags_str = ", ".join(tags) if tags else ""
-                if hasattr(doc, "extra_info") and isinstance(doc.extra_info, dict):
-                    doc.extra_info["tags"] = tags_str
-                elif hasattr(doc, "metadata") and isinstance(doc.metadata, dict):
-                    doc.metadata["tags"] = tags_str
-
         if len(documents) > 0:
-            pipeline = AdvancedIngestionPipeline()
+            pipeline = AdvancedIngestionPipeline(text_splitter=text_splitter)
             nodes = pipeline.run(documents=documents)
+            # 标签保存在标签索引中，而不是逗号分隔的元数据字符串
+            doc_tags = {
+                doc.id_: url_tags[doc.id_] for doc in documents if doc.id_ in url_tags
+            }
+            self.record_documents(documents, nodes, doc_tags)
             index = self.insert_nodes(nodes)
             return nodes
         else:
@@ -217,72 +294,57 @@ class IndexManager:
 
     # Delete a document and all related nodes
     def delete_ref_doc(self, ref_doc_id):
-        # 首先检查文档是否真的存在于doc_store中
-        ref_doc_info = self.storage_context.docstore.get_all_ref_doc_info()
-        if ref_doc_id not in ref_doc_info:
+        if not self.delete_ref_docs([ref_doc_id]):
             raise ValueError(
                 f"Document with ID {ref_doc_id} does not exist or has already been deleted."
             )
 
+    # Delete many documents and their nodes, with batched store operations and one persist
+    # Returns the ids of the documents that were found and deleted
+    def delete_ref_docs(self, ref_doc_ids):
+        ref_doc_ids = list(dict.fromkeys(ref_doc_ids))
+        # 只读取要删除的文档信息，而不是所有文档
+        ref_doc_infos = get_ref_doc_infos(self.storage_context.docstore, ref_doc_ids)
+        if len(ref_doc_infos) < len(ref_doc_ids):
+            print(
+                f"{len(ref_doc_ids) - len(ref_doc_infos)} documents do not exist or have already been deleted"
+            )
+
+        # 检查index是否已初始化，如果没有则尝试加载
+        if self.index is None:
+            try:
+                self.load_index()
+            except Exception as e:
+                print(f"Failed to load index: {e}")
+                # 索引加载失败，但我们仍然尝试直接从doc_store删除文档
+
         try:
-            # 检查index是否已初始化，如果没有则尝试加载
-            if self.index is None:
-                try:
-                    self.load_index()
-                except Exception as e:
-                    print(f"Failed to load index: {e}")
-                    # 索引加载失败，但我们仍然尝试直接从doc_store删除文档
+            # 1. 从vector_store中批量删除节点
+            delete_vector_nodes(self.storage_context.vector_store, ref_doc_infos)
 
+            # 2. 从索引结构中删除节点，只写入一次
             if self.index is not None:
-                # 尝试通过索引删除文档（推荐方式）
-                self.index.delete_ref_doc(
-                    ref_doc_id=ref_doc_id, delete_from_docstore=True
-                )
-                print(f"Deleted document {ref_doc_id} through index")
-            else:
-                # 如果索引仍然不可用，尝试直接从doc_store删除文档
-                print(
-                    "Index is not available, attempting to delete directly from doc_store"
+                nodes_dict = self.index.index_struct.nodes_dict
+                for info in ref_doc_infos.values():
+                    for node_id in info.node_ids:
+                        nodes_dict.pop(node_id, None)
+                self.storage_context.index_store.add_index_struct(
+                    self.index.index_struct
                 )
-                # 1. 获取文档的所有节点ID
-                doc_info = ref_doc_info[ref_doc_id]
-                node_ids = doc_info.node_ids
-
-                # 2. 从vector_store中删除节点
-                if (
-                    hasattr(self.storage_context, "vector_store")
-                    and self.storage_context.vector_store is not None
-                ):
-                    try:
-                        self.storage_context.vector_store.delete(node_ids)
-                        print(f"Deleted {len(node_ids)} nodes from vector_store")
-                    except Exception as vs_e:
-                        print(
-                            f"Warning: Failed to delete nodes from vector_store: {vs_e}"
-                        )
-
-                # 3. 从doc_store中删除引用文档信息
-                self.storage_context.docstore.delete_ref_doc(ref_doc_id)
-                print(f"Deleted reference document {ref_doc_id} from doc_store")
-
-                # 4. 从doc_store中删除关联的节点文档
-                for node_id in node_ids:
-                    try:
-                        self.storage_context.docstore.delete_document(node_id)
-                    except Exception as node_e:
-                        print(f"Warning: Failed to delete node {node_id}: {node_e}")
-
-            # 无论哪种方式，都持久化存储上下文
-            self.storage_context.persist()
-            print(f"Successfully deleted document {ref_doc_id} and persisted changes")
 
-        except KeyError as e:
-            # 处理文档ID不存在的情况
-            print(f"Document with ID {ref_doc_id} not found. Error: {e}")
-            raise ValueError(
-                f"Document with ID {ref_doc_id} does not exist or has already been deleted."
-            ) from e
+            # 3. 从doc_store中批量删除引用文档和节点
+            delete_ref_docs(self.storage_context.docstore, ref_doc_infos)
         except Exception as e:
-            # 处理其他可能的异常
-            print(f"Error deleting document {ref_doc_id}: {e}")
-            raise RuntimeError(f"Failed to delete document {ref_doc_id}") from e
+            print(f"Error deleting {len(ref_doc_infos)} documents: {e}")
+            raise RuntimeError(f"Failed to delete {len(ref_doc_infos)} documents") from e
+
+        # 同步删除标签索引和文档目录中的文档，包括已不存在的文档
+        for ref_doc_id in ref_doc_ids:
+            self.tag_store.delete(ref_doc_id)
+        self.catalog_store.delete_ref_docs(ref_doc_ids)
+
+        # 所有删除完成后只持久化一次
+        self.storage_context.persist()
+        self.tag_store.persist()
+        print(f"Successfully deleted {len(ref_doc_infos)} documents and persisted changes")
+        return list(ref_doc_infos)
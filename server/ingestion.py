@@ -2,36 +2,113 @@
 # https://docs.llamaindex.ai/en/stable/api_reference/ingestion/
 # https://docs.llamaindex.ai/en/stable/examples/ingestion/advanced_ingestion_pipeline/
 
+import time
+
+import config
 from llama_index.core import Settings
 from llama_index.core.ingestion import IngestionPipeline, DocstoreStrategy
 from server.splitters import ChineseTitleExtractor
-from server.stores.strage_context import STORAGE_CONTEXT
-from server.stores.ingestion_cache import INGESTION_CACHE
+from server.text_splitter import get_text_splitter
+from server.tokenizer import BM25TokenExtractor
+from server.stores.strage_context import get_storage_context
+from server.stores.doc_store import get_ref_doc_infos, delete_ref_docs, get_round_trips
+from server.stores.ingestion_cache import get_ingestion_cache
 
 class AdvancedIngestionPipeline(IngestionPipeline):
     def __init__(
-        self, 
+        self,
+        text_splitter=None,
+        embed_model=None,
+        title_enhance=True,
+        storage_context=None,
+        cache=None,
     ):
         # Initialize the embedding model, text splitter
-        embed_model = Settings.embed_model
-        text_splitter = Settings.text_splitter
+        # Pass the text splitter per request, see get_text_splitter
+        # The other arguments default to the application's model and stores, benchmarks
+        # pass their own, see benchmarks/bench_ingestion.py
+        embed_model = embed_model or Settings.embed_model
+        text_splitter = text_splitter or get_text_splitter()
+        storage_context = storage_context or get_storage_context()
+
+        transformations = [text_splitter, embed_model]
+        if title_enhance:
+            transformations.append(ChineseTitleExtractor())  # modified Chinese title enhance: zh_title_enhance
+        # BM25 tokens of the final node text, reused by the retriever
+        transformations.append(BM25TokenExtractor())
+        if config.METRICS_ENABLED:
+            # Timed and counted for the ingestion cache hit rate, see server/metrics.py
+            from server.metrics import MeteredTransform
+
+            transformations = [MeteredTransform(transform=t) for t in transformations]
 
         # Call the super class's __init__ method with the necessary arguments
         super().__init__(
-            transformations=[
-                text_splitter,
-                embed_model,
-                ChineseTitleExtractor(), # modified Chinese title enhance: zh_title_enhance
-            ],
-            docstore=STORAGE_CONTEXT.docstore,
-            vector_store=STORAGE_CONTEXT.vector_store,
-            cache=INGESTION_CACHE,
+            transformations=transformations,
+            docstore=storage_context.docstore,
+            vector_store=storage_context.vector_store,
+            cache=cache or get_ingestion_cache(),
             docstore_strategy=DocstoreStrategy.UPSERTS,  # UPSERTS: Update or insert
         )
 
     # If you need to override the run method or add new methods, you can do so here
     def run(self, documents):
         print(f"Load {len(documents)} Documents")
+        round_trips = get_round_trips(self.docstore)
+        calls = [getattr(t, "calls", None) for t in self.transformations]
+        start = time.perf_counter()
         nodes = super().run(documents=documents)
+        seconds = time.perf_counter() - start
         print(f"Ingested {len(nodes)} Nodes")
-        return nodes
\ No newline at end of file
+        if round_trips is not None:
+            round_trips = get_round_trips(self.docstore) - round_trips
+            print(f"Docstore round trips: {round_trips}")
+        if config.METRICS_ENABLED:
+            self._record_metrics(documents, nodes, seconds, round_trips, calls)
+        return nodes
+
+    def _record_metrics(self, documents, nodes, seconds, round_trips, calls):
+        from server.metrics import MeteredTransform, record_ingestion
+
+        # Each step looks up the cache once, and is only called on a miss
+        cache_results = {}
+        if self.cache is not None and not self.disable_cache:
+            for transform, calls_before in zip(self.transformations, calls):
+                if isinstance(transform, MeteredTransform):
+                    cache_results[transform.step] = transform.calls == calls_before
+        record_ingestion(len(documents), len(nodes), seconds, round_trips, cache_results)
+
+    # Upserts with one hash lookup for all documents instead of one per document,
+    # where the docstore supports it (PipelinedRedisDocumentStore in production)
+    def _handle_upserts(self, nodes, store_doc_text=True):
+        if (
+            not hasattr(self.docstore, "get_document_hashes")
+            or self.docstore_strategy != DocstoreStrategy.UPSERTS
+        ):
+            return super()._handle_upserts(nodes, store_doc_text=store_doc_text)
+
+        ref_doc_ids = [node.ref_doc_id or node.id_ for node in nodes]
+        existing_hashes = self.docstore.get_document_hashes(list(dict.fromkeys(ref_doc_ids)))
+        deduped_nodes_to_run = {}
+        changed_ref_doc_ids = []
+        for ref_doc_id, node in zip(ref_doc_ids, nodes):
+            existing_hash = existing_hashes.get(ref_doc_id)
+            if existing_hash == node.hash:
+                continue  # document exists and is unchanged, so skip it
+            if existing_hash and ref_doc_id not in deduped_nodes_to_run:
+                changed_ref_doc_ids.append(ref_doc_id)
+            deduped_nodes_to_run[ref_doc_id] = node
+
+        # Changed documents are replaced, their old nodes are deleted in one batch
+        if changed_ref_doc_ids:
+            delete_ref_docs(
+                self.docstore, get_ref_doc_infos(self.docstore, changed_ref_doc_ids)
+            )
+            if self.vector_store is not None:
+                for ref_doc_id in changed_ref_doc_ids:
+                    self.vector_store.delete(ref_doc_id)
+
+        nodes_to_run = list(deduped_nodes_to_run.values())
+        self.docstore.set_document_hashes({n.id_: n.hash for n in nodes_to_run})
+        self.docstore.add_documents(nodes_to_run, store_text=store_doc_text)
+        return nodes_to_run
\ No newline at end of file
@@ -0,0 +1,217 @@
+# Prometheus metrics
+# https://prometheus.github.io/client_python/
+# https://prometheus.io/docs/instrumenting/exposition_formats/#text-based-format
+# Fed by hooks in server/engine.py (queries, from their QueryTrace), server/ingestion.py
+# (pipeline runs, steps and ingestion cache) and server/index.py (index writes). The LLM
+# registry and Redis pool statistics are read when scraped. The Streamlit app serves them on
+# METRICS_HOST:METRICS_PORT, the API at /metrics. Under gunicorn set PROMETHEUS_MULTIPROC_DIR
+# to an empty directory, so that /metrics adds up the workers, see gunicorn.conf.py. The LLM
+# registry and Redis pool statistics are per worker and left out then.
+#
+# Rates are derived from the counters, e.g. ingested documents per second:
+#   increase(mindspark_ingested_documents_total[1h]) / increase(mindspark_ingestion_duration_seconds_sum[1h])
+# and the embedding cache hit rate from mindspark_ingestion_cache_requests_total{step=~".*Embedding"}.
+import os
+import threading
+import time
+
+from llama_index.core.schema import TransformComponent
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+import config
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+INGESTION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+LLM_PHASES = ("first_token", "generation")
+
+QUERIES = Counter(
+    "mindspark_queries", "Queries answered, by status: ok, error or closed", ["provider", "status"]
+)
+QUERY_DURATION = Histogram(
+    "mindspark_query_duration_seconds",
+    "End-to-end query latency",
+    ["provider"],
+    buckets=LATENCY_BUCKETS,
+)
+QUERY_STAGE_DURATION = Histogram(
+    "mindspark_query_stage_duration_seconds",
+    "Latency of the retrieval legs, fusion, rerank and prompt stages, see server/query_trace.py",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_DURATION = Histogram(
+    "mindspark_llm_duration_seconds",
+    "LLM latency until the first token and from the first to the last token",
+    ["provider", "phase"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "mindspark_llm_tokens", "Streamed answer chunks, about one token each", ["provider"]
+)
+
+INGESTION_RUNS = Counter("mindspark_ingestion_runs", "Ingestion pipeline runs")
+INGESTED_DOCUMENTS = Counter("mindspark_ingested_documents", "Documents ingested")
+INGESTED_NODES = Counter("mindspark_ingested_nodes", "Nodes produced by ingestion")
+INGESTION_DURATION = Histogram(
+    "mindspark_ingestion_duration_seconds", "Ingestion pipeline runs", buckets=INGESTION_BUCKETS
+)
+INGESTION_STEP_DURATION = Histogram(
+    "mindspark_ingestion_step_duration_seconds",
+    "Ingestion steps which were not cached, by transformation",
+    ["step"],
+    buckets=INGESTION_BUCKETS,
+)
+INGESTION_CACHE = Counter(
+    "mindspark_ingestion_cache_requests",
+    "Ingestion cache lookups by transformation and result: hit or miss",
+    ["step", "result"],
+)
+
+INDEX_WRITE_DURATION = Histogram(
+    "mindspark_index_write_duration_seconds",
+    "Nodes written to the index and stores",
+    ["operation"],
+    buckets=INGESTION_BUCKETS,
+)
+INDEX_WRITTEN_NODES = Counter(
+    "mindspark_index_written_nodes", "Nodes written to the index", ["operation"]
+)
+DOCSTORE_ROUND_TRIPS = Counter(
+    "mindspark_docstore_round_trips", "Redis round trips of the docstore", ["operation"]
+)
+
+
+def record_query(trace, tokens: int = 0):
+    provider = trace.provider or "none"
+    status = "ok" if trace.error is None else "closed" if trace.error == "closed" else "error"
+    QUERIES.labels(provider, status).inc()
+    if trace.total is not None:
+        QUERY_DURATION.labels(provider).observe(trace.total)
+    for stage, seconds in trace.stages.items():
+        if stage in LLM_PHASES:
+            LLM_DURATION.labels(provider, stage).observe(seconds)
+        else:
+            QUERY_STAGE_DURATION.labels(stage).observe(seconds)
+    if tokens:
+        LLM_TOKENS.labels(provider).inc(tokens)
+
+
+class MeteredTransform(TransformComponent):
+    """An ingestion step which counts and times its calls, i.e. its ingestion cache misses."""
+
+    transform: TransformComponent
+    calls: int = 0
+
+    @property
+    def step(self) -> str:
+        return self.transform.class_name()
+
+    def to_dict(self, **kwargs):
+        # Cached under the same key as the step itself
+        return self.transform.to_dict(**kwargs)
+
+    def __call__(self, nodes, **kwargs):
+        start = time.perf_counter()
+        nodes = self.transform(nodes, **kwargs)
+        INGESTION_STEP_DURATION.labels(self.step).observe(time.perf_counter() - start)
+        self.calls += 1
+        return nodes
+
+
+def record_ingestion(documents: int, nodes: int, seconds: float, round_trips=None, cache_results=None):
+    """cache_results maps each step to whether its cached result was used."""
+    INGESTION_RUNS.inc()
+    INGESTED_DOCUMENTS.inc(documents)
+    INGESTED_NODES.inc(nodes)
+    INGESTION_DURATION.observe(seconds)
+    if round_trips:
+        DOCSTORE_ROUND_TRIPS.labels("ingestion").inc(round_trips)
+    for step, hit in (cache_results or {}).items():
+        INGESTION_CACHE.labels(step, "hit" if hit else "miss").inc()
+
+
+def record_index_write(operation: str, nodes: int, seconds: float, round_trips=None):
+    INDEX_WRITTEN_NODES.labels(operation).inc(nodes)
+    INDEX_WRITE_DURATION.labels(operation).observe(seconds)
+    if round_trips:
+        DOCSTORE_ROUND_TRIPS.labels(operation).inc(round_trips)
+
+
+class StatsCollector(Collector):
+    """Statistics kept by the LLM registry and the Redis pool, read at each scrape."""
+
+    def collect(self):
+        from server.models.llm_registry import get_registry_stats
+        from server.stores.redis_pool import get_pool_stats
+
+        stats = get_registry_stats()
+        requests = CounterMetricFamily(
+            "mindspark_llm_registry_requests", "LLM registry lookups by result", labels=["result"]
+        )
+        requests.add_metric(["hit"], stats["hits"])
+        requests.add_metric(["miss"], stats["misses"])
+        yield requests
+        yield CounterMetricFamily(
+            "mindspark_llm_registry_evictions", "LLMs evicted from the registry", value=stats["evictions"]
+        )
+        yield GaugeMetricFamily("mindspark_llm_registry_size", "LLMs in the registry", value=stats["llms"])
+
+        pool = get_pool_stats()
+        if pool:
+            yield GaugeMetricFamily(
+                "mindspark_redis_pool_connections_in_use", "Redis connections in use", value=pool["in_use"]
+            )
+            yield GaugeMetricFamily(
+                "mindspark_redis_pool_max_connections", "Redis pool size", value=pool["max_connections"]
+            )
+            yield CounterMetricFamily(
+                "mindspark_redis_pool_checkouts", "Redis connections checked out", value=pool["checkouts"]
+            )
+            yield CounterMetricFamily(
+                "mindspark_redis_pool_wait_seconds",
+                "Time spent waiting for a free Redis connection",
+                value=pool["wait_seconds"],
+            )
+
+
+REGISTRY.register(StatsCollector())
+
+
+def generate_metrics():
+    """The metrics in the text format, with their content type."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # The sum over all gunicorn workers, read from their files
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+_server_started = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server():
+    """Serve the metrics on METRICS_HOST:METRICS_PORT, once per process."""
+    global _server_started
+    with _server_lock:
+        if _server_started:
+            return
+        _server_started = True
+        try:
+            start_http_server(config.METRICS_PORT, addr=config.METRICS_HOST)
+            print(f"Serving metrics on http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"Could not serve metrics on port {config.METRICS_PORT}: {e}")
@@ -1,15 +1,21 @@
 # Create embedding models
 # Source: MindSpark
 import os
-from llama_index.core import Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from typing import TYPE_CHECKING
 from config import DEFAULT_EMBEDDING_MODEL, EMBEDDING_MODEL_PATH, MODEL_DIR
 from server.utils.hf_mirror import use_hf_mirror
 import streamlit as st
 
+if TYPE_CHECKING:
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
 
 @st.cache_resource
-def create_embedding_model(model_name=DEFAULT_EMBEDDING_MODEL) -> HuggingFaceEmbedding:
+def create_embedding_model(model_name=DEFAULT_EMBEDDING_MODEL) -> "HuggingFaceEmbedding":
+    # sentence-transformers and torch load with the first model, not at startup
+    from llama_index.core import Settings
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
     try:
         use_hf_mirror()
         model_path = EMBEDDING_MODEL_PATH[model_name]
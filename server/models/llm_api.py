@@ -1,34 +1,48 @@
 # Create LLM with API compatible with OpenAI
 #Source: ThinkRAG
-from llama_index.core import Settings
-from langchain_openai import ChatOpenAI
-from llama_index.llms.langchain import LangChainLLM
+# langchain_openai and the LangChain bridge are imported when a model is created, not at startup
+import hashlib
+from typing import TYPE_CHECKING
+from config import LLM_API_CHECK_TIMEOUT
+from server.models.llm_registry import get_http_client, get_llm, llm_key
+from server.models.provider_status import PROVIDER_STATUS
 
-def create_openai_llm(model_name:str, api_base:str, api_key:str, temperature:float = 0.5, system_prompt:str = None) -> ChatOpenAI:
-    try:
-        llm = LangChainLLM(
-            llm=ChatOpenAI(
-                openai_api_base=api_base, 
-                openai_api_key=api_key,
-                model_name=model_name,
-                temperature=temperature,
-            ),
-            system_prompt=system_prompt,
-        )
-        Settings.llm = llm
-        return llm
-    except Exception as e:
-        print(f"An error occurred while creating the OpenAI compatibale model: {type(e).__name__}: {e}")
-        return None
+if TYPE_CHECKING:
+    from llama_index.llms.langchain import LangChainLLM
+
+def create_openai_llm(model_name:str, api_base:str, api_key:str, temperature:float = 0.5, system_prompt:str = None) -> "LangChainLLM":
+    # Shared by all sessions with the same settings, see server/models/llm_registry.py
+    def build():
+        from langchain_openai import ChatOpenAI
+        from llama_index.llms.langchain import LangChainLLM
+
+        try:
+            return LangChainLLM(
+                llm=ChatOpenAI(
+                    openai_api_base=api_base, 
+                    openai_api_key=api_key,
+                    model_name=model_name,
+                    temperature=temperature,
+                    http_client=get_http_client(),
+                ),
+                system_prompt=system_prompt,
+            )
+        except Exception as e:
+            print(f"An error occurred while creating the OpenAI compatibale model: {type(e).__name__}: {e}")
+            return None
+
+    return get_llm(llm_key("OpenAI", model_name, api_base, temperature, system_prompt, api_key), build)
     
-def check_openai_llm(model_name, api_base, api_key) -> bool:
+def check_openai_llm(model_name, api_base, api_key, timeout: float = LLM_API_CHECK_TIMEOUT) -> bool:
         # Make a simple API call to verify the key
+    from langchain_openai import ChatOpenAI
+
     try:
         llm = ChatOpenAI(
             openai_api_base=api_base, 
             openai_api_key=api_key,
             model_name=model_name,
-            timeout=5,
+            timeout=timeout,
             max_retries=1
         )
         response = llm.invoke("Hello, World!")
@@ -40,3 +54,14 @@ def check_openai_llm(model_name, api_base, api_key) -> bool:
     except Exception as e:
         print(f"An error occurred while verifying the LLM API: {type(e).__name__}: {e}")
         return False
+
+def get_api_key_status(model_name, api_base, api_key, wait: float = 0.0, force: bool = False):
+    """Cached result of check_openai_llm, checked in the background"""
+    def probe():
+        if not check_openai_llm(model_name, api_base, api_key):
+            raise ValueError(f"{model_name} did not answer at {api_base}")
+        return [model_name]
+
+    # The key is hashed so that it is not kept in the status cache
+    key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+    return PROVIDER_STATUS.get(("LLM API", api_base, model_name, key_hash), probe, wait=wait, force=force)
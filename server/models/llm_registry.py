@@ -0,0 +1,140 @@
+# Shared LLM clients
+# https://www.python-httpx.org/advanced/resource-limits/
+# https://docs.llamaindex.ai/en/stable/module_guides/supporting_modules/settings/#local-configurations
+# create_openai_llm and create_ollama_llm used to build a new client on every settings change
+# and assign it to the global Settings.llm, so concurrent sessions replaced each other's LLM.
+# LLMs are now kept in a registry keyed by provider, model, base URL and settings, shared by
+# all sessions using the same settings, and passed to each query engine explicitly.
+# OpenAI compatible APIs share one HTTP client and Ollama one client per server, so requests
+# reuse keep-alive connections within the limits set in config.py.
+import hashlib
+import threading
+from collections import OrderedDict
+import config
+from server.stores.config_store import CONFIG_STORE
+
+_lock = threading.Lock()
+_llms = OrderedDict()
+_http_client = None
+_ollama_clients = {}
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _http_limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=config.LLM_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_http_client():
+    """httpx client shared by the OpenAI compatible APIs, created on first use."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            import httpx
+
+            _http_client = httpx.Client(
+                limits=_http_limits(), timeout=config.LLM_REQUEST_TIMEOUT
+            )
+        return _http_client
+
+
+def get_ollama_client(base_url: str):
+    """ollama client shared by all models of an Ollama server."""
+    with _lock:
+        client = _ollama_clients.get(base_url)
+        if client is None:
+            from ollama import Client
+
+            client = Client(
+                host=base_url, timeout=config.LLM_REQUEST_TIMEOUT, limits=_http_limits()
+            )
+            _ollama_clients[base_url] = client
+        return client
+
+
+def llm_key(provider, model, api_base, temperature, system_prompt=None, api_key=None):
+    # The API key is hashed so that it is not kept in the registry
+    key_hash = hashlib.sha256(api_key.encode()).hexdigest() if api_key else None
+    return (provider, model, api_base, float(temperature), system_prompt, key_hash)
+
+
+def get_llm(key, factory):
+    """LLM registered under key, built by factory() the first time, None if it fails."""
+    with _lock:
+        llm = _llms.get(key)
+        if llm is not None:
+            _llms.move_to_end(key)
+            _stats["hits"] += 1
+            return llm
+
+    # Built outside the lock, a second session building the same LLM meanwhile keeps the first one
+    llm = factory()
+    if llm is None:
+        return None
+    with _lock:
+        _stats["misses"] += 1
+        llm = _llms.setdefault(key, llm)
+        _llms.move_to_end(key)
+        while len(_llms) > config.LLM_REGISTRY_SIZE:
+            _llms.popitem(last=False)
+            _stats["evictions"] += 1
+    return llm
+
+
+def get_registry_stats() -> dict:
+    with _lock:
+        return {"llms": len(_llms), "ollama_servers": len(_ollama_clients), **_stats}
+
+
+# The LLM selected in the UI, for callers outside a Streamlit session (API, batch queries)
+DEFAULT_LLM_SETTINGS = {
+    "temperature": config.TEMPERATURE,
+    "system_prompt": config.SYSTEM_PROMPT,
+    "top_k": config.TOP_K,
+    "response_mode": config.DEFAULT_RESPONSE_MODE,
+    "use_reranker": config.USE_RERANKER,
+    "top_n": config.RERANKER_MODEL_TOP_N,
+    "embedding_model": config.DEFAULT_EMBEDDING_MODEL,
+    "reranker_model": config.DEFAULT_RERANKER_MODEL,
+}
+
+
+def get_llm_settings() -> dict:
+    """LLM settings saved by the UI, see frontend/state.py init_llm_settings."""
+    return {**DEFAULT_LLM_SETTINGS, **(CONFIG_STORE.get(key="current_llm_settings") or {})}
+
+
+def create_configured_llm():
+    """The LLM selected in the UI, returns (service provider, LLM), LLM is None if unavailable."""
+    from server.models.llm_api import create_openai_llm
+    from server.models.ollama import create_ollama_llm
+
+    info = CONFIG_STORE.get(key="current_llm_info")
+    if info is None:
+        return None, None
+    settings = get_llm_settings()
+    provider = info["service_provider"]
+    if provider == "Ollama":
+        api_url = CONFIG_STORE.get(key="Ollama_api_url") or {}
+        llm = create_ollama_llm(
+            model=info["model"],
+            temperature=settings["temperature"],
+            system_prompt=settings["system_prompt"],
+            base_url=api_url.get("Ollama_api_url", config.OLLAMA_API_URL),
+        )
+    elif info.get("api_key_valid"):
+        llm = create_openai_llm(
+            model_name=info["model"],
+            api_base=info["api_base"],
+            api_key=info["api_key"],
+            temperature=settings["temperature"],
+            system_prompt=settings["system_prompt"],
+        )
+    else:
+        llm = None
+    return provider, llm
@@ -1,44 +1,68 @@
+from typing import TYPE_CHECKING
 import requests
 import streamlit as st
-from ollama import Client
-from llama_index.core import Settings
-from llama_index.llms.ollama import Ollama
-
-def is_alive():
-    try:
-        response = requests.get(st.session_state.ollama_api_url)
-        return response.status_code == 200
-    except requests.exceptions.RequestException:
-        print("Failed to connect to Ollama")
-        return False
-
-def get_model_list():
-    st.session_state.ollama_models = []
-    if is_alive():
-        client = Client(host=st.session_state.ollama_api_url)
-        response = client.list()
-        models = response["models"]
-        # Initialize the list of model names
-        for model in models:
-            st.session_state.ollama_models.append(model["name"])
-        return response["models"]
+from config import LLM_REQUEST_TIMEOUT, OLLAMA_CHECK_TIMEOUT
+from server.models.llm_registry import get_llm, get_ollama_client, llm_key
+from server.models.provider_status import PROVIDER_STATUS
+
+# The LlamaIndex integration is imported on first use, not at startup
+if TYPE_CHECKING:
+    from llama_index.llms.ollama import Ollama
+
+def list_models(api_url: str, timeout: float = OLLAMA_CHECK_TIMEOUT) -> list:
+    # Same endpoint as ollama.Client.list(), raises if Ollama is not reachable
+    response = requests.get(f"{api_url.rstrip('/')}/api/tags", timeout=timeout)
+    response.raise_for_status()
+    return [model["name"] for model in response.json()["models"]]
+
+def get_status(wait: float = 0.0, force: bool = False):
+    """Cached status of the Ollama server in the session, checked in the background"""
+    api_url = st.session_state.ollama_api_url
+    return PROVIDER_STATUS.get(("Ollama", api_url), lambda: list_models(api_url), wait=wait, force=force)
+
+def is_checking() -> bool:
+    return PROVIDER_STATUS.is_checking(("Ollama", st.session_state.ollama_api_url))
+
+def is_alive(wait: float = OLLAMA_CHECK_TIMEOUT) -> bool:
+    status = get_status(wait=wait)
+    return status is not None and status.alive
+
+def get_model_list(wait: float = OLLAMA_CHECK_TIMEOUT, force: bool = True):
+    # Refresh by default, pass wait=0 and force=False to only read the cached list
+    status = get_status(wait=wait, force=force)
+    if status is not None and status.alive:
+        models = list(status.models)
+        st.session_state.ollama_models = models
+        # The list may arrive after the session started, select the first model like before
+        selected = st.session_state.get("ollama_model_selected")
+        if models and selected not in models:
+            st.session_state.ollama_model_selected = models[0]
+        return status.models
     else:
-        print("Ollama is not alive")
+        st.session_state.ollama_models = []
+        print("Ollama is not alive" if status is not None else "Ollama is being checked")
         return None
 
-# Create Ollama LLM
-def create_ollama_llm(model:str, temperature:float = 0.5, system_prompt:str = None) -> Ollama:
-    try:
-        llm = Ollama(
-            model=model, 
-            base_url=st.session_state.ollama_api_url, 
-            request_timeout=600,
-            temperature=temperature,
-            system_prompt=system_prompt,
-            )
-        print(f"created ollama model for query: {model}")
-        Settings.llm = llm
-        return llm
-    except Exception as e:
-        print(f"An error occurred while creating Ollama LLM: {e}")
-        return None
+# Create Ollama LLM, shared by all sessions with the same settings
+def create_ollama_llm(model:str, temperature:float = 0.5, system_prompt:str = None, base_url:str = None) -> "Ollama":
+    base_url = base_url or st.session_state.ollama_api_url
+
+    def build():
+        from llama_index.llms.ollama import Ollama
+
+        try:
+            llm = Ollama(
+                model=model, 
+                base_url=base_url, 
+                request_timeout=LLM_REQUEST_TIMEOUT,
+                temperature=temperature,
+                system_prompt=system_prompt,
+                client=get_ollama_client(base_url),
+                )
+            print(f"created ollama model for query: {model}")
+            return llm
+        except Exception as e:
+            print(f"An error occurred while creating Ollama LLM: {e}")
+            return None
+
+    return get_llm(llm_key("Ollama", model, base_url, temperature, system_prompt), build)
@@ -0,0 +1,86 @@
+# Background status checks of the LLM providers
+# Checking Ollama or an API key used to block the first render of every session: a request
+# to Ollama without a timeout and a real LLM call to validate the key. Checks now run in a
+# small thread pool with short timeouts, results are cached per provider for
+# PROVIDER_STATUS_TTL seconds and callers read the cached status without waiting.
+# https://docs.python.org/3/library/concurrent.futures.html
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Callable, Hashable, List, NamedTuple, Optional
+
+from config import PROVIDER_STATUS_TTL, PROVIDER_STATUS_WORKERS
+
+
+class ProviderStatus(NamedTuple):
+    alive: bool
+    models: List[str]
+    error: Optional[str]
+    checked_at: float  # time.monotonic() of the check
+
+    def age(self) -> float:
+        return time.monotonic() - self.checked_at
+
+
+class ProviderStatusService:
+    """Runs provider checks in the background and caches their results with a TTL.
+
+    A probe returns the models the provider serves and raises if it is not usable.
+    Concurrent requests for the same key share one probe.
+    """
+
+    def __init__(self, ttl: float = PROVIDER_STATUS_TTL, max_workers: int = PROVIDER_STATUS_WORKERS):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provider-status")
+        self._lock = threading.Lock()
+        self._statuses = {}
+        self._pending = {}
+
+    def get(
+        self,
+        key: Hashable,
+        probe: Callable[[], List[str]],
+        wait: Optional[float] = 0.0,
+        force: bool = False,
+    ) -> Optional[ProviderStatus]:
+        """Cached status of a provider, None if it was never checked.
+
+        An expired status is returned as is while it is checked again. wait is how many
+        seconds to wait for a running check, None to wait until it is done.
+        """
+        with self._lock:
+            status = self._statuses.get(key)
+            if status is not None and not force and status.age() < self.ttl:
+                return status
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(self._check, key, probe)
+                self._pending[key] = future
+
+        if wait is None or wait > 0:
+            try:
+                future.result(timeout=wait)
+            except TimeoutError:
+                pass
+        with self._lock:
+            return self._statuses.get(key)
+
+    def is_checking(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._pending
+
+    def _check(self, key, probe):
+        start = time.perf_counter()
+        try:
+            status = ProviderStatus(True, list(probe()), None, time.monotonic())
+        except Exception as e:
+            status = ProviderStatus(False, [], f"{type(e).__name__}: {e}", time.monotonic())
+            print(f"Provider {key[0]} is not available: {status.error}")
+        print(f"Provider {key[0]}: checked in {time.perf_counter() - start:.2f}s")
+        with self._lock:
+            self._statuses[key] = status
+            self._pending.pop(key, None)
+        return status
+
+
+PROVIDER_STATUS = ProviderStatusService()
@@ -1,7 +1,7 @@
 # Create Rerank model
 # https://docs.llamaindex.ai/en/stable/examples/node_postprocessor/SentenceTransformerRerank/
 import os
-from llama_index.core.postprocessor import SentenceTransformerRerank
+from typing import TYPE_CHECKING
 from config import (
     DEFAULT_RERANKER_MODEL,
     RERANKER_MODEL_TOP_N,
@@ -10,10 +10,15 @@ from config import (
 )
 from server.utils.hf_mirror import use_hf_mirror
 
+if TYPE_CHECKING:
+    from llama_index.core.postprocessor import SentenceTransformerRerank
+
 
 def create_reranker_model(
     model_name=DEFAULT_RERANKER_MODEL, top_n=RERANKER_MODEL_TOP_N
-) -> SentenceTransformerRerank:
+) -> "SentenceTransformerRerank":
+    from llama_index.core.postprocessor import SentenceTransformerRerank
+
     try:
         use_hf_mirror()
         model_path = RERANKER_MODEL_PATH[model_name]
@@ -0,0 +1,198 @@
+# Per-stage latency of queries
+# https://docs.llamaindex.ai/en/stable/module_guides/observability/instrumentation/
+# https://docs.python.org/3/library/contextvars.html
+# aquery in server/engine.py starts a QueryTrace and makes it current while it retrieves,
+# reranks and synthesizes. A span handler on LlamaIndex's root dispatcher adds the time of the
+# spans below to the current trace, each without the time of the traced spans nested in it,
+# also through untraced spans, so vector_search does not include the query embedding. Worker
+# threads started with asyncio.to_thread see the same trace.
+#   query_embedding  BaseEmbedding.(a)get_query_embedding
+#   vector_search    VectorIndexRetriever.retrieve
+#   bm25             SimpleBM25Retriever.retrieve
+#   fusion           SimpleFusionRetriever._fuse
+#   rerank           rerank_nodes in server/engine.py
+# An event handler marks the start of the LLM request, the remaining stages are measured by
+# astream_answer: llm_wait (free slot of the provider), prompt_build (synthesis until the LLM
+# request), first_token and generation (first to last token). The vector and BM25 searches
+# run concurrently, so the stages may add up to more than the total.
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import (
+    LLMChatStartEvent,
+    LLMCompletionStartEvent,
+)
+from llama_index.core.instrumentation.span.simple import SimpleSpan
+from llama_index.core.instrumentation.span_handlers import BaseSpanHandler
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+import config
+
+STAGES = [
+    "query_embedding",
+    "vector_search",
+    "bm25",
+    "fusion",
+    "rerank",
+    "llm_wait",
+    "prompt_build",
+    "first_token",
+    "generation",
+]
+
+
+class QueryTrace:
+    """Seconds spent in each stage of one query."""
+
+    def __init__(self, provider: str = None):
+        self.provider = provider
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.total: Optional[float] = None
+        self.llm_started: Optional[float] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def mark_llm_start(self):
+        with self._lock:
+            if self.llm_started is None:
+                self.llm_started = time.perf_counter()
+
+    def finish(self, error: str = None):
+        if self.total is not None:
+            return
+        self.total = time.perf_counter() - self.started
+        self.error = error
+        if config.QUERY_TRACE_LOG:
+            print(json.dumps({"query_trace": self.as_dict()}, ensure_ascii=False))
+
+    def as_dict(self) -> dict:
+        return {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "provider": self.provider,
+            "stages": {stage: round(self.stages[stage], 6) for stage in STAGES if stage in self.stages},
+            "total": None if self.total is None else round(self.total, 6),
+            "error": self.error,
+        }
+
+
+_current_trace = contextvars.ContextVar("query_trace", default=None)
+
+
+def current_trace() -> Optional[QueryTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace: Optional[QueryTrace]):
+    """Make trace current, spans and events of this task and its worker threads go to it."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def span_stage(span_name: str, instance: Any) -> Optional[str]:
+    # Imported here, the classes are loaded by the time their spans are entered
+    from llama_index.core.retrievers import VectorIndexRetriever
+    from server.retriever import SimpleBM25Retriever
+
+    if span_name in ("BaseEmbedding.get_query_embedding", "BaseEmbedding.aget_query_embedding"):
+        return "query_embedding"
+    if span_name in ("BaseRetriever.retrieve", "BaseRetriever.aretrieve"):
+        if isinstance(instance, VectorIndexRetriever):
+            return "vector_search"
+        if isinstance(instance, SimpleBM25Retriever):
+            return "bm25"
+    if span_name == "SimpleFusionRetriever._fuse":
+        return "fusion"
+    if span_name == "rerank_nodes":
+        return "rerank"
+    return None
+
+
+class StageSpanHandler(BaseSpanHandler[SimpleSpan]):
+    """Adds the exclusive time of the traced spans to the current QueryTrace."""
+
+    # span id -> [trace, stage or None, parent span id, start, seconds of traced descendants]
+    # All spans of a trace are kept, the traced ones are often nested in untraced spans, e.g.
+    # the query embedding in VectorIndexRetriever._retrieve
+    _spans: Dict[str, list] = PrivateAttr(default_factory=dict)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StageSpanHandler"
+
+    def new_span(self, id_, bound_args, instance=None, parent_span_id=None, tags=None, **kwargs):
+        trace = _current_trace.get()
+        if trace is None:
+            return None
+        # Span ids are the function's qualified name and a UUID
+        stage = span_stage(id_[: -len("-00000000-0000-0000-0000-000000000000")], instance)
+        with self.lock:
+            self._spans[id_] = [trace, stage, parent_span_id, time.perf_counter(), 0.0]
+        # Nothing is kept in open_spans, the handler only needs its own records
+        return None
+
+    def prepare_to_exit_span(self, id_, bound_args, instance=None, result=None, **kwargs):
+        with self.lock:
+            span = self._spans.pop(id_, None)
+            if span is None or span[1] is None:
+                return None
+            trace, stage, parent_id, start, child_seconds = span
+            seconds = time.perf_counter() - start
+            # Credit the time to the nearest traced ancestor, past untraced spans
+            parent = self._spans.get(parent_id)
+            while parent is not None and parent[1] is None:
+                parent = self._spans.get(parent[2])
+            if parent is not None:
+                parent[4] += seconds
+        trace.add(stage, seconds - child_seconds)
+        return None
+
+    def prepare_to_drop_span(self, id_, bound_args, instance=None, err=None, **kwargs):
+        with self.lock:
+            self._spans.pop(id_, None)
+        return None
+
+
+class LLMStartEventHandler(BaseEventHandler):
+    """Marks when the LLM request of the current QueryTrace starts."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LLMStartEventHandler"
+
+    def handle(self, event, **kwargs):
+        if isinstance(event, (LLMChatStartEvent, LLMCompletionStartEvent)):
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.mark_llm_start()
+
+
+_registered = False
+_register_lock = threading.Lock()
+
+
+def register_handlers():
+    """Add the handlers to the root dispatcher, once per process."""
+    global _registered
+    with _register_lock:
+        if _registered:
+            return
+        dispatcher = get_dispatcher()
+        dispatcher.add_span_handler(StageSpanHandler())
+        dispatcher.add_event_handler(LLMStartEventHandler())
+        _registered = True
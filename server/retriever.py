@@ -6,88 +6,226 @@ from llama_index.retrievers.bm25 import BM25Retriever
 
 # A simple BM25 retrieval method, customized for document storage and tokenization
 
-# BM25Retriever's default tokenizer does not support Chinese
+# BM25Retriever's default tokenizer does not support Chinese, and since the bm25s rewrite
+# its tokenizer argument is ignored, so the index is built from jieba tokens here.
 # Reference：https://github.com/run-llama/llama_index/issues/13866
 
-import jieba
+import bm25s
 from typing import List
+from llama_index.core.schema import Document, NodeWithScore
+from llama_index.core.vector_stores.utils import (
+    node_to_metadata_dict,
+    metadata_dict_to_node,
+)
+from server.tokenizer import BM25_ANALYZER, get_corpus_tokens
+from server.filters import MetadataIndex, vector_filter_kwargs
 
 
-def chinese_tokenizer(text: str) -> List[str]:
-    return list(jieba.cut(text))
+class SimpleBM25Retriever(BM25Retriever):
+    def __init__(
+        self,
+        nodes,
+        similarity_top_k=2,
+        analyzer=BM25_ANALYZER,
+        verbose=False,
+        tag_store=None,
+        **kwargs,
+    ):
+        self.stemmer = None
+        self.analyzer = analyzer  # stopwords, punctuation, width and case normalization
+        self.similarity_top_k = similarity_top_k
+        self.corpus = [node_to_metadata_dict(node) for node in nodes]
+        # Tokens were stored on the nodes at ingestion time, see BM25TokenExtractor
+        self.bm25 = bm25s.BM25()
+        self.bm25.index(get_corpus_tokens(nodes, analyzer), show_progress=verbose)
+        # Tags, file types and URLs of the corpus, for query-time filters
+        # (tags are looked up in tag_store, e.g. the application's get_tag_store())
+        self.metadata_index = MetadataIndex(nodes, tag_store=tag_store)
+        self.filter_mask = None
+        super(BM25Retriever, self).__init__(verbose=verbose, **kwargs)
 
+    def set_filters(self, filters):
+        """Only score the nodes matching the filters, returns their mask (None if unfiltered)."""
+        self.filter_mask = self.metadata_index.mask(filters)
+        return self.filter_mask
 
-class SimpleBM25Retriever(BM25Retriever):
     @classmethod
-    def from_defaults(cls, index, similarity_top_k, **kwargs) -> "BM25Retriever":
-        docstore = index.docstore
-        return BM25Retriever.from_defaults(
-            docstore=docstore,
+    def from_defaults(cls, index, similarity_top_k, **kwargs) -> "SimpleBM25Retriever":
+        # Source documents are kept in the docstore too, only their chunks are searched
+        nodes = [
+            node
+            for node in index.docstore.docs.values()
+            if not isinstance(node, Document)
+        ]
+        return cls(
+            nodes=nodes,
             similarity_top_k=similarity_top_k,
             verbose=True,
-            tokenizer=chinese_tokenizer,
             **kwargs,
         )
 
+    def _retrieve(self, query_bundle) -> List[NodeWithScore]:
+        query_tokens = self.analyzer(query_bundle.query_str)
+        mask = self.filter_mask
+        k = min(self.similarity_top_k, len(self.corpus) if mask is None else int(mask.sum()))
+        if not query_tokens or k == 0:
+            return []
+        indexes, scores = self.bm25.retrieve(
+            [query_tokens], k=k, show_progress=self._verbose, weight_mask=mask
+        )
+        return [
+            NodeWithScore(
+                node=metadata_dict_to_node(self.corpus[int(idx)]), score=float(score)
+            )
+            for idx, score in zip(indexes[0], scores[0])
+            if mask is None or mask[idx]
+        ]
+
+
+# Score fusion of several retrievers' results
+# Reference: https://docs.llamaindex.ai/en/stable/examples/retrievers/relative_score_dist_fusion/
+#            https://medium.com/plain-simple-software/distribution-based-score-fusion-dbsf-a-new-approach-to-vector-search-ranking-f87c37488b18
+#            https://plg.uwaterloo.ca/~gvcormac/cormacksigir09-rrf.pdf
+# Results are aligned by node id into NumPy arrays, so normalization, weighting and the
+# top-k selection stay cheap for large candidate pools (top_k 50+) before reranking.
+import numpy as np
+from enum import Enum
+
+
+# Three different modes, from LlamaIndex's source code
+class FUSION_MODES(str, Enum):
+    RECIPROCAL_RANK = "reciprocal_rerank"  # apply reciprocal rank fusion
+    RELATIVE_SCORE = "relative_score"  # apply relative score fusion
+    DIST_BASED_SCORE = "dist_based_score"  # apply distance-based score fusion
+    SIMPLE = "simple"  # simple re-ordering of results based on original scores
+
+
+RRF_K = 60.0  # controls the impact of outlier rankings, value from the original paper
+
+
+def normalize_scores(scores: np.ndarray, mode=FUSION_MODES.RELATIVE_SCORE) -> np.ndarray:
+    """Scale scores to [0, 1] with min-max, or mean +/- 3 std for distribution-based fusion."""
+    if mode == FUSION_MODES.DIST_BASED_SCORE:
+        mean, std = scores.mean(), scores.std()
+        min_score, max_score = mean - 3 * std, mean + 3 * std
+    else:
+        min_score, max_score = scores.min(), scores.max()
+    if max_score == min_score:
+        return np.full_like(scores, 1.0 if max_score > 0 else 0.0)
+    return (scores - min_score) / (max_score - min_score)
+
+
+def fuse_results(
+    results: List[List[NodeWithScore]],
+    weights: List[float],
+    mode=FUSION_MODES.DIST_BASED_SCORE,
+    top_k=None,
+) -> List[NodeWithScore]:
+    """Fuse the results of several retrievers into one ranking of at most top_k nodes.
+
+    results and weights are given per retriever, weights are normalized to sum to 1.
+    Reciprocal rank fusion ignores the weights like LlamaIndex's: weighted, a node found
+    only by the lighter retriever could never outrank the other retriever's candidates.
+    """
+    # Align all results on one array of unique node ids
+    columns = {}
+    fused_nodes = []
+    for nodes in results:
+        for n in nodes:
+            if n.node.node_id not in columns:
+                columns[n.node.node_id] = len(fused_nodes)
+                fused_nodes.append(n.node)
+    if not fused_nodes:
+        return []
+
+    weights = np.asarray(weights, dtype=float)
+    weights = weights / weights.sum()
+    simple = mode == FUSION_MODES.SIMPLE
+    fused = np.full(len(fused_nodes), -np.inf) if simple else np.zeros(len(fused_nodes))
+    for nodes, weight in zip(results, weights):
+        if not nodes:
+            continue
+        cols = np.fromiter((columns[n.node.node_id] for n in nodes), dtype=np.intp, count=len(nodes))
+        scores = np.fromiter((n.score or 0.0 for n in nodes), dtype=float, count=len(nodes))
+        if simple:
+            np.maximum.at(fused, cols, scores)
+            continue
+        if mode == FUSION_MODES.RECIPROCAL_RANK:
+            ranks = np.empty(len(scores))
+            ranks[np.argsort(-scores, kind="stable")] = np.arange(len(scores))
+            contribution = 1.0 / (ranks + RRF_K)
+        elif mode in (FUSION_MODES.RELATIVE_SCORE, FUSION_MODES.DIST_BASED_SCORE):
+            contribution = weight * normalize_scores(scores, mode)
+        else:
+            raise ValueError(f"Invalid fusion mode: {mode}")
+        np.add.at(fused, cols, contribution)
+
+    # Partial sort: only the top_k entries are ordered
+    k = len(fused_nodes) if top_k is None else min(top_k, len(fused_nodes))
+    if k < len(fused_nodes):
+        top = np.argpartition(-fused, k - 1)[:k]
+        top = top[np.argsort(-fused[top], kind="stable")]
+    else:
+        top = np.argsort(-fused, kind="stable")
+    return [NodeWithScore(node=fused_nodes[i], score=float(fused[i])) for i in top]
+
 
 # A simple hybrid retriever method
 # Reference：https://docs.llamaindex.ai/en/stable/examples/retrievers/bm25_retriever/
 
 
-class SimpleHybridRetriever(BaseRetriever):
-    def __init__(self, vector_index, top_k=2):
-        self.top_k = top_k
+def create_hybrid_retrievers(vector_index, similarity_top_k, filters=None, tag_store=None):
+    """Vector and BM25 retrievers over the same index, both restricted to the filters.
 
-        # Build vector retriever from vector index
-        self.vector_retriever = VectorIndexRetriever(
-            index=vector_index,
-            similarity_top_k=top_k,
-            verbose=True,
-        )
+    Returns the two retrievers and whether any node matches the filters.
+    """
+    # Build BM25 retriever from document storage, its metadata index resolves the filters
+    bm25_retriever = SimpleBM25Retriever.from_defaults(
+        index=vector_index,
+        similarity_top_k=similarity_top_k,
+        tag_store=tag_store,
+    )
+    mask = bm25_retriever.set_filters(filters)
 
-        # Build BM25 retriever from document storage
-        self.bm25_retriever = SimpleBM25Retriever.from_defaults(
-            index=vector_index,
-            similarity_top_k=top_k,
+    # Build vector retriever from vector index, with the filters pushed into the store query
+    vector_retriever = VectorIndexRetriever(
+        index=vector_index,
+        similarity_top_k=similarity_top_k,
+        verbose=True,
+        **vector_filter_kwargs(
+            vector_index.vector_store, bm25_retriever.metadata_index, mask
+        ),
+    )
+    return vector_retriever, bm25_retriever, mask is None or bool(mask.any())
+
+
+class SimpleHybridRetriever(BaseRetriever):
+    def __init__(
+        self, vector_index, top_k=2, candidate_k=None, filters=None, tag_store=None
+    ):
+        self.top_k = top_k
+        # Each retriever may return a larger candidate pool than the fused top_k
+        candidate_k = max(candidate_k or top_k, top_k)
+        self.vector_retriever, self.bm25_retriever, self.has_matches = (
+            create_hybrid_retrievers(vector_index, candidate_k, filters, tag_store)
         )
 
         super().__init__()
 
     def _retrieve(self, query, **kwargs):
-        bm25_nodes = self.bm25_retriever.retrieve(query, **kwargs)
-
-        # the score is related to the query and may exceed 1, thus normalization is required
-        # calculate min and max value
-        min_score = min(item.score for item in bm25_nodes)
-        max_score = max(item.score for item in bm25_nodes)
-
-        # normalize score
-        if max_score != min_score:
-            normalized_data = [
-                (item.score - min_score) / (max_score - min_score)
-                for item in bm25_nodes
-            ]
-            # Assign normalized score back to the original object
-            for item, normalized_score in zip(bm25_nodes, normalized_data):
-                item.score = normalized_score
-        else:
-            # If all scores are the same, assign uniform normalized score of 0.5
-            for item in bm25_nodes:
-                item.score = 0.5
-
+        if not self.has_matches:
+            return []
         vector_nodes = self.vector_retriever.retrieve(query, **kwargs)
+        bm25_nodes = self.bm25_retriever.retrieve(query, **kwargs)
 
-        # Merge two retrieval results, remove duplicates, and return only the Top_K results
-        all_nodes = []
-        node_ids = set()
-        count = 0
-        for n in vector_nodes + bm25_nodes:
-            if n.node.node_id not in node_ids:
-                all_nodes.append(n)
-                node_ids.add(n.node.node_id)
-                count += 1
-            if count >= self.top_k:
-                break
+        # the BM25 score is related to the query and may exceed 1, so both result lists are
+        # min-max normalized before they are weighted and merged into the Top_K results
+        all_nodes = fuse_results(
+            [vector_nodes, bm25_nodes],
+            weights=[0.6, 0.4],
+            mode=FUSION_MODES.RELATIVE_SCORE,
+            top_k=self.top_k,
+        )
         for node in all_nodes:
             print(
                 f"Hybrid Retrieved Node: {node.node_id} - Score: {node.score:.2f} - {node.text[:10]}...\n-----"
@@ -96,37 +234,32 @@ class SimpleHybridRetriever(BaseRetriever):
 
 
 # Fusion retriever method
-# Reference: https://docs.llamaindex.ai/en/stable/examples/retrievers/relative_score_dist_fusion/
-#            https://medium.com/plain-simple-software/distribution-based-score-fusion-dbsf-a-new-approach-to-vector-search-ranking-f87c37488b18
-#            https://docs.llamaindex.ai/en/stable/examples/low_level/fusion_retriever/?h=retrieverqueryengine
+# Reference: https://docs.llamaindex.ai/en/stable/examples/low_level/fusion_retriever/?h=retrieverqueryengine
+import asyncio
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.llms import MockLLM
 from llama_index.core.retrievers import QueryFusionRetriever
-from enum import Enum
 
-
-# Three different modes, from LlamaIndex's source code
-class FUSION_MODES(str, Enum):
-    RECIPROCAL_RANK = "reciprocal_rerank"  # apply reciprocal rank fusion
-    RELATIVE_SCORE = "relative_score"  # apply relative score fusion
-    DIST_BASED_SCORE = "dist_based_score"  # apply distance-based score fusion
-    SIMPLE = "simple"  # simple re-ordering of results based on original scores
+dispatcher = get_dispatcher(__name__)
 
 
 class SimpleFusionRetriever(QueryFusionRetriever):
-    def __init__(self, vector_index, top_k=2, mode=FUSION_MODES.DIST_BASED_SCORE):
+    def __init__(
+        self,
+        vector_index,
+        top_k=2,
+        mode=FUSION_MODES.DIST_BASED_SCORE,
+        candidate_k=None,
+        filters=None,
+        llm=None,
+        tag_store=None,
+    ):
         self.top_k = top_k
         self.mode = mode
-
-        # Build vector retriever from vector index
-        self.vector_retriever = VectorIndexRetriever(
-            index=vector_index,
-            similarity_top_k=top_k,
-            verbose=True,
-        )
-
-        # Build BM25 retriever from document storage
-        self.bm25_retriever = SimpleBM25Retriever.from_defaults(
-            index=vector_index,
-            similarity_top_k=top_k,
+        # Each retriever may return a larger candidate pool than the fused top_k
+        candidate_k = max(candidate_k or top_k, top_k)
+        self.vector_retriever, self.bm25_retriever, self.has_matches = (
+            create_hybrid_retrievers(vector_index, candidate_k, filters, tag_store)
         )
 
         super().__init__(
@@ -134,7 +267,43 @@ class SimpleFusionRetriever(QueryFusionRetriever):
             retriever_weights=[0.6, 0.4],
             similarity_top_k=top_k,
             num_queries=1,  # set this to 1 to disable query generation
+            # Never called without query generation, but resolved from the global
+            # Settings.llm if missing, which is no longer set, see server/models/llm_registry.py
+            llm=llm or MockLLM(),
             mode=mode,
             use_async=True,
             verbose=True,
         )
+
+    # Query generation is disabled, so there is one result list per retriever to fuse
+    # (a span, traced as the fusion stage of a query, see server/query_trace.py)
+    @dispatcher.span
+    def _fuse(self, query_bundle, results):
+        return fuse_results(
+            [results[(query_bundle.query_str, i)] for i in range(len(self._retrievers))],
+            weights=self._retriever_weights,
+            mode=self.mode,
+            top_k=self.similarity_top_k,
+        )
+
+    def _retrieve(self, query_bundle):
+        if not self.has_matches:
+            return []
+        if self.use_async:
+            results = self._run_nested_async_queries([query_bundle])
+        else:
+            results = self._run_sync_queries([query_bundle])
+        return self._fuse(query_bundle, results)
+
+    async def _aretrieve(self, query_bundle):
+        if not self.has_matches:
+            return []
+        # The embedding model, BM25 and most vector stores are synchronous, so both
+        # retrievers run concurrently in worker threads and never block the event loop
+        results = await asyncio.gather(
+            *(asyncio.to_thread(r.retrieve, query_bundle) for r in self._retrievers)
+        )
+        return self._fuse(
+            query_bundle,
+            {(query_bundle.query_str, i): nodes for i, nodes in enumerate(results)},
+        )
@@ -1,3 +1,19 @@
-from .chinese_text_splitter import ChineseTextSplitter
-from .zh_title_enhance import ChineseTitleExtractor
-from .chinese_recursive_text_splitter import ChineseRecursiveTextSplitter
\ No newline at end of file
+# Splitters are imported when first used, so selecting one does not load the others
+# (langchain for the Chinese splitters, spaCy for SpacySentenceSplitter)
+# https://peps.python.org/pep-0562/
+from importlib import import_module
+
+_SPLITTER_MODULES = {
+    "ChineseTextSplitter": ".chinese_text_splitter",
+    "ChineseTitleExtractor": ".zh_title_enhance",
+    "ChineseRecursiveTextSplitter": ".chinese_recursive_text_splitter",
+    "SpacySentenceSplitter": ".spacy_text_splitter",
+}
+
+__all__ = list(_SPLITTER_MODULES)
+
+
+def __getattr__(name):
+    if name not in _SPLITTER_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_SPLITTER_MODULES[name], __name__), name)
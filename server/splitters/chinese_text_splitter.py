@@ -5,58 +5,74 @@ from langchain.text_splitter import CharacterTextSplitter
 import re
 from typing import List
 
+# Patterns are compiled once at import time, split_text runs for every document
+PDF_NEWLINES_RE = re.compile(r"\n{3,}")
+PDF_WHITESPACE_RE = re.compile(r"\s")
+SENT_SEP_RE = re.compile('([﹒﹔﹖﹗．。！？]["’”」』]{0,2}|(?=["‘“「『]{1,2}|$))')  # del ：；
+
+# Sentence-level delimiters, applied in order to the whole text
+SENTENCE_RULES = [
+    (re.compile(r'([;；.!?。！？\?])([^”’])'), r"\1\n\2"),  # Single-character delimiter
+    (re.compile(r'(\.{6})([^"’”」』])'), r"\1\n\2"),  # English ellipsis
+    (re.compile(r'(\…{2})([^"’”」』])'), r"\1\n\2"),  # Chinese ellipsis
+    # If there is an ending punctuation before the double quotes, then the double quotes are considered to be the end of the sentence.
+    # Place the sentence delimiter \n after the double quotes, and be aware that the double quotes in the previous sentences are preserved.
+    (re.compile(r'([;；!?。！？\?]["’”」』]{0,2})([^;；!?，。！？\?])'), r"\1\n\2"),
+]
+
+# Fallback delimiters for sentences longer than sentence_size, from coarse to fine:
+# commas, then runs of spaces, then single spaces
+LONG_SENTENCE_RULES = [
+    (re.compile(r'([,，.]["’”」』]{0,2})([^,，.])'), r"\1\n\2"),
+    (re.compile(r'([\n]{1,}| {2,}["’”」』]{0,2})([^\s])'), r"\1\n\2"),
+    (re.compile(r'( ["’”」』]{0,2})([^ ])'), r"\1\n\2"),
+]
+
+
 class ChineseTextSplitter(CharacterTextSplitter):
     def __init__(self, pdf: bool = False, sentence_size: int = 250, **kwargs):
         super().__init__(**kwargs)
         self.pdf = pdf
         self.sentence_size = sentence_size
 
+    def _clean_pdf_text(self, text: str) -> str:
+        text = PDF_NEWLINES_RE.sub("\n", text)
+        text = PDF_WHITESPACE_RE.sub(" ", text)
+        return text.replace("\n\n", "")
+
     def split_text1(self, text: str) -> List[str]:
         if self.pdf:
-            text = re.sub(r"\n{3,}", "\n", text)
-            text = re.sub('\s', ' ', text)
-            text = text.replace("\n\n", "")
-        sent_sep_pattern = re.compile('([﹒﹔﹖﹗．。！？]["’”」』]{0,2}|(?=["‘“「『]{1,2}|$))')  # del ：；
+            text = self._clean_pdf_text(text)
         sent_list = []
-        for ele in sent_sep_pattern.split(text):
-            if sent_sep_pattern.match(ele) and sent_list:
+        for ele in SENT_SEP_RE.split(text):
+            if SENT_SEP_RE.match(ele) and sent_list:
                 sent_list[-1] += ele
             elif ele:
                 sent_list.append(ele)
         return sent_list
 
-    def split_text(self, text: str) -> List[str]:   ## Need further logical optimization here
+    def _split_long_sentence(self, sentence: str, level: int, out: List[str]) -> None:
+        # Sentences within sentence_size, or with no finer delimiter left, are kept as they are
+        if len(sentence) <= self.sentence_size or level == len(LONG_SENTENCE_RULES):
+            if sentence:
+                out.append(sentence)
+            return
+        pattern, repl = LONG_SENTENCE_RULES[level]
+        for piece in pattern.sub(repl, sentence).split("\n"):
+            self._split_long_sentence(piece, level + 1, out)
+
+    def split_text(self, text: str) -> List[str]:
         if self.pdf:
-            text = re.sub(r"\n{3,}", r"\n", text)
-            text = re.sub('\s', " ", text)
-            text = re.sub("\n\n", "", text)
-
-        text = re.sub(r'([;；.!?。！？\?])([^”’])', r"\1\n\2", text)  # Single-character delimiter
-        text = re.sub(r'(\.{6})([^"’”」』])', r"\1\n\2", text)  # English ellipsis
-        text = re.sub(r'(\…{2})([^"’”」』])', r"\1\n\2", text)  # Chinese ellipsis
-        text = re.sub(r'([;；!?。！？\?]["’”」』]{0,2})([^;；!?，。！？\?])', r'\1\n\2', text)
-        # If there is an ending punctuation before the double quotes, then the double quotes are considered to be the end of the sentence.
-        # Place the sentence delimiter \n after the double quotes, and be aware that the double quotes in the previous sentences are preserved.
+            text = self._clean_pdf_text(text)
+
+        for pattern, repl in SENTENCE_RULES:
+            text = pattern.sub(repl, text)
         text = text.rstrip()  # Remove the extra \n at the end of the paragraph(if any)
         # Semicolons was not considered in this case, along with dashes and English double quotes. If needed, all we need is some simple adjustment.
-        ls = [i for i in text.split("\n") if i]
-        for ele in ls:
-            if len(ele) > self.sentence_size:
-                ele1 = re.sub(r'([,，.]["’”」』]{0,2})([^,，.])', r'\1\n\2', ele)
-                ele1_ls = ele1.split("\n")
-                for ele_ele1 in ele1_ls:
-                    if len(ele_ele1) > self.sentence_size:
-                        ele_ele2 = re.sub(r'([\n]{1,}| {2,}["’”」』]{0,2})([^\s])', r'\1\n\2', ele_ele1)
-                        ele2_ls = ele_ele2.split("\n")
-                        for ele_ele2 in ele2_ls:
-                            if len(ele_ele2) > self.sentence_size:
-                                ele_ele3 = re.sub('( ["’”」』]{0,2})([^ ])', r'\1\n\2', ele_ele2)
-                                ele2_id = ele2_ls.index(ele_ele2)
-                                ele2_ls = ele2_ls[:ele2_id] + [i for i in ele_ele3.split("\n") if i] + ele2_ls[
-                                                                                                       ele2_id + 1:]
-                        ele_id = ele1_ls.index(ele_ele1)
-                        ele1_ls = ele1_ls[:ele_id] + [i for i in ele2_ls if i] + ele1_ls[ele_id + 1:]
-
-                id = ls.index(ele)
-                ls = ls[:id] + [i for i in ele1_ls if i] + ls[id + 1:]
-        return ls
+
+        # Single pass over the sentences, long ones are split recursively in place,
+        # so repeated sentences and long documents are handled in linear time
+        sentences: List[str] = []
+        for sentence in text.split("\n"):
+            self._split_long_sentence(sentence, 0, sentences)
+        return sentences
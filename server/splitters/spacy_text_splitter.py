@@ -0,0 +1,122 @@
+# Spacy sentence splitter
+# https://spacy.io/usage/processing-pipelines#disabling
+# https://spacy.io/usage/processing-pipelines#multiprocessing
+# pip install spacy
+# spacy download zh_core_web_sm
+
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Sequence
+from langchain.text_splitter import CharacterTextSplitter
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.node_parser import TextSplitter
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits, default_id_func
+from llama_index.core.schema import BaseNode, Document
+from llama_index.core.utils import get_tqdm_iterable
+from config import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_CHUNK_OVERLAP,
+    SPACY_PIPELINE,
+    SPACY_N_PROCESS,
+    SPACY_BATCH_SIZE,
+)
+
+# Components that do not contribute to sentence boundaries
+UNUSED_COMPONENTS = ["ner", "tagger", "attribute_ruler", "lemmatizer"]
+
+
+@lru_cache(maxsize=None)
+def load_sentence_pipeline(pipeline: str = SPACY_PIPELINE, max_length: int = 1_000_000):
+    """Load a spaCy pipeline reduced to sentence segmentation, once per process."""
+    import spacy
+
+    if pipeline == "sentencizer":
+        # Rule-based, no model download needed
+        nlp = spacy.blank("zh")
+        nlp.add_pipe("sentencizer")
+    else:
+        nlp = spacy.load(pipeline, exclude=UNUSED_COMPONENTS)
+        # The statistical senter is much cheaper than the dependency parser,
+        # trained pipelines ship it disabled
+        if "senter" in nlp.component_names:
+            nlp.enable_pipe("senter")
+            if "parser" in nlp.pipe_names:
+                nlp.disable_pipe("parser")
+        if "tok2vec" in nlp.pipe_names:
+            listeners = set(nlp.get_pipe("tok2vec").listening_components)
+            if not listeners & set(nlp.pipe_names):
+                nlp.disable_pipe("tok2vec")
+    nlp.max_length = max_length
+    print(f"Loaded spaCy pipeline {pipeline}: {nlp.pipe_names}")
+    return nlp
+
+
+class SpacySentenceSplitter(TextSplitter):
+    """Split text on spaCy sentence boundaries and merge sentences into chunks.
+
+    All nodes passed to the parser are sent through `nlp.pipe` as one batch.
+    """
+
+    chunk_size: int = Field(default=DEFAULT_CHUNK_SIZE, gt=0)
+    chunk_overlap: int = Field(default=DEFAULT_CHUNK_OVERLAP, ge=0)
+    pipeline: str = Field(default=SPACY_PIPELINE)
+    n_process: int = Field(default=SPACY_N_PROCESS, gt=0)
+    batch_size: int = Field(default=SPACY_BATCH_SIZE, gt=0)
+
+    _merger: CharacterTextSplitter = PrivateAttr()
+
+    def __init__(
+        self,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+        pipeline: str = SPACY_PIPELINE,
+        n_process: int = SPACY_N_PROCESS,
+        batch_size: int = SPACY_BATCH_SIZE,
+        callback_manager: Optional[CallbackManager] = None,
+        include_metadata: bool = True,
+        include_prev_next_rel: bool = True,
+        id_func: Optional[Callable[[int, Document], str]] = None,
+    ):
+        super().__init__(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            pipeline=pipeline,
+            n_process=n_process,
+            batch_size=batch_size,
+            callback_manager=callback_manager or CallbackManager([]),
+            include_metadata=include_metadata,
+            include_prev_next_rel=include_prev_next_rel,
+            id_func=id_func or default_id_func,
+        )
+        # Merge sentences the same way as LangChain's SpacyTextSplitter
+        self._merger = CharacterTextSplitter(
+            separator="\n\n", chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SpacySentenceSplitter"
+
+    def split_text(self, text: str) -> List[str]:
+        return self.batch_split_text([text])[0]
+
+    def batch_split_text(self, texts: Sequence[str]) -> List[List[str]]:
+        """Split several texts with one nlp.pipe call, returning chunks per text."""
+        nlp = load_sentence_pipeline(self.pipeline)
+        docs = nlp.pipe(texts, n_process=self.n_process, batch_size=self.batch_size)
+        return [
+            self._merger._merge_splits((sent.text for sent in doc.sents), "\n\n")
+            for doc in docs
+        ]
+
+    def _parse_nodes(
+        self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any
+    ) -> List[BaseNode]:
+        splits_per_node = self.batch_split_text([node.get_content() for node in nodes])
+        all_nodes: List[BaseNode] = []
+        nodes_with_progress = get_tqdm_iterable(
+            zip(nodes, splits_per_node), show_progress, "Parsing nodes"
+        )
+        for node, splits in nodes_with_progress:
+            all_nodes.extend(build_nodes_from_splits(splits, node, id_func=self.id_func))
+        return all_nodes
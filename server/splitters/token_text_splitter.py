@@ -0,0 +1,105 @@
+# Token-aware text splitter
+# Chunk length is measured with the embedding model's own tokenizer, so every chunk fits
+# the model window (512 tokens for bge models) instead of being truncated when embedded.
+# https://docs.llamaindex.ai/en/stable/module_guides/loading/node_parsers/modules/#sentencesplitter
+
+import os
+from functools import lru_cache, partial
+from typing import Dict, Iterable
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode, Document, MetadataMode
+from config import DEFAULT_EMBEDDING_MODEL, EMBEDDING_MODEL_PATH, MODEL_DIR
+from server.utils.hf_mirror import use_hf_mirror
+
+# Used when the tokenizer config does not set model_max_length
+DEFAULT_MODEL_MAX_LENGTH = 512
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(model_name=DEFAULT_EMBEDDING_MODEL):
+    """Load the fast (Rust) tokenizer of an embedding model, once per process."""
+    from transformers import AutoTokenizer
+
+    use_hf_mirror()
+    model_path = EMBEDDING_MODEL_PATH.get(model_name, model_name)
+    if MODEL_DIR is not None:
+        path = f"./{MODEL_DIR}/{model_path}"
+        if os.path.exists(path):  # Use local models if the path exists
+            model_path = path
+    tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True)
+    print(f"loaded tokenizer: {model_path}")
+    return tokenizer
+
+
+def get_model_window(tokenizer) -> int:
+    """Number of text tokens the model embeds, excluding special tokens like [CLS]/[SEP]."""
+    max_length = tokenizer.model_max_length
+    if max_length > 100_000:  # transformers uses a huge sentinel when the value is unset
+        max_length = DEFAULT_MODEL_MAX_LENGTH
+    return max_length - tokenizer.num_special_tokens_to_add()
+
+
+def create_token_text_splitter(
+    chunk_size: int, chunk_overlap: int, model_name=DEFAULT_EMBEDDING_MODEL
+) -> SentenceSplitter:
+    """SentenceSplitter with chunk_size/chunk_overlap counted in embedding model tokens.
+
+    chunk_size is capped at the model window, the overlap is scaled down with it.
+    """
+    tokenizer = load_tokenizer(model_name)
+    window = get_model_window(tokenizer)
+    if chunk_size > window:
+        chunk_overlap = chunk_overlap * window // chunk_size
+        chunk_size = window
+
+    return SentenceSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        tokenizer=partial(tokenizer.encode, add_special_tokens=False),
+    )
+
+
+def report_oversized_nodes(
+    nodes: Iterable[BaseNode], model_name=DEFAULT_EMBEDDING_MODEL, batch_size=256
+) -> Dict[str, int]:
+    """Count nodes whose embedded text is longer than the embedding model window."""
+    tokenizer = load_tokenizer(model_name)
+    window = get_model_window(tokenizer)
+    report = {"window": window, "total": 0, "oversized": 0, "max_tokens": 0}
+
+    def count(texts):
+        # Batch encoding runs in parallel inside the Rust tokenizer
+        for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]:
+            report["total"] += 1
+            report["max_tokens"] = max(report["max_tokens"], len(ids))
+            if len(ids) > window:
+                report["oversized"] += 1
+
+    texts = []
+    for node in nodes:
+        if isinstance(node, Document):  # source documents are not embedded
+            continue
+        texts.append(node.get_content(metadata_mode=MetadataMode.EMBED))
+        if len(texts) == batch_size:
+            count(texts)
+            texts = []
+    if texts:
+        count(texts)
+    return report
+
+
+if __name__ == "__main__":
+    # Report how many nodes in the knowledge base are truncated by the embedding model
+    # python -m server.splitters.token_text_splitter [model_name]
+    import sys
+    from server.stores.strage_context import get_storage_context
+
+    model_name = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_EMBEDDING_MODEL
+    report = report_oversized_nodes(
+        get_storage_context().docstore.docs.values(), model_name=model_name
+    )
+    print(
+        f"{report['oversized']} of {report['total']} nodes exceed the "
+        f"{report['window']}-token window of {model_name} "
+        f"(longest: {report['max_tokens']} tokens)"
+    )
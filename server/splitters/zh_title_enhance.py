@@ -3,10 +3,34 @@
 
 from llama_index.core.schema import BaseNode
 from llama_index.core.schema import TransformComponent
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import re
 
 
+# Patterns are compiled once, is_possible_title runs for every node during ingestion
+# Text ending with punctuation is not a title, this covers Chinese punctuation like 。：》 too
+ENDS_IN_PUNCT_RE = re.compile(r"[^\w\s]\Z")
+CHAPTER_MARKER_RE = re.compile(r"第[零一二三四五六七八九十百千万\d]+[章节条]")
+# Common Chinese title prefixes in one alternation: 第一章/第一节, 一、, (1), 1. or 1、, ①
+CHINESE_TITLE_RE = re.compile(
+    r"第[零一二三四五六七八九十百千万\d]+[章节条]"
+    r"|[一二三四五六七八九十]、"
+    r"|\(\d+\)"
+    r"|\d+[\.\、]"
+    r"|[①②③④⑤⑥⑦⑧⑨⑩]"
+)
+
+
+def count_alpha_chars(text: str) -> Tuple[int, int]:
+    """Return the number of non-space characters and of alphabetic characters.
+
+    Chinese characters are alphabetic for str.isalpha, both counts run in C.
+    """
+    total_count = len(text) - sum(map(str.isspace, text))
+    alpha_count = sum(map(str.isalpha, text))
+    return total_count, alpha_count
+
+
 def under_non_alpha_ratio(text: str, threshold: float = 0.5) -> bool:
     """Checks if the proportion of non-alpha characters in the text snippet exceeds a given
     threshold. This helps prevent text like "-----------BREAK---------" from being tagged
@@ -20,19 +44,10 @@ def under_non_alpha_ratio(text: str, threshold: float = 0.5) -> bool:
         If the proportion of non-alpha characters exceeds this threshold, the function
         returns False
     """
-    if not text.strip():
-        return False
-
-    # Count non-space characters
-    total_count = len([char for char in text if char.strip()])
+    total_count, alpha_count = count_alpha_chars(text)
     if total_count == 0:
         return False
-
-    # Count alphabetic characters (including Chinese characters)
-    alpha_count = len([char for char in text if char.strip() and (char.isalpha() or '\u4e00' <= char <= '\u9fff')])
-    
-    ratio = alpha_count / total_count
-    return ratio < threshold
+    return alpha_count / total_count < threshold
 
 
 def is_possible_title(
@@ -51,68 +66,40 @@ def is_possible_title(
     non_alpha_threshold
         The minimum number of alpha characters the text needs to be considered a title
     """
+    stripped = text.strip()
 
     # If the text length is zero, it is not a title
-    if not text.strip():
+    if not stripped:
         return False
 
     # If the text ends with punctuation, it is not a title
-    ENDS_IN_PUNCT_PATTERN = r"[^\w\s]\Z"
-    ENDS_IN_PUNCT_RE = re.compile(ENDS_IN_PUNCT_PATTERN)
     if ENDS_IN_PUNCT_RE.search(text) is not None:
         return False
 
-    # Check if text ends with common Chinese/English punctuation
-    PUNCTUATION_PATTERN = r"[,\.，。：:；;!！?？》〉】\]\)）]\Z"
-    if re.search(PUNCTUATION_PATTERN, text):
-        return False
-
     # The text should not be too long (split by spaces for efficiency)
-    words = text.split()
-    if len(words) > title_max_word_length:
+    if len(text.split()) > title_max_word_length:
         return False
 
     # The ratio of non-alpha characters should not be too high
-    if under_non_alpha_ratio(text, threshold=non_alpha_threshold):
-        return False
-
-    # Prevent flagging salutations or purely numeric text as titles
-    if text.endswith((",", ".", "，", "。", "：", ":")):
+    total_count, alpha_count = count_alpha_chars(text)
+    if alpha_count / total_count < non_alpha_threshold:
         return False
 
+    # Prevent flagging purely numeric text as titles
     if text.isnumeric():
         return False
 
     # Check if the text has meaningful content (not just symbols or numbers)
     # Remove common title markers like "第X章" etc. for content check
-    content_text = re.sub(r'第[零一二三四五六七八九十百千万\d]+[章节条]', '', text)
-    if not content_text.strip():
+    if "第" in text and not CHAPTER_MARKER_RE.sub("", text).strip():
         return False
 
-    # Additional checks for Chinese titles
-    # Chinese titles often contain specific patterns
-    chinese_title_patterns = [
-        r'^第[零一二三四五六七八九十百千万\d]+[章节条]',  # 第一章, 第一节等
-        r'^[一二三四五六七八九十]、',  # 一、标题
-        r'^\(\d+\)',  # (1) 标题
-        r'^\d+[\.\、]',  # 1.标题 或 1、标题
-        r'^[①②③④⑤⑥⑦⑧⑨⑩]',  # 带圈数字
-    ]
-
     # If matches common Chinese title patterns, more likely to be a title
-    for pattern in chinese_title_patterns:
-        if re.match(pattern, text.strip()):
-            return True
+    if CHINESE_TITLE_RE.match(stripped):
+        return True
 
-    # For other text, require it to be relatively short and meaningful
-    if len(text.strip()) <= 50:  # Reasonable length for a title
-        # Check if it contains meaningful text (not just symbols)
-        has_chinese = any('\u4e00' <= char <= '\u9fff' for char in text)
-        has_alpha = any(char.isalpha() for char in text)
-        if has_chinese or has_alpha:
-            return True
-
-    return False
+    # For other text, require it to be relatively short and meaningful (not just symbols)
+    return len(stripped) <= 50 and alpha_count > 0
 
 
 def zh_title_enhance(docs: List[BaseNode]) -> List[BaseNode]:
@@ -153,7 +140,13 @@ def zh_title_enhance(docs: List[BaseNode]) -> List[BaseNode]:
 
 class ChineseTitleExtractor(TransformComponent):
     """LlamaIndex transform component for Chinese title extraction and enhancement."""
-    
+
+    # The ingestion cache keys each step by its class name, the default one is shared by
+    # all components without fields, BM25TokenExtractor would then get this step's cached output
+    @classmethod
+    def class_name(cls) -> str:
+        return "ChineseTitleExtractor"
+
     def __call__(self, nodes, **kwargs):
         """Process nodes to enhance Chinese titles."""
         return zh_title_enhance(nodes)
\ No newline at end of file
@@ -0,0 +1,347 @@
+# Catalog Store
+# One row per file or web page of the knowledge base, for the management page.
+# Listing documents from the docstore means get_all_ref_doc_info(), which loads every ref doc
+# with all its node ids (from Redis in production) on each rerun. The catalog keeps the
+# listed fields in SQLite with indexes, so a page is one indexed query however large the
+# knowledge base is. A file read as several documents (e.g. one per PDF page) is one row.
+import os
+import sqlite3
+from contextlib import closing
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from config import STORAGE_DIR
+from server.stores.lazy import lazy_singleton
+
+DB_PATH = os.path.join(STORAGE_DIR, "catalog.db")
+
+SORT_FIELDS = ("date", "name", "type", "node_count", "size")
+SEARCH_FIELDS = ("tags", "type", "name")
+
+# Bound parameters per statement, well below SQLite's limit
+MAX_VARIABLES = 500
+
+
+def batched(items: Sequence, batch_size=MAX_VARIABLES):
+    for i in range(0, len(items), batch_size):
+        yield items[i : i + batch_size]
+
+
+def placeholders(values) -> str:
+    return ", ".join("?" * len(values))
+
+
+def get_catalog_entry(ref_doc_id: str, metadata: dict) -> dict:
+    """Catalog row of a document: files are keyed by path and web pages by URL."""
+    file_path = metadata.get("file_path")
+    url = metadata.get("url_source")
+    if file_path:
+        name, extension = os.path.splitext(metadata.get("file_name", file_path))
+        return {
+            "key": file_path,
+            "name": os.path.basename(name),
+            "type": extension.lstrip("."),
+            "path": file_path,
+        }
+    return {
+        "key": url or ref_doc_id,
+        "name": metadata.get("title") or url or ref_doc_id,
+        "type": "url" if url else "",
+        "path": url or "",
+    }
+
+
+class CatalogStore:
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.init_database()
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.db_path))
+
+    def init_database(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    key TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    tags TEXT NOT NULL DEFAULT '',
+                    node_count INTEGER NOT NULL DEFAULT 0,
+                    size INTEGER NOT NULL DEFAULT 0
+                );
+                -- ref docs (e.g. PDF pages) of a catalog row
+                CREATE TABLE IF NOT EXISTS document_refs (
+                    ref_doc_id TEXT PRIMARY KEY,
+                    key TEXT NOT NULL,
+                    node_count INTEGER NOT NULL DEFAULT 0,
+                    size INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS document_tags (
+                    key TEXT NOT NULL,
+                    tag TEXT NOT NULL,
+                    PRIMARY KEY (key, tag)
+                );
+                CREATE INDEX IF NOT EXISTS idx_documents_date ON documents (date);
+                CREATE INDEX IF NOT EXISTS idx_documents_name ON documents (name);
+                CREATE INDEX IF NOT EXISTS idx_documents_type ON documents (type);
+                CREATE INDEX IF NOT EXISTS idx_documents_node_count ON documents (node_count);
+                CREATE INDEX IF NOT EXISTS idx_documents_size ON documents (size);
+                CREATE INDEX IF NOT EXISTS idx_document_refs_key ON document_refs (key);
+                CREATE INDEX IF NOT EXISTS idx_document_tags_tag ON document_tags (tag);
+                """
+            )
+            conn.commit()
+
+    def _set_tags(self, conn, key: str, tags: Sequence[str]):
+        conn.execute("DELETE FROM document_tags WHERE key = ?", (key,))
+        conn.executemany(
+            "INSERT INTO document_tags (key, tag) VALUES (?, ?)",
+            [(key, tag) for tag in tags],
+        )
+        conn.execute(
+            "UPDATE documents SET tags = ? WHERE key = ?", (", ".join(tags), key)
+        )
+
+    def _update_counts(self, conn, keys: Iterable[str]):
+        # Documents read from one file all carry its file_size, so the row size is the maximum
+        keys = [(key,) for key in set(keys)]
+        conn.executemany(
+            """
+            UPDATE documents SET
+                node_count = (SELECT COALESCE(SUM(node_count), 0) FROM document_refs r WHERE r.key = documents.key),
+                size = (SELECT COALESCE(MAX(size), 0) FROM document_refs r WHERE r.key = documents.key)
+            WHERE key = ?
+            """,
+            keys,
+        )
+        # Rows without any ref doc left are gone from the knowledge base
+        for (key,) in keys:
+            if conn.execute(
+                "SELECT 1 FROM document_refs WHERE key = ? LIMIT 1", (key,)
+            ).fetchone() is None:
+                conn.execute("DELETE FROM documents WHERE key = ?", (key,))
+                conn.execute("DELETE FROM document_tags WHERE key = ?", (key,))
+
+    def add_documents(self, documents, nodes=(), tags: Optional[Dict[str, List[str]]] = None):
+        """Add or update the rows of ingested documents.
+
+        nodes are counted per document, tags maps ref_doc_ids to their tags.
+        """
+        node_counts = {}
+        for node in nodes:
+            node_counts[node.ref_doc_id] = node_counts.get(node.ref_doc_id, 0) + 1
+        tags = tags or {}
+        rows, refs = [], []
+        for doc in documents:
+            metadata = doc.metadata or {}
+            entry = get_catalog_entry(doc.doc_id, metadata)
+            rows.append(
+                (
+                    entry["key"],
+                    entry["name"],
+                    entry["type"],
+                    entry["path"],
+                    metadata.get("creation_date", ""),
+                )
+            )
+            refs.append(
+                (
+                    doc.doc_id,
+                    entry["key"],
+                    node_counts.get(doc.doc_id, 0),
+                    metadata.get("file_size") or len(doc.text or ""),
+                )
+            )
+        with self._connect() as conn:
+            conn.executemany(
+                """
+                INSERT INTO documents (key, name, type, path, date) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    name = excluded.name, type = excluded.type, path = excluded.path, date = excluded.date
+                """,
+                rows,
+            )
+            # Unchanged documents are skipped by the upsert pipeline and yield no nodes
+            conn.executemany(
+                """
+                INSERT INTO document_refs (ref_doc_id, key, node_count, size) VALUES (?, ?, ?, ?)
+                ON CONFLICT(ref_doc_id) DO UPDATE SET
+                    key = excluded.key, size = excluded.size,
+                    node_count = CASE WHEN excluded.node_count > 0
+                        THEN excluded.node_count ELSE document_refs.node_count END
+                """,
+                refs,
+            )
+            for ref_doc_id, key, _, _ in refs:
+                if ref_doc_id in tags:
+                    self._set_tags(conn, key, tags[ref_doc_id])
+            self._update_counts(conn, [row[0] for row in rows])
+            conn.commit()
+
+    def delete_ref_docs(self, ref_doc_ids: Iterable[str]):
+        ref_doc_ids = list(ref_doc_ids)
+        with self._connect() as conn:
+            keys = []
+            for batch in batched(ref_doc_ids):
+                rows = conn.execute(
+                    f"SELECT key FROM document_refs WHERE ref_doc_id IN ({placeholders(batch)})",
+                    batch,
+                ).fetchall()
+                keys.extend(row[0] for row in rows)
+            conn.executemany(
+                "DELETE FROM document_refs WHERE ref_doc_id = ?",
+                [(ref_doc_id,) for ref_doc_id in ref_doc_ids],
+            )
+            self._update_counts(conn, keys)
+            conn.commit()
+
+    def set_tags(self, key: str, tags: Sequence[str]):
+        with self._connect() as conn:
+            self._set_tags(conn, key, tags)
+            conn.commit()
+
+    def get_ref_doc_ids(self, keys: Sequence[str]) -> List[str]:
+        """ref_doc_ids of the documents read from the given files or URLs."""
+        ref_doc_ids = []
+        with self._connect() as conn:
+            for batch in batched(list(keys)):
+                rows = conn.execute(
+                    f"SELECT ref_doc_id FROM document_refs WHERE key IN ({placeholders(batch)})",
+                    batch,
+                ).fetchall()
+                ref_doc_ids.extend(row[0] for row in rows)
+        return ref_doc_ids
+
+    def list_keys(self, conditions=()) -> List[str]:
+        """Keys of all rows matching the search conditions."""
+        where, params = self._build_where(conditions)
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT key FROM documents {where}", params).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def list_types(self) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT DISTINCT type FROM documents ORDER BY type").fetchall()
+        return [row[0] for row in rows]
+
+    def list_urls(self) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key FROM documents WHERE type = 'url' ORDER BY key"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def list_tags(self) -> List[str]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT DISTINCT tag FROM document_tags ORDER BY tag").fetchall()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _build_where(conditions) -> Tuple[str, list]:
+        """SQL for search conditions [{"logic", "field", "value"}], applied left to right."""
+        where, params = "", []
+        for condition in conditions:
+            field, value = condition["field"], condition["value"]
+            if value == "":
+                continue
+            if field == "tags":
+                # Probing the (key, tag) primary key keeps the scan in sort order
+                clause = "EXISTS (SELECT 1 FROM document_tags t WHERE t.key = documents.key AND t.tag = ?)"
+            elif field == "type":
+                clause = "type = ?"
+            elif field == "name":
+                clause = "name LIKE ? ESCAPE '\\'"
+                value = "%" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            else:
+                raise ValueError(f"Invalid search field: {field}")
+            if not where:
+                where = clause
+            elif condition["logic"] == "OR":
+                where = f"({where}) OR {clause}"
+            elif condition["logic"] == "NOT":
+                where = f"({where}) AND NOT {clause}"
+            else:
+                where = f"({where}) AND {clause}"
+            params.append(value)
+        return (f"WHERE {where}" if where else ""), params
+
+    def query(
+        self,
+        conditions=(),
+        sort_by="date",
+        descending=True,
+        offset=0,
+        limit=12,
+    ) -> Tuple[List[dict], int]:
+        """One page of catalog rows matching the search conditions, and the total match count."""
+        if sort_by not in SORT_FIELDS:
+            raise ValueError(f"Invalid sort field: {sort_by}")
+        where, params = self._build_where(conditions)
+        order = "DESC" if descending else "ASC"
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            total = conn.execute(f"SELECT COUNT(*) FROM documents {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"""
+                SELECT key, name, type, path, date, tags, node_count, size FROM documents {where}
+                ORDER BY {sort_by} {order}, rowid {order} LIMIT ? OFFSET ?
+                """,
+                params + [limit, offset],
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def rebuild(self, ref_doc_info, tag_store=None):
+        """Fill the catalog from the docstore's ref doc info, e.g. for an existing knowledge base."""
+        with self._connect() as conn:
+            keys = set()
+            for ref_doc_id, ref_doc in ref_doc_info.items():
+                metadata = ref_doc.metadata or {}
+                entry = get_catalog_entry(ref_doc_id, metadata)
+                conn.execute(
+                    "INSERT OR IGNORE INTO documents (key, name, type, path, date) VALUES (?, ?, ?, ?, ?)",
+                    (
+                        entry["key"],
+                        entry["name"],
+                        entry["type"],
+                        entry["path"],
+                        metadata.get("creation_date", ""),
+                    ),
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO document_refs (ref_doc_id, key, node_count, size) VALUES (?, ?, ?, ?)",
+                    (
+                        ref_doc_id,
+                        entry["key"],
+                        len(ref_doc.node_ids),
+                        metadata.get("file_size") or 0,
+                    ),
+                )
+                if tag_store is not None and entry["key"] not in keys:
+                    tags = tag_store.get_tags(ref_doc_id)
+                    if tags:
+                        self._set_tags(conn, entry["key"], tags)
+                keys.add(entry["key"])
+            self._update_counts(conn, keys)
+            conn.commit()
+
+
+@lazy_singleton
+def get_catalog_store():
+    catalog_store = CatalogStore()
+    if catalog_store.count() == 0:
+        from server.stores.strage_context import get_storage_context
+        from server.stores.tag_store import get_tag_store
+
+        ref_doc_info = get_storage_context().docstore.get_all_ref_doc_info() or {}
+        if ref_doc_info:
+            catalog_store.rebuild(ref_doc_info, tag_store=get_tag_store())
+            print(f"Built document catalog with {catalog_store.count()} documents")
+    return catalog_store
@@ -2,9 +2,11 @@
 
 from config import DEV_MODE, REDIS_URI, CHAT_STORE_KEY
 import streamlit as st
+from server.stores.lazy import lazy_singleton
 
 
-def create_chat_memory():
+@lazy_singleton
+def get_chat_memory():
 
     if DEV_MODE:
         # Development environment: SimpleChatStore
@@ -29,8 +31,14 @@ def create_chat_memory():
 
         from llama_index.core.memory import ChatMemoryBuffer
         from llama_index.storage.chat_store.redis import RedisChatStore
+        from server.stores.redis_pool import get_async_redis_client, get_redis_client
 
-        redis_chat_store = RedisChatStore(redis_url=REDIS_URI, ttl=3600)
+        redis_chat_store = RedisChatStore(
+            redis_url=REDIS_URI,
+            redis_client=get_redis_client(),
+            aredis_client=get_async_redis_client(),
+            ttl=3600,
+        )
 
         redis_chat_memory = ChatMemoryBuffer.from_defaults(
             token_limit=3000,
@@ -38,6 +46,3 @@ def create_chat_memory():
             chat_store_key=CHAT_STORE_KEY,
         )
         return redis_chat_memory
-
-
-CHAT_MEMORY = create_chat_memory()
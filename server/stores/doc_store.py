@@ -1,15 +1,271 @@
 # Document Store
 # https://docs.llamaindex.ai/en/stable/examples/docstore/MongoDocstoreDemo/
 # https://docs.llamaindex.ai/en/stable/examples/docstore/RedisDocstoreIndexStoreDemo/
+import json
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Sequence
+from llama_index.core.schema import TextNode
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.docstore.types import RefDocInfo
 import config
+from server.stores.lazy import lazy_singleton
 
-if config.MindSpark_ENV == "production":
-    from llama_index.storage.docstore.redis import RedisDocumentStore
 
-    DOC_STORE = RedisDocumentStore.from_host_and_port(
-        host=config.REDIS_HOST, port=config.REDIS_PORT, namespace="think"
-    )
-elif config.MindSpark_ENV == "development":
-    from llama_index.core.storage.docstore import SimpleDocumentStore
+def batched(items: Sequence, batch_size: int):
+    for i in range(0, len(items), batch_size):
+        yield items[i : i + batch_size]
 
-    DOC_STORE = SimpleDocumentStore()
+
+# Round trip counting
+# Every Redis command is one round trip, a pipeline is one round trip per execute.
+class RoundTripCounter:
+    """Proxy of a Redis client that counts the round trips made through it."""
+
+    def __init__(self, client):
+        self._client = client
+        self.round_trips = 0
+
+    def pipeline(self, *args, **kwargs):
+        return CountedPipeline(self._client.pipeline(*args, **kwargs), self)
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def command(*args, **kwargs):
+            self.round_trips += 1
+            return attr(*args, **kwargs)
+
+        return command
+
+
+class CountedPipeline:
+    def __init__(self, pipe, counter: RoundTripCounter):
+        self._pipe = pipe
+        self._counter = counter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._pipe.reset()
+
+    def execute(self, *args, **kwargs):
+        if len(self._pipe):  # an empty pipeline does not reach the server
+            self._counter.round_trips += 1
+        return self._pipe.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._pipe, name)
+
+
+# Pipelined Redis document store
+# https://redis.io/docs/latest/develop/use/pipelining/
+# RedisDocumentStore does one HGET per node for its ref doc info before writing it, and
+# VectorStoreIndex with store_nodes_override calls add_documents once per node, so
+# inserting N nodes costs about 4N round trips. This store reads ref doc infos, hashes and
+# existing nodes with HMGET and writes all collections in pipelines of batch_size keys.
+# Inside batch_writes() the per-node add_documents calls are collected and written at once.
+class PipelinedRedisDocumentStore(KVDocumentStore):
+    def __init__(self, redis_kvstore, namespace=None, batch_size=config.DOCSTORE_BATCH_SIZE):
+        super().__init__(redis_kvstore, namespace=namespace, batch_size=batch_size)
+        # The KV store's own calls go through the counter too
+        self._redis_client = RoundTripCounter(redis_kvstore._redis_client)
+        redis_kvstore._redis_client = self._redis_client
+        self._pending = None  # documents collected by batch_writes, by write options
+
+    @property
+    def round_trips(self) -> int:
+        return self._redis_client.round_trips
+
+    def _get_many(self, keys: List[str], collection: str) -> Dict[str, dict]:
+        """Values of the keys found in a collection, one HMGET per batch."""
+        found = {}
+        for batch in batched(keys, self._batch_size):
+            for key, val in zip(batch, self._redis_client.hmget(collection, batch)):
+                if val is not None:
+                    found[key] = json.loads(val)
+        return found
+
+    def _put_many(self, writes, batch_size=None):
+        """Write (collection, key, value) entries, one pipeline execute per batch."""
+        batch_size = batch_size or self._batch_size
+        with self._redis_client.pipeline(transaction=False) as pipe:
+            for i, (collection, key, val) in enumerate(writes, 1):
+                pipe.hset(collection, key, json.dumps(val))
+                if i % batch_size == 0:
+                    pipe.execute()
+            pipe.execute()
+
+    def _prepare_kv_pairs(self, nodes, allow_update, store_text):
+        if not allow_update:
+            existing = self._get_many([node.node_id for node in nodes], self._node_collection)
+            if existing:
+                raise ValueError(
+                    f"node_id {next(iter(existing))} already exists. "
+                    "Set allow_update to True to overwrite."
+                )
+        ref_doc_ids = list(
+            dict.fromkeys(
+                node.ref_doc_id
+                for node in nodes
+                if isinstance(node, TextNode) and node.ref_doc_id is not None
+            )
+        )
+        ref_doc_infos = {
+            ref_doc_id: self._remove_legacy_info(val)
+            for ref_doc_id, val in self._get_many(ref_doc_ids, self._ref_doc_collection).items()
+        }
+
+        node_kv_pairs = []
+        metadata_kv_pairs = []
+        ref_doc_kv_pairs = {}
+        for node in nodes:
+            ref_doc_info = None
+            if isinstance(node, TextNode) and node.ref_doc_id is not None:
+                # Shared by the nodes of a document, so it collects all their ids
+                ref_doc_info = ref_doc_infos.setdefault(node.ref_doc_id, RefDocInfo())
+            node_kv_pair, metadata_kv_pair, ref_doc_kv_pair = self._get_kv_pairs_for_insert(
+                node, ref_doc_info, store_text
+            )
+            if node_kv_pair is not None:
+                node_kv_pairs.append(node_kv_pair)
+            metadata_kv_pairs.append(metadata_kv_pair)
+            if ref_doc_kv_pair is not None:
+                ref_doc_kv_pairs[ref_doc_kv_pair[0]] = ref_doc_kv_pair  # the last one is complete
+        return node_kv_pairs, metadata_kv_pairs, list(ref_doc_kv_pairs.values())
+
+    def add_documents(self, docs, allow_update=True, batch_size=None, store_text=True):
+        if self._pending is not None:
+            self._pending.setdefault((allow_update, store_text), []).extend(docs)
+            return
+        if not docs:
+            return
+        node_kv_pairs, metadata_kv_pairs, ref_doc_kv_pairs = self._prepare_kv_pairs(
+            docs, allow_update, store_text
+        )
+        self._put_many(
+            [(self._node_collection, key, val) for key, val in node_kv_pairs]
+            + [(self._metadata_collection, key, val) for key, val in metadata_kv_pairs]
+            + [(self._ref_doc_collection, key, val) for key, val in ref_doc_kv_pairs],
+            batch_size=batch_size,
+        )
+
+    def set_document_hashes(self, doc_hashes: Dict[str, str]) -> None:
+        self._put_many(
+            (self._metadata_collection, doc_id, {"doc_hash": doc_hash})
+            for doc_id, doc_hash in doc_hashes.items()
+        )
+
+    def get_document_hashes(self, doc_ids: List[str]) -> Dict[str, str]:
+        """Hashes of the documents found, one HMGET per batch instead of one HGET per id."""
+        metadata = self._get_many(doc_ids, self._metadata_collection)
+        return {
+            doc_id: val["doc_hash"] for doc_id, val in metadata.items() if val.get("doc_hash")
+        }
+
+    @contextmanager
+    def batch_writes(self):
+        """Collect add_documents calls in the block and write them together at the end."""
+        if self._pending is not None:  # nested, the outer block writes
+            yield self
+            return
+        self._pending = {}
+        try:
+            yield self
+        finally:
+            # Also written on errors, the vector store may already hold these nodes
+            pending, self._pending = self._pending, None
+            for (allow_update, store_text), docs in pending.items():
+                self.add_documents(docs, allow_update=allow_update, store_text=store_text)
+
+
+def batch_writes(docstore):
+    """Batch the docstore writes of a block where the docstore supports it."""
+    if isinstance(docstore, PipelinedRedisDocumentStore):
+        return docstore.batch_writes()
+    return nullcontext(docstore)
+
+
+def get_round_trips(docstore):
+    """Redis round trips made by the docstore so far, None if they are not counted."""
+    return getattr(docstore, "round_trips", None)
+
+
+@lazy_singleton
+def get_doc_store():
+    if config.MindSpark_ENV == "production":
+        from server.stores.redis_pool import create_redis_kvstore
+
+        return PipelinedRedisDocumentStore(create_redis_kvstore(), namespace="think")
+    elif config.MindSpark_ENV == "development":
+        from llama_index.core.storage.docstore import SimpleDocumentStore
+
+        return SimpleDocumentStore()
+
+
+# Batched operations on many documents
+# RedisDocumentStore does one round trip per key, and deleting a document rewrites its ref doc
+# info once per node. For bulk deletes the hashes of the KV docstore are read with HMGET and
+# cleared with HDEL in one pipeline per batch. Other KV stores (SimpleKVStore in development)
+# delete key by key, and any other docstore falls back to its own delete_ref_doc.
+
+
+def get_redis_client(docstore):
+    return getattr(getattr(docstore, "_kvstore", None), "_redis_client", None)
+
+
+def get_ref_doc_infos(
+    docstore, ref_doc_ids: List[str], batch_size=config.DOCSTORE_BATCH_SIZE
+) -> Dict[str, RefDocInfo]:
+    """Ref doc info of the given documents, missing documents are left out."""
+    client = get_redis_client(docstore)
+    if client is None:
+        ref_doc_infos = {
+            ref_doc_id: docstore.get_ref_doc_info(ref_doc_id) for ref_doc_id in ref_doc_ids
+        }
+        return {key: val for key, val in ref_doc_infos.items() if val is not None}
+
+    ref_doc_infos = {}
+    for batch in batched(ref_doc_ids, batch_size):
+        for ref_doc_id, val in zip(
+            batch, client.hmget(docstore._ref_doc_collection, batch)
+        ):
+            if val is not None:
+                ref_doc_infos[ref_doc_id] = docstore._remove_legacy_info(json.loads(val))
+    return ref_doc_infos
+
+
+def delete_ref_docs(
+    docstore, ref_doc_infos: Dict[str, RefDocInfo], batch_size=config.DOCSTORE_BATCH_SIZE
+):
+    """Delete documents with all their nodes from the docstore."""
+    kvstore = getattr(docstore, "_kvstore", None)
+    if kvstore is None:
+        for ref_doc_id in ref_doc_infos:
+            docstore.delete_ref_doc(ref_doc_id, raise_error=False)
+        return
+
+    node_ids = [node_id for info in ref_doc_infos.values() for node_id in info.node_ids]
+    ref_doc_ids = list(ref_doc_infos)
+    # Nodes are stored with their hash, ref docs also in the node collection
+    deletes = [
+        (docstore._node_collection, node_ids),
+        (docstore._metadata_collection, node_ids),
+        (docstore._ref_doc_collection, ref_doc_ids),
+        (docstore._metadata_collection, ref_doc_ids),
+        (docstore._node_collection, ref_doc_ids),
+    ]
+    client = get_redis_client(docstore)
+    if client is None:
+        for collection, keys in deletes:
+            for key in keys:
+                kvstore.delete(key, collection=collection)
+        return
+
+    with client.pipeline(transaction=False) as pipe:
+        for collection, keys in deletes:
+            for batch in batched(keys, batch_size):
+                pipe.hdel(collection, *batch)
+        pipe.execute()  # one round trip for all batches
@@ -1,13 +1,16 @@
 # Index Store
 import config
+from server.stores.lazy import lazy_singleton
 
-if config.MindSpark_ENV == "production":
-    from llama_index.storage.index_store.redis import RedisIndexStore
 
-    INDEX_STORE = RedisIndexStore.from_host_and_port(
-        host=config.REDIS_HOST, port=config.REDIS_PORT, namespace="think"
-    )
-elif config.MindSpark_ENV == "development":
-    from llama_index.core.storage.index_store import SimpleIndexStore
+@lazy_singleton
+def get_index_store():
+    if config.MindSpark_ENV == "production":
+        from llama_index.storage.index_store.redis import RedisIndexStore
+        from server.stores.redis_pool import create_redis_kvstore
 
-    INDEX_STORE = SimpleIndexStore()
+        return RedisIndexStore(create_redis_kvstore(), namespace="think")
+    elif config.MindSpark_ENV == "development":
+        from llama_index.core.storage.index_store import SimpleIndexStore
+
+        return SimpleIndexStore()
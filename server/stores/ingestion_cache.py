@@ -1,10 +1,15 @@
-from llama_index.core.ingestion import IngestionCache
-from llama_index.storage.kvstore.redis import RedisKVStore as RedisCache
-from config import REDIS_URI, DEV_MODE
+from config import DEV_MODE
+from server.stores.lazy import lazy_singleton
 
-redis_cache=IngestionCache(
-    cache=RedisCache(redis_uri=REDIS_URI),
-    collection="redis_pipeline_cache",
-)
 
-INGESTION_CACHE = redis_cache if not DEV_MODE else None
\ No newline at end of file
+@lazy_singleton
+def get_ingestion_cache():
+    if DEV_MODE:
+        return None
+    from llama_index.core.ingestion import IngestionCache
+    from server.stores.redis_pool import create_redis_kvstore
+
+    return IngestionCache(
+        cache=create_redis_kvstore(),
+        collection="redis_pipeline_cache",
+    )
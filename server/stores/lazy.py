@@ -0,0 +1,75 @@
+# Lazily built storage singletons
+# The stores used to be built at import, so importing any page opened Chroma, connected to
+# Redis and loaded the development JSON stores before the login page was rendered. Each
+# store is now built by its accessor on first use, once per process, and warm_up() builds
+# them ahead of time, app.py starts it in a background thread once a page is rendered.
+import threading
+import time
+from functools import update_wrapper
+
+
+class LazySingleton:
+    """Accessor building its value on the first call, once also with concurrent sessions."""
+
+    def __init__(self, factory):
+        update_wrapper(self, factory)
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+        self._ready = False
+
+    def __call__(self):
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    start = time.perf_counter()
+                    self._value = self._factory()
+                    self._ready = True
+                    print(f"{self.__name__}: ready in {time.perf_counter() - start:.2f}s")
+        return self._value
+
+    def is_ready(self) -> bool:
+        return self._ready
+
+
+def lazy_singleton(factory) -> LazySingleton:
+    return LazySingleton(factory)
+
+
+def get_warm_up_hooks():
+    """Accessors of all stores, in the order they depend on each other, and jieba."""
+    from server.tokenizer import init_jieba
+    from server.stores.strage_context import get_storage_context
+    from server.stores.tag_store import get_tag_store
+    from server.stores.catalog_store import get_catalog_store
+    from server.stores.ingestion_cache import get_ingestion_cache
+    from server.stores.chat_store import get_chat_memory
+
+    return [
+        get_storage_context,
+        get_tag_store,
+        get_catalog_store,
+        get_ingestion_cache,
+        get_chat_memory,
+        init_jieba,  # its dictionary takes about a second to load
+    ]
+
+
+def warm_up():
+    """Build all stores now rather than on first use."""
+    start = time.perf_counter()
+    for hook in get_warm_up_hooks():
+        hook()
+    print(f"Storage warmed up in {time.perf_counter() - start:.2f}s")
+
+
+_warm_up_thread = None
+
+
+def start_warm_up() -> threading.Thread:
+    """Warm up in a daemon thread, once per process. Accessors called meanwhile wait for it."""
+    global _warm_up_thread
+    if _warm_up_thread is None:
+        _warm_up_thread = threading.Thread(target=warm_up, name="storage-warm-up", daemon=True)
+        _warm_up_thread.start()
+    return _warm_up_thread
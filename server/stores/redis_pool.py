@@ -0,0 +1,155 @@
+# Shared Redis connection pool
+# https://redis.readthedocs.io/en/stable/connections.html#connectionpool
+# https://redis.io/docs/latest/develop/clients/pools-and-muxing/
+# The doc, index, chat and tag stores and the ingestion cache each created their own client,
+# and with it their own connection pool. Now they all share one client over a blocking pool:
+# concurrent sessions wait for a free connection instead of opening new ones, TCP keepalive
+# keeps idle connections open, and idle connections are checked with PING before reuse.
+# The pool counts checkouts, wait time and connections in use, see get_pool_stats.
+# Async calls of the stores (e.g. aget_nodes) go through a second, redis.asyncio client with a
+# pool of the same settings. Its connections belong to the event loop which opened them, the
+# app's query loop (server/engine.py) or the API worker's loop.
+import threading
+import time
+from redis import BlockingConnectionPool, Redis
+from redis.asyncio import BlockingConnectionPool as AsyncBlockingConnectionPool
+from redis.asyncio import Redis as AsyncRedis
+import config
+
+
+class PoolStats:
+    def _init_stats(self):
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def _checked_out(self, start):
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_seconds += time.perf_counter() - start
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def _released(self):
+        with self._stats_lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+
+class MeteredConnectionPool(PoolStats, BlockingConnectionPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_stats()
+
+    def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        connection = super().get_connection(*args, **kwargs)
+        self._checked_out(start)
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        self._released()
+
+    @property
+    def open_connections(self) -> int:
+        return len(self._connections)
+
+    def reset(self):
+        super().reset()
+        self.in_use = 0
+
+
+class MeteredAsyncConnectionPool(PoolStats, AsyncBlockingConnectionPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_stats()
+
+    async def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        connection = await super().get_connection(*args, **kwargs)
+        self._checked_out(start)
+        return connection
+
+    async def release(self, connection):
+        await super().release(connection)
+        self._released()
+
+    @property
+    def open_connections(self) -> int:
+        return len(self._available_connections) + len(self._in_use_connections)
+
+    def reset(self):
+        super().reset()
+        self.in_use = 0
+
+
+def _pool_kwargs():
+    return {
+        "max_connections": config.REDIS_POOL_SIZE,
+        "timeout": config.REDIS_POOL_TIMEOUT,
+        "socket_keepalive": config.REDIS_SOCKET_KEEPALIVE,
+        "health_check_interval": config.REDIS_HEALTH_CHECK_INTERVAL,
+    }
+
+
+_lock = threading.Lock()
+_redis_client = None
+_async_redis_client = None
+
+
+def get_redis_client() -> Redis:
+    """The Redis client shared by all stores, created on first use."""
+    global _redis_client
+    if _redis_client is None:
+        with _lock:
+            if _redis_client is None:
+                pool = MeteredConnectionPool.from_url(config.REDIS_URI, **_pool_kwargs())
+                _redis_client = Redis(connection_pool=pool)
+                print(f"Created Redis connection pool of {config.REDIS_POOL_SIZE} connections")
+    return _redis_client
+
+
+def get_async_redis_client() -> AsyncRedis:
+    """The redis.asyncio client shared by all stores, created on first use."""
+    global _async_redis_client
+    if _async_redis_client is None:
+        with _lock:
+            if _async_redis_client is None:
+                pool = MeteredAsyncConnectionPool.from_url(config.REDIS_URI, **_pool_kwargs())
+                _async_redis_client = AsyncRedis(connection_pool=pool)
+    return _async_redis_client
+
+
+def create_redis_kvstore():
+    """A RedisKVStore on the shared clients. Each store gets its own, they are cheap."""
+    from llama_index.storage.kvstore.redis import RedisKVStore
+
+    return RedisKVStore(
+        redis_uri=config.REDIS_URI,
+        redis_client=get_redis_client(),
+        async_redis_client=get_async_redis_client(),
+    )
+
+
+def get_pool_stats() -> dict:
+    """Utilization of the shared pools, summed, empty until the first Redis store is created."""
+    pools = [
+        client.connection_pool
+        for client in (_redis_client, _async_redis_client)
+        if client is not None
+    ]
+    if not pools:
+        return {}
+    max_connections = sum(pool.max_connections for pool in pools)
+    in_use = sum(pool.in_use for pool in pools)
+    return {
+        "max_connections": max_connections,
+        "created": sum(pool.open_connections for pool in pools),
+        "in_use": in_use,
+        "peak_in_use": sum(pool.peak_in_use for pool in pools),
+        "utilization": in_use / max_connections,
+        "checkouts": sum(pool.checkouts for pool in pools),
+        "wait_seconds": sum(pool.wait_seconds for pool in pools),
+    }
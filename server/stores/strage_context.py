@@ -1,14 +1,14 @@
 # Store context
 # https://docs.llamaindex.ai/en/stable/module_guides/storing/customization/
 # Source: ThinkRAG
-from llama_index.core import StorageContext
 from config import MindSpark_ENV
-from server.stores.doc_store import DOC_STORE
-from server.stores.vector_store import VECTOR_STORE
-from server.stores.index_store import INDEX_STORE
+from server.stores.lazy import lazy_singleton
 
 
-def create_storage_context():
+@lazy_singleton
+def get_storage_context():
+    from llama_index.core import StorageContext
+
     if MindSpark_ENV == "development":
         # Development environment
         import os
@@ -28,12 +28,13 @@ def create_storage_context():
             print(f"Created new storage context")
             return dev_storage_context
     elif MindSpark_ENV == "production":
+        from server.stores.doc_store import get_doc_store
+        from server.stores.vector_store import get_vector_store
+        from server.stores.index_store import get_index_store
+
         pro_storage_context = StorageContext.from_defaults(
-            docstore=DOC_STORE,
-            index_store=INDEX_STORE,
-            vector_store=VECTOR_STORE,
+            docstore=get_doc_store(),
+            index_store=get_index_store(),
+            vector_store=get_vector_store(),
         )
         return pro_storage_context
-
-
-STORAGE_CONTEXT = create_storage_context()
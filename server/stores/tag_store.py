@@ -0,0 +1,170 @@
+# Tag Store
+# Multi-valued tag index of the knowledge base: tag -> ref_doc_ids and ref_doc_id -> tags.
+# Tags used to be written into document metadata as comma separated strings (Chroma only
+# accepts scalar metadata) and were re-split for every listing, search and filter.
+# Here they are kept as sets, so tag listing, search and filtering are set operations.
+# One KV entry per document: {ref_doc_id: {"tags": [...]}}
+# Each process keeps the index in memory. Other processes (the Streamlit app, API workers)
+# change it too, so reads first compare the stored version with the loaded one and reload
+# when it moved: a counter in Redis incremented by every write in production, the modified
+# time of the persisted JSON file in development.
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+import config
+from server.stores.lazy import lazy_singleton
+
+TAG_COLLECTION = "tag_index"
+VERSION_KEY = "tag_index:version"
+META_COLLECTION = "tag_index_meta"
+LEGACY_IMPORT_KEY = "legacy_tags_imported"  # set once the tags in document metadata were imported
+PERSIST_PATH = "./" + config.STORAGE_DIR + "/tag_store.json"
+
+
+def normalize_tags(tags) -> List[str]:
+    """Tags as a list without blanks and duplicates, also accepts a comma separated string."""
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    return list(dict.fromkeys(tag.strip() for tag in tags or [] if tag and tag.strip()))
+
+
+class TagStore:
+    def __init__(self, kvstore, persist_path=None, redis_client=None):
+        self._kvstore = kvstore
+        self._persist_path = persist_path  # None if the KV store persists on write
+        self._redis_client = redis_client  # holds the version in production
+        self._lock = threading.Lock()
+        self._load()
+
+    def _stored_version(self):
+        if self._redis_client is not None:
+            return int(self._redis_client.get(VERSION_KEY) or 0)
+        if self._persist_path is not None and os.path.exists(self._persist_path):
+            return os.stat(self._persist_path).st_mtime_ns
+        return None
+
+    def _load(self):
+        # The version is read first, a write in between only causes another reload
+        self._loaded_version = self._stored_version()
+        if self._redis_client is None and self._loaded_version is not None:
+            from llama_index.core.storage.kvstore import SimpleKVStore
+
+            self._kvstore = SimpleKVStore.from_persist_path(self._persist_path)
+        self.doc_tags: Dict[str, Set[str]] = {}
+        self.tag_docs: Dict[str, Set[str]] = defaultdict(set)
+        for ref_doc_id, val in self._kvstore.get_all(collection=TAG_COLLECTION).items():
+            self._add(ref_doc_id, val.get("tags", []))
+
+    def refresh(self):
+        """Reload the index if another process changed it since it was loaded."""
+        with self._lock:
+            if self._stored_version() != self._loaded_version:
+                self._load()
+
+    def _changed(self):
+        if self._redis_client is not None:
+            version = self._redis_client.incr(VERSION_KEY)
+            # Writes of other processes since the last load are picked up by the next read
+            if version == self._loaded_version + 1:
+                self._loaded_version = version
+
+    def _add(self, ref_doc_id, tags):
+        self.doc_tags[ref_doc_id] = set(tags)
+        for tag in tags:
+            self.tag_docs[tag].add(ref_doc_id)
+
+    def _remove(self, ref_doc_id):
+        for tag in self.doc_tags.pop(ref_doc_id, ()):
+            docs = self.tag_docs[tag]
+            docs.discard(ref_doc_id)
+            if not docs:
+                del self.tag_docs[tag]
+
+    def set_tags(self, ref_doc_id: str, tags) -> List[str]:
+        """Replace the tags of a document, returns the normalized tags."""
+        tags = normalize_tags(tags)
+        self._remove(ref_doc_id)
+        if tags:
+            self._add(ref_doc_id, tags)
+            self._kvstore.put(ref_doc_id, {"tags": tags}, collection=TAG_COLLECTION)
+        else:
+            self._kvstore.delete(ref_doc_id, collection=TAG_COLLECTION)
+        self._changed()
+        return tags
+
+    def delete(self, ref_doc_id: str):
+        if ref_doc_id in self.doc_tags:
+            self._remove(ref_doc_id)
+            self._kvstore.delete(ref_doc_id, collection=TAG_COLLECTION)
+            self._changed()
+
+    def get_tags(self, ref_doc_id: str) -> List[str]:
+        self.refresh()
+        return sorted(self.doc_tags.get(ref_doc_id, ()))
+
+    def all_tags(self) -> List[str]:
+        self.refresh()
+        return sorted(self.tag_docs)
+
+    def docs_with_any(self, tags: Iterable[str]) -> Set[str]:
+        """ref_doc_ids of the documents having at least one of the tags."""
+        self.refresh()
+        return set().union(*(self.tag_docs.get(tag, ()) for tag in tags))
+
+    def docs_with_all(self, tags: Iterable[str]) -> Set[str]:
+        """ref_doc_ids of the documents having every one of the tags."""
+        self.refresh()
+        sets = [self.tag_docs.get(tag, set()) for tag in tags]
+        return set.intersection(*sets) if sets else set()
+
+    def is_empty(self) -> bool:
+        self.refresh()
+        return not self.doc_tags
+
+    def persist(self):
+        if self._persist_path is not None:
+            self._kvstore.persist(persist_path=self._persist_path)
+            self._loaded_version = self._stored_version()
+
+    def legacy_tags_imported(self) -> bool:
+        return self._kvstore.get(LEGACY_IMPORT_KEY, collection=META_COLLECTION) is not None
+
+    def rebuild_from_metadata(self, ref_doc_info):
+        """Import the comma separated tags of documents ingested before the tag store."""
+        for ref_doc_id, ref_doc in ref_doc_info.items():
+            tags = normalize_tags((ref_doc.metadata or {}).get("tags"))
+            if tags:
+                self.set_tags(ref_doc_id, tags)
+        self.mark_legacy_tags_imported()
+
+    def mark_legacy_tags_imported(self):
+        self._kvstore.put(LEGACY_IMPORT_KEY, {"done": True}, collection=META_COLLECTION)
+        self.persist()
+
+
+@lazy_singleton
+def get_tag_store():
+    if config.MindSpark_ENV == "production":
+        from server.stores.redis_pool import create_redis_kvstore, get_redis_client
+
+        tag_store = TagStore(create_redis_kvstore(), redis_client=get_redis_client())
+    else:
+        from llama_index.core.storage.kvstore import SimpleKVStore
+
+        # Loaded from PERSIST_PATH when it exists, see TagStore._load
+        tag_store = TagStore(SimpleKVStore(), persist_path=PERSIST_PATH)
+
+    # Scans the whole docstore, so only once per knowledge base: most have no tags at all
+    if not tag_store.legacy_tags_imported():
+        if tag_store.is_empty():
+            from server.stores.strage_context import get_storage_context
+
+            ref_doc_info = get_storage_context().docstore.get_all_ref_doc_info() or {}
+            tag_store.rebuild_from_metadata(ref_doc_info)
+            if not tag_store.is_empty():
+                print(f"Imported tags of {len(tag_store.doc_tags)} documents into the tag store")
+        else:
+            # Imported before the marker existed
+            tag_store.mark_legacy_tags_imported()
+    return tag_store
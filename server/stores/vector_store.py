@@ -4,9 +4,11 @@
 # https://docs.llamaindex.ai/en/stable/module_guides/storing/customization/
 
 import config
+from server.stores.lazy import lazy_singleton
 
 
-def create_vector_store(type=config.DEFAULT_VS_TYPE):
+def create_vector_store(type=config.DEFAULT_VS_TYPE, name=None):
+    # name replaces the default collection, index or table, e.g. for benchmarks
     if type == "chroma":
         # Vector database Chroma
 
@@ -16,8 +18,14 @@ def create_vector_store(type=config.DEFAULT_VS_TYPE):
         import chromadb
         from llama_index.vector_stores.chroma import ChromaVectorStore
 
-        db = chromadb.PersistentClient(path=".chroma")
-        chroma_collection = db.get_or_create_collection("think")
+        if config.CHROMA_HOST:
+            # Chroma server, shared by the Streamlit app and all API workers
+            # https://docs.trychroma.com/deployment/client-server-mode
+            db = chromadb.HttpClient(host=config.CHROMA_HOST, port=config.CHROMA_PORT)
+        else:
+            # Embedded in this process, which must then be the only one using .chroma
+            db = chromadb.PersistentClient(path=".chroma")
+        chroma_collection = db.get_or_create_collection(name or "think")
         chroma_vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
         return chroma_vector_store
     elif type == "es":
@@ -38,7 +46,7 @@ def create_vector_store(type=config.DEFAULT_VS_TYPE):
 
         es_vector_store = ElasticsearchStore(
             es_url="http://localhost:9200",
-            index_name="think",
+            index_name=name or "think",
             retrieval_strategy=AsyncDenseVectorStrategy(hybrid=False),
         )
         return es_vector_store
@@ -52,7 +60,11 @@ def create_vector_store(type=config.DEFAULT_VS_TYPE):
         reranker = LinearCombinationReranker(weight=0.9)
 
         lance_vector_store = LanceDBVectorStore(
-            uri=".lancedb", mode="overwrite", query_type="vector", reranker=reranker
+            uri=".lancedb",
+            mode="overwrite",
+            query_type="vector",
+            reranker=reranker,
+            **({"table_name": name} if name else {}),
         )
         return lance_vector_store
     elif type == "simple":
@@ -63,7 +75,26 @@ def create_vector_store(type=config.DEFAULT_VS_TYPE):
         raise ValueError(f"Invalid vector store type: {type}")
 
 
-if config.MindSpark_ENV == "production":
-    VECTOR_STORE = create_vector_store(type="chroma")
-else:
-    VECTOR_STORE = create_vector_store(type="simple")
+def delete_vector_nodes(vector_store, ref_doc_infos, batch_size=config.DOCSTORE_BATCH_SIZE):
+    """Delete the nodes of many documents, in batches of node ids where the store supports it."""
+    from llama_index.core.vector_stores import SimpleVectorStore
+
+    node_ids = [node_id for info in ref_doc_infos.values() for node_id in info.node_ids]
+    if isinstance(vector_store, SimpleVectorStore):
+        # Each call scans all embeddings, so delete everything at once
+        batch_size = max(len(node_ids), 1)
+    try:
+        for i in range(0, len(node_ids), batch_size):
+            vector_store.delete_nodes(node_ids[i : i + batch_size])
+    except NotImplementedError:
+        for ref_doc_id in ref_doc_infos:
+            vector_store.delete(ref_doc_id)
+
+
+@lazy_singleton
+def get_vector_store():
+    if config.MindSpark_ENV == "production":
+        return create_vector_store(type="chroma")
+    else:
+        return create_vector_store(type="simple")
+
@@ -1,11 +1,20 @@
 # Text splitter
 
-from config import DEV_MODE
+from functools import lru_cache
+from config import DEV_MODE, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP, DEFAULT_EMBEDDING_MODEL
 from llama_index.core import Settings
 
+# Text splitter types, including "sentence", "spacy", "token", "chinese" and "chinese_recursive"
+DEFAULT_SPLITTER_TYPE = "sentence" if DEV_MODE else "spacy"
 
-def create_text_splitter(chunk_size=2048, chunk_overlap=512):
-    if DEV_MODE:
+
+def create_text_splitter(
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    chunk_overlap=DEFAULT_CHUNK_OVERLAP,
+    type=DEFAULT_SPLITTER_TYPE,
+    embedding_model=DEFAULT_EMBEDDING_MODEL,
+):
+    if type == "sentence":
         # Development environment
         # SentenceSplitter
         from llama_index.core.node_parser import SentenceSplitter
@@ -17,24 +26,58 @@ def create_text_splitter(chunk_size=2048, chunk_overlap=512):
 
         return sentence_splitter
 
-    else:
+    elif type == "spacy":
         # Production environment
-        # SpacyTextSplitter
+        # SpacySentenceSplitter, batches documents through one shared spaCy pipeline
         # https://zhuanlan.zhihu.com/p/638827267
         # pip install spacy
         # spacy download zh_core_web_sm
-        from langchain.text_splitter import SpacyTextSplitter
-        from llama_index.core.node_parser import LangchainNodeParser
+        from server.splitters import SpacySentenceSplitter
 
-        spacy_text_splitter = LangchainNodeParser(
-            SpacyTextSplitter(
-                pipeline="zh_core_web_sm",
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-            )
+        spacy_text_splitter = SpacySentenceSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
         )
 
         return spacy_text_splitter
 
+    elif type == "token":
+        # Chunk length counted in tokens of the selected embedding model, capped at its window
+        from server.splitters.token_text_splitter import create_token_text_splitter
+
+        return create_token_text_splitter(chunk_size, chunk_overlap, embedding_model)
+
+    elif type in ("chinese", "chinese_recursive"):
+        # LangChain splitters from server/splitters, chunk_size counts characters, not tokens
+        # https://docs.llamaindex.ai/en/stable/api_reference/node_parsers/langchain/
+        from llama_index.core.node_parser import LangchainNodeParser
+        from server.splitters import ChineseRecursiveTextSplitter, ChineseTextSplitter
+
+        if type == "chinese":
+            # One node per sentence, sentences longer than chunk_size are split further
+            lc_splitter = ChineseTextSplitter(
+                sentence_size=chunk_size, chunk_size=chunk_size, chunk_overlap=chunk_overlap
+            )
+        else:
+            lc_splitter = ChineseRecursiveTextSplitter(
+                chunk_size=chunk_size, chunk_overlap=chunk_overlap
+            )
+        return LangchainNodeParser(lc_splitter)
+    else:
+        raise ValueError(f"Invalid text splitter type: {type}")
+
+
+# Splitters hold no per-call state, so one instance per configuration is shared
+# by all sessions instead of mutating the global Settings on every request.
+# The embedding model is part of the key, "token" splitters measure chunks with its tokenizer
+@lru_cache(maxsize=32)
+def get_text_splitter(
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    chunk_overlap=DEFAULT_CHUNK_OVERLAP,
+    type=DEFAULT_SPLITTER_TYPE,
+    embedding_model=DEFAULT_EMBEDDING_MODEL,
+):
+    return create_text_splitter(chunk_size, chunk_overlap, type, embedding_model)
+
 
-Settings.text_splitter = create_text_splitter()
+Settings.text_splitter = get_text_splitter()
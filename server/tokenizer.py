@@ -0,0 +1,187 @@
+# Chinese tokenization for BM25
+# https://github.com/fxsjy/jieba
+# jieba loads its dictionary lazily on first use (about a second), init_jieba does it
+# up front and adds user dictionaries for domain terms. Chunk tokens are computed once
+# at ingestion time by BM25TokenExtractor and stored in node metadata.
+# ChineseAnalyzer normalizes and filters the tokens, so BM25 postings and query scoring
+# skip punctuation and function words like 的/了/是.
+
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import FrozenSet, List, Optional, Sequence
+from llama_index.core.schema import BaseNode, MetadataMode, TransformComponent
+from config import (
+    JIEBA_USER_DICTS,
+    JIEBA_WORKERS,
+    BM25_USE_STOPWORDS,
+    BM25_STOPWORDS_FILES,
+    BM25_LOWERCASE,
+    BM25_NORMALIZE_WIDTH,
+    BM25_STRIP_PUNCTUATION,
+)
+
+# Metadata key holding the space separated tokens of a node
+BM25_TOKENS_KEY = "bm25_tokens"
+
+# Below this many texts a process pool costs more than it saves
+PARALLEL_MIN_TEXTS = 2000
+
+# Common Chinese function words and English stopwords
+DEFAULT_STOPWORDS = frozenset(
+    """
+    的 地 得 了 着 过 是 在 和 与 及 或 而 且 也 就 都 还 又 并 但 却 则 即 便
+    吗 呢 吧 啊 呀 嘛 哦 之 其 这 那 此 该 各 每 某 有 为 以 于 对 把 被 让 给
+    从 到 由 向 往 自 将 等 个 些 么 什么 怎么 如何 哪 哪些 我 你 他 她 它 我们
+    你们 他们 她们 它们 自己 一个 一种 一些 这个 那个 这些 那些 可以 因为 所以
+    如果 虽然 但是 而且 或者 以及 并且 然后 还是 不是 就是 只是 已经 通过 进行
+    a an and are as at be by for from has have in is it its of on or that the
+    this to was were will with
+    """.split()
+)
+
+# Full-width ASCII variants (Ａ１！) and the ideographic space map to their half-width form
+FULL_WIDTH_TABLE = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+FULL_WIDTH_TABLE[0x3000] = 0x20
+
+PUNCTUATION_TOKEN_RE = re.compile(r"[\W_]+")
+
+_jieba_lock = threading.Lock()
+_jieba_ready = False
+
+
+def init_jieba():
+    """Load the jieba dictionary and user dictionaries, once per process."""
+    global _jieba_ready
+    if _jieba_ready:
+        return
+    with _jieba_lock:
+        if _jieba_ready:
+            return
+        import jieba
+
+        jieba.initialize()
+        for path in JIEBA_USER_DICTS:
+            if os.path.exists(path):
+                jieba.load_userdict(path)
+                print(f"Loaded jieba user dictionary: {path}")
+            else:
+                print(f"jieba user dictionary not found: {path}")
+        _jieba_ready = True
+
+
+def chinese_tokenizer(text: str) -> List[str]:
+    import jieba
+
+    init_jieba()
+    return [token for token in jieba.lcut(text) if not token.isspace()]
+
+
+class ChineseAnalyzer:
+    """jieba tokenization followed by token normalization and filtering."""
+
+    def __init__(
+        self,
+        stopwords: FrozenSet[str] = DEFAULT_STOPWORDS,
+        lowercase: bool = True,
+        normalize_width: bool = True,
+        strip_punctuation: bool = True,
+    ):
+        self.stopwords = stopwords
+        self.lowercase = lowercase
+        self.normalize_width = normalize_width
+        self.strip_punctuation = strip_punctuation
+
+    def normalize(self, text: str) -> str:
+        if self.normalize_width:
+            text = text.translate(FULL_WIDTH_TABLE)
+        if self.lowercase:
+            text = text.lower()
+        return text
+
+    def _keep(self, token: str) -> bool:
+        if not token or token.isspace() or token in self.stopwords:
+            return False
+        return not (self.strip_punctuation and PUNCTUATION_TOKEN_RE.fullmatch(token))
+
+    def filter_tokens(self, tokens: Sequence[str]) -> List[str]:
+        """Apply normalization and filtering to tokens produced earlier, e.g. stored ones."""
+        normalized = (self.normalize(token) for token in tokens)
+        return [token for token in normalized if self._keep(token)]
+
+    def __call__(self, text: str) -> List[str]:
+        return [token for token in chinese_tokenizer(self.normalize(text)) if self._keep(token)]
+
+
+def create_analyzer() -> ChineseAnalyzer:
+    """Build the BM25 analyzer from the BM25_* settings in config.py."""
+    stopwords = set(DEFAULT_STOPWORDS) if BM25_USE_STOPWORDS else set()
+    for path in BM25_STOPWORDS_FILES:
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                stopwords.update(line.strip() for line in f if line.strip())
+        else:
+            print(f"Stopwords file not found: {path}")
+    return ChineseAnalyzer(
+        stopwords=frozenset(stopwords),
+        lowercase=BM25_LOWERCASE,
+        normalize_width=BM25_NORMALIZE_WIDTH,
+        strip_punctuation=BM25_STRIP_PUNCTUATION,
+    )
+
+
+BM25_ANALYZER = create_analyzer()
+
+
+def tokenize_corpus(
+    texts: Sequence[str],
+    analyzer: Optional[ChineseAnalyzer] = None,
+    workers: int = JIEBA_WORKERS,
+) -> List[List[str]]:
+    """Analyze many texts, in a process pool for large corpora."""
+    analyzer = analyzer or BM25_ANALYZER
+    if workers <= 1 or len(texts) < PARALLEL_MIN_TEXTS:
+        return [analyzer(text) for text in texts]
+    chunksize = max(1, len(texts) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_jieba) as executor:
+        return list(executor.map(analyzer, texts, chunksize=chunksize))
+
+
+def get_corpus_tokens(
+    nodes: Sequence[BaseNode], analyzer: Optional[ChineseAnalyzer] = None
+) -> List[List[str]]:
+    """Tokens stored at ingestion time, nodes ingested before that are tokenized now."""
+    analyzer = analyzer or BM25_ANALYZER
+    tokens: List[List[str]] = [None] * len(nodes)
+    missing = []
+    for i, node in enumerate(nodes):
+        stored = node.metadata.get(BM25_TOKENS_KEY)
+        if stored is not None:
+            # Cheap, and keeps stored tokens in line with the current analyzer settings
+            tokens[i] = analyzer.filter_tokens(stored.split(" ")) if stored else []
+        else:
+            missing.append(i)
+    if missing:
+        texts = [nodes[i].get_content(metadata_mode=MetadataMode.EMBED) for i in missing]
+        for i, node_tokens in zip(missing, tokenize_corpus(texts, analyzer)):
+            tokens[i] = node_tokens
+    return tokens
+
+
+class BM25TokenExtractor(TransformComponent):
+    """Store the BM25 tokens of each node in its metadata, hidden from the embedding model and LLM."""
+
+    @classmethod
+    def class_name(cls) -> str:  # the ingestion cache key, see ChineseTitleExtractor
+        return "BM25TokenExtractor"
+
+    def __call__(self, nodes, **kwargs):
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        for node, node_tokens in zip(nodes, tokenize_corpus(texts)):
+            node.metadata[BM25_TOKENS_KEY] = " ".join(node_tokens)
+            if BM25_TOKENS_KEY not in node.excluded_embed_metadata_keys:
+                node.excluded_embed_metadata_keys.append(BM25_TOKENS_KEY)
+            if BM25_TOKENS_KEY not in node.excluded_llm_metadata_keys:
+                node.excluded_llm_metadata_keys.append(BM25_TOKENS_KEY)
+        return nodes